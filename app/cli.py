@@ -0,0 +1,172 @@
+"""
+Maintenance jobs, run from the project root:
+
+    python -m app.cli upgrade-schema
+    python -m app.cli reconcile-counters
+    python -m app.cli rebuild-search-index
+    python -m app.cli import-books catalogue.csv [--format csv|jsonl]
+    python -m app.cli export audit --format csv --gzip -o audit.csv.gz
+    python -m app.cli expire-schedules [--hold-hours 8]
+    python -m app.cli accrue-fines
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from app import crud, imports, services
+from app.schedules import ScheduleExpirer
+from app.core.database import AsyncSessionLocal, dispose_engines
+
+logger = logging.getLogger(__name__)
+
+
+async def upgrade_schema(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        added = await services.upgrade_schema_service(session)
+    print(f"Upgraded schema, added {', '.join(added) or 'nothing'}")
+
+
+async def reconcile_counters(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        books = await services.reconcile_copy_counters_service(session)
+    print(f"Reconciled copy counters of {books} books")
+
+
+async def rebuild_search_index(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        await crud.rebuild_book_search_index(session)
+        await session.commit()
+    print("Rebuilt book search index")
+
+
+async def accrue_fines(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        totals = await services.accrue_loan_fines_service(session)
+    print(
+        f"Accrued {totals['fines']} in fines on {totals['loans']} overdue loans "
+        f"of {totals['users']} users"
+    )
+
+
+async def import_books(args: argparse.Namespace):
+    fmt = args.format or imports.format_from_filename(args.path)
+    if fmt is None:
+        raise SystemExit("Unknown import format, pass --format csv or --format jsonl")
+    job = imports.ImportJob(source=args.path)
+    # import_file closes the file
+    file = await asyncio.to_thread(open, args.path, "rb")
+    await imports.import_file(AsyncSessionLocal, job, file, fmt)
+    print(
+        f"Import {job.status}: {job.rows_read} rows read, {job.books_imported} books, "
+        f"{job.copies_created} copies, {job.rows_failed} rows failed"
+    )
+    for error in job.errors:
+        print(f"  line {error['line']}: {error['error']}")
+
+
+async def export_table(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        try:
+            chunks = services.export_chunks(
+                session,
+                args.table,
+                args.format,
+                args.gzip,
+                args.cursor,
+                args.since,
+                args.until,
+            )
+        except ValueError as e:
+            raise SystemExit(str(e))
+        output = nullcontext(sys.stdout.buffer)
+        if args.output:
+            output = await asyncio.to_thread(open, args.output, "wb")
+        with output as file:
+            async for chunk in chunks:
+                await asyncio.to_thread(file.write, chunk)
+
+
+async def expire_schedules(args: argparse.Namespace):
+    expirer = ScheduleExpirer()
+    if args.hold_hours is not None:
+        expirer.hold_hours = args.hold_hours
+    now = datetime.now(timezone.utc)
+    expired = await expirer.run_once(now)
+    print(
+        f"Expired {expired} book schedules made before "
+        f"{expirer.cutoff(now):%Y-%m-%d %H:%M} UTC, "
+        f"released {expirer.stats['released']} copies"
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser(
+        "upgrade-schema", help="add columns and indexes missing from older databases"
+    ).set_defaults(handler=upgrade_schema)
+
+    commands.add_parser(
+        "reconcile-counters", help="recompute per-ISBN copy counters from book_copies"
+    ).set_defaults(handler=reconcile_counters)
+
+    commands.add_parser(
+        "rebuild-search-index",
+        help="rebuild the full-text index of book titles/authors",
+    ).set_defaults(handler=rebuild_search_index)
+
+    commands.add_parser(
+        "accrue-fines", help="charge fines accrued on overdue loans, run nightly"
+    ).set_defaults(handler=accrue_fines)
+
+    importer = commands.add_parser(
+        "import-books", help="import books and copies from a CSV or JSONL file"
+    )
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=imports.IMPORT_FORMATS)
+    importer.set_defaults(handler=import_books)
+
+    exporter = commands.add_parser(
+        "export", help="stream a full dump of loans, book_copies or audit"
+    )
+    exporter.add_argument("table", choices=list(crud.EXPORT_TABLES))
+    exporter.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    exporter.add_argument("--gzip", action="store_true")
+    exporter.add_argument("--cursor", type=int, default=0, help="resume after this id")
+    exporter.add_argument("--since", type=datetime.fromisoformat)
+    exporter.add_argument("--until", type=datetime.fromisoformat)
+    exporter.add_argument("-o", "--output", help="file to write, stdout by default")
+    exporter.set_defaults(handler=export_table)
+
+    expirer = commands.add_parser(
+        "expire-schedules",
+        help="expire unconsumed book schedules and release their copies",
+    )
+    expirer.add_argument(
+        "--hold-hours", type=float, help="hold window, settings by default"
+    )
+    expirer.set_defaults(handler=expire_schedules)
+
+    return parser
+
+
+async def run(args: argparse.Namespace):
+    try:
+        await args.handler(args)
+    finally:
+        await dispose_engines()
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
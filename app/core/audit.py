@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional
+
+from app.core.config import Settings
+from app.core.database import AsyncSessionLocal
+from app.services import create_audits_service
+
+logger = logging.getLogger(__name__)
+
+settings = Settings()
+
+_STOP = object()
+
+
+class AuditWriter:
+    """
+    In-process audit pipeline. Requests push entries onto a bounded queue and a
+    single background flusher bulk-inserts them, either when `batch_size`
+    entries are buffered or `flush_interval` seconds have passed.
+
+    When the queue is full, `submit` waits up to `enqueue_timeout` for room
+    (backpressure) and then applies `overflow_policy`: 'drop' discards the
+    entry, 'spill' appends it as a JSON line to `spill_path`.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_queue: int = settings.audit_queue_size,
+        batch_size: int = settings.audit_batch_size,
+        flush_interval: float = settings.audit_flush_interval,
+        enqueue_timeout: float = settings.audit_enqueue_timeout,
+        overflow_policy: str = settings.audit_overflow_policy,
+        spill_path: str = settings.audit_spill_path,
+    ):
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.stats: Dict[str, int] = {
+            "queued": 0,
+            "flushed": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "failed": 0,
+        }
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    async def start(self):
+        if self.running:
+            return
+        # the queue is created here so it binds to the running event loop
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run(), name="audit-writer")
+        logger.info("Audit writer started")
+
+    async def stop(self):
+        """
+        Stops the flusher after everything already queued has been written.
+        """
+        if not self.running:
+            return
+        # the sentinel may wait behind a full queue, the flusher is still draining it
+        await self.queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info(f"Audit writer stopped: {self.stats}")
+
+    async def submit(self, entry: dict) -> bool:
+        if not self.running:
+            await self._overflow([entry])
+            return False
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(entry), self.enqueue_timeout)
+            except TimeoutError:
+                await self._overflow([entry])
+                return False
+        self.stats["queued"] += 1
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # entries submitted while stopping
+        leftovers = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not _STOP:
+                leftovers.append(item)
+        for i in range(0, len(leftovers), self.batch_size):
+            await self._flush(leftovers[i : i + self.batch_size])
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            async with self.session_factory() as session:
+                await create_audits_service(session, batch)
+        except Exception as e:
+            logger.error(f"Error flushing {len(batch)} audit entries: {e}")
+            self.stats["failed"] += len(batch)
+            await self._overflow(batch)
+        else:
+            self.stats["flushed"] += len(batch)
+
+    async def _overflow(self, entries: List[dict]):
+        if self.overflow_policy == "spill":
+            try:
+                # overflow happens under peak load, the loop must not wait on disk
+                await asyncio.to_thread(self._spill, entries)
+            except OSError as e:
+                logger.error(f"Error spilling audit entries to {self.spill_path}: {e}")
+            else:
+                self.stats["spilled"] += len(entries)
+                return
+        self.stats["dropped"] += len(entries)
+
+    def _spill(self, entries: List[dict]):
+        lines = "".join(
+            json.dumps(_serializable(entry), default=str) + "\n" for entry in entries
+        )
+        # one write per batch, so batches spilled concurrently do not interleave
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def _serializable(entry: dict) -> dict:
+    data = dict(entry)
+    event = data.get("event")
+    if hasattr(event, "name"):
+        data["event"] = event.name
+    return data
+
+
+audit_writer = AuditWriter()
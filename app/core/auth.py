@@ -1,4 +1,9 @@
-from fastapi import Depends, HTTPException, status
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from jose.exceptions import JWTError, ExpiredSignatureError
@@ -10,6 +15,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from app import crud
 from app.utils import generate_admin_id
 from app.core.database import get_session
+from app.core.principals import Principal, principal_cache
 from app.models import User
 from passlib.context import CryptContext
 
@@ -40,6 +46,39 @@ def hash_password(password: str):
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
+_hash_executor: Optional[Executor] = None
+
+def get_hash_executor():
+    '''
+    Pool that runs password hashing off the event loop. Its size is the
+    hashing concurrency limit, further calls wait for a free worker.
+    '''
+    global _hash_executor
+    if _hash_executor is None:
+        if settings.hash_executor == 'process':
+            _hash_executor = ProcessPoolExecutor(max_workers=settings.hash_workers)
+        else:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=settings.hash_workers, thread_name_prefix='password-hash'
+            )
+    return _hash_executor
+
+def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+        _hash_executor = None
+
+async def hash_password_async(password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_executor(), hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_hash_executor(), verify_password, plain_password, hashed_password
+    )
+
 def create_access_token(data: dict, user: User, expires_delta: Optional[timedelta] = None):
     role = None
     to_encode = data.copy()
@@ -57,10 +96,72 @@ def create_access_token(data: dict, user: User, expires_delta: Optional[timedelt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, JWT_ALGORITHM)
     return encoded_jwt
 
-def decode_token(token: str, verify_exp: bool=True):
-    payload = jwt.decode(token, SECRET_KEY, 
-                         algorithms=[JWT_ALGORITHM], options={'verify_exp': verify_exp})
+class TokenCache:
+    '''
+    Bounded LRU of tokens whose signature has already been verified, keyed by
+    the sha256 of the token so raw tokens are not kept in memory.
+    Expiry is still checked on every lookup.
+    '''
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(token: str):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, key: str):
+        payload = self._entries.get(key)
+        if payload is None:
+            self.stats['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return payload
+
+    def put(self, key: str, payload: dict):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = payload
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+token_cache = TokenCache(settings.token_cache_size)
+
+def token_is_expired(payload: dict):
+    exp = payload.get('exp')
+    return exp is not None and exp <= time.time()
+
+def verify_token(token: str, verify_exp: bool=True, scope: Optional[dict]=None):
+    '''
+    Single entry point for token verification. The verified payload is kept in
+    `token_cache` and, when `scope` is given, stashed on the request state so
+    the audit middleware and the auth dependencies share one decode.
+    '''
+    state = scope.setdefault('state', {}) if scope is not None else {}
+    verified = state.get('verified_token')
+    if verified and verified[0] == token:
+        payload = verified[1]
+    else:
+        key = token_cache.key(token)
+        payload = token_cache.get(key)
+        if payload is None:
+            # the signature is always verified, expiry is checked below
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM],
+                                 options={'verify_exp': False})
+            token_cache.put(key, payload)
+        state['verified_token'] = (token, payload)
+    if verify_exp and token_is_expired(payload):
+        raise ExpiredSignatureError('Signature has expired.')
     return payload
+
+def decode_token(token: str, verify_exp: bool=True):
+    return verify_token(token, verify_exp)
     
 async def authenticate_user(
         credentials: dict,
@@ -74,7 +175,7 @@ async def authenticate_user(
         
         user = await crud.get_user_by_email(db, user_email)
         print(user)
-        if not user or not verify_password(user_password, user.password):
+        if not user or not await verify_password_async(user_password, user.password):
             exceptions.append(credentials_exception)
     except Exception as e:
         print(f'Error: {e}')
@@ -82,21 +183,27 @@ async def authenticate_user(
         return user, exceptions
 
 async def get_current_user(
+        request: Request,
         token: str=Depends(oauth2_scheme), 
+        # not the replica: a lagging read would be cached past its invalidation
         db: AsyncSession=Depends(get_session)
         ):
     exceptions = []
     user = None
     role = ''
     try:
-        payload = decode_token(token)
+        payload = verify_token(token, scope=request.scope)
         email = payload.get('sub')
         #user_uid = payload.get('user_uid')
         role = payload.get('role')
         if not email:
             exceptions.append(token_expire_exception)
         else:
-            user = await crud.get_user_by_email(db, email)
+            user = principal_cache.get(email)
+            if user is None:
+                db_user = await crud.get_user_by_email(db, email)
+                if db_user:
+                    user = principal_cache.put(Principal.from_user(db_user))
         if not user:
             exceptions.append(credentials_exception)
     except ExpiredSignatureError:
@@ -155,7 +262,7 @@ async def create_superuser(
             data = {
                 'full_name': full_name,
                 'user_uid': generate_admin_id(),
-                'password': hash_password(password),
+                'password': await hash_password_async(password),
                 'email': email,
                 'is_staff': True,
                 'is_superuser': True
@@ -178,7 +285,7 @@ async def create_mock_superuser(
     try:
         data = {
             'full_name': full_name,
-            'password': hash_password(password),
+            'password': await hash_password_async(password),
             'email': email,
             'is_staff': True,
             'is_superuser': True
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -7,12 +9,28 @@ class Settings(BaseSettings):
     admin_name: str = ''
 
     database_url: str = ''
+    # optional read replica, read-only routes and auth lookups use it
+    replica_database_url: str = ''
     test_database_url: str = ''
 
+    db_echo: bool = False
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_warmup: int = 5
+    db_statement_cache_size: int = 100
+
     hash_algorithm: str = ''
+    hash_executor: Literal['thread', 'process'] = 'thread'
+    hash_workers: int = 4
     jwt_algorithm: str = ''
     secret_key: str = ''
     access_token_expire_minutes: int = 15
+    token_cache_size: int = 4096
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60.0
 
     test_mode: bool = False
 
@@ -24,4 +42,24 @@ class Settings(BaseSettings):
     mock_user_password: str = ''
     mock_user_name: str = ''
 
+    audit_queue_size: int = 10000
+    audit_batch_size: int = 200
+    audit_flush_interval: float = 1.0
+    audit_enqueue_timeout: float = 0.05
+    audit_overflow_policy: Literal['drop', 'spill'] = 'drop'
+    audit_spill_path: str = 'audit_spill.jsonl'
+    audit_form_max_bytes: int = 4096
+
+    bulk_insert_chunk_size: int = 5000
+    bulk_update_chunk_size: int = 5000
+    import_batch_size: int = 500
+    export_batch_size: int = 1000
+
+    schedule_hold_hours: float = 8.0
+    schedule_expiry_interval: float = 300.0
+    schedule_expiry_batch_size: int = 1000
+    fine_accrual_batch_size: int = 1000
+
+    metrics_enabled: bool = True
+
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
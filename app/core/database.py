@@ -1,25 +1,197 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import declarative_base
+import asyncio
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import Engine, event, exc, make_url, text
+from sqlalchemy.ext.asyncio import (
+    create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+)
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import Settings
 
 settings = Settings()
 
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    '''
+    Queue pool that also records how long checkouts waited for a connection,
+    reported with the pool status by /health/ready.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = {
+            'checkouts': 0,
+            'wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'timeouts': 0,
+        }
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats['timeouts'] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_stats['checkouts'] += 1
+            self.wait_stats['wait_seconds'] += waited
+            self.wait_stats['max_wait_seconds'] = max(
+                self.wait_stats['max_wait_seconds'], waited
+            )
+
+
+def engine_options(url: str, settings: Settings = settings) -> dict:
+    '''create_async_engine keyword arguments for `url` from the DB_* settings'''
+    options = {'echo': settings.db_echo, 'future': True}
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # in-memory databases live on a single static connection
+        return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    if url.get_driver_name() == 'asyncpg':
+        # 0 disables both caches, needed behind pgbouncer in transaction mode
+        options['connect_args'] = {
+            'statement_cache_size': settings.db_statement_cache_size,
+            'prepared_statement_cache_size': settings.db_statement_cache_size,
+        }
+    return options
+
+
+# set once the current request (or task) has written to the primary, reads
+# after that point skip the replica so they see their own writes
+_wrote_primary: ContextVar[bool] = ContextVar('wrote_primary', default=False)
+
+def read_from_primary():
+    '''Sends the remaining reads of the current request to the primary'''
+    _wrote_primary.set(True)
+
+
+class PrimarySession(Session):
+    '''Session of the primary database, flags the context once it writes'''
+
+
+@event.listens_for(PrimarySession, 'after_flush')
+def _after_flush(session, flush_context):
+    read_from_primary()
+
+
+@event.listens_for(PrimarySession, 'do_orm_execute')
+def _after_dml(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        read_from_primary()
+
+
+class RoutingSession(Session):
+    '''
+    Read-only session: queries run on the replica unless this request already
+    wrote to the primary. Anything that writes (flushes, DML) still goes to
+    the primary.
+    '''
+
+    def __init__(self, primary: Engine, replica: Engine, **kwargs):
+        super().__init__(**kwargs)
+        self.primary = primary
+        self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or getattr(clause, 'is_dml', False):
+            read_from_primary()
+            return self.primary
+        if _wrote_primary.get():
+            return self.primary
+        return self.replica
+
+
+def read_sessionmaker(primary: AsyncEngine, replica: AsyncEngine):
+    return async_sessionmaker(
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        primary=primary.sync_engine,
+        replica=replica.sync_engine,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
 engine = create_async_engine(
-    settings.database_url,
-    echo=True,
-    future=True
+    settings.database_url, **engine_options(settings.database_url)
 )
 
+# without a replica, reads share the primary engine
+replica_engine = engine
+if settings.replica_database_url:
+    replica_engine = create_async_engine(
+        settings.replica_database_url, **engine_options(settings.replica_database_url)
+    )
+
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
+    sync_session_class=PrimarySession,
     autocommit=False,
     autoflush=False,
     expire_on_commit=False
 )
 
+ReadSessionLocal = read_sessionmaker(engine, replica_engine)
+
 async def get_session():
     async with AsyncSessionLocal() as session:
         yield session
 
-Base = declarative_base()
\ No newline at end of file
+async def get_read_session():
+    # read-only routes and auth lookups, see RoutingSession
+    async with ReadSessionLocal() as session:
+        yield session
+
+def get_session_factory():
+    # for work that outlives the request, e.g. background imports
+    return AsyncSessionLocal
+
+def get_engine():
+    return engine
+
+async def dispose_engines():
+    # the replica has a pool of its own when it is a separate database
+    await engine.dispose()
+    if replica_engine is not engine:
+        await replica_engine.dispose()
+
+async def warm_up_pool(engine: AsyncEngine, connections: int = settings.db_pool_warmup):
+    '''
+    Opens `connections` pooled connections up front so the first requests
+    do not pay for them
+    '''
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+    # concurrently, so each ping holds a connection of its own
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+def pool_status(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if hasattr(pool, 'checkedout'):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        status.update(pool.wait_stats)
+    return status
+
+Base = declarative_base()
@@ -0,0 +1,227 @@
+import bisect
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Engine, event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# prometheus client defaults, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values per label set"""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, List] = {}
+
+    def observe(self, labels: Labels, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            # one count per bucket plus +Inf, then the sum
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self, name: str):
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += count
+                yield f"{name}_bucket", (*labels, ("le", str(bound))), cumulative
+            yield f"{name}_sum", labels, series[-1]
+            yield f"{name}_count", labels, cumulative
+
+
+class Metrics:
+    """
+    In-process request and database metrics, rendered in the Prometheus text
+    format by /metrics. Counters only ever grow for the life of the process.
+    """
+
+    def __init__(self):
+        self.requests: Dict[Labels, int] = defaultdict(int)
+        self.request_latency = Histogram(REQUEST_BUCKETS)
+        self.in_flight = 0
+        self.queries: Dict[Labels, int] = defaultdict(int)
+        self.query_errors: Dict[Labels, int] = defaultdict(int)
+        self.query_latency = Histogram(QUERY_BUCKETS)
+
+    def observe_request(
+        self, route: str, method: str, status_code: int, elapsed: float
+    ):
+        labels = (("route", route), ("method", method))
+        self.requests[(*labels, ("status", str(status_code)))] += 1
+        self.request_latency.observe(labels, elapsed)
+
+    def observe_query(self, db: str, statement: str, elapsed: float):
+        labels = (("db", db), ("statement", statement_kind(statement)))
+        self.queries[labels] += 1
+        self.query_latency.observe(labels, elapsed)
+
+    def observe_query_error(self, db: str, statement: str):
+        self.query_errors[(("db", db), ("statement", statement_kind(statement)))] += 1
+
+    def render(self, extra: Iterable[Tuple[str, str, str, Labels, float]] = ()) -> str:
+        """
+        The exposition text of every metric, `extra` adds (name, type, help,
+        labels, value) samples read at scrape time, e.g. pool utilisation.
+        """
+        lines: List[str] = []
+        _family(
+            lines,
+            "http_requests_total",
+            "counter",
+            "HTTP requests by route, method and status",
+            (("http_requests_total", labels, n) for labels, n in self.requests.items()),
+        )
+        _family(
+            lines,
+            "http_request_duration_seconds",
+            "histogram",
+            "HTTP request latency by route and method",
+            self.request_latency.samples("http_request_duration_seconds"),
+        )
+        _family(
+            lines,
+            "http_requests_in_flight",
+            "gauge",
+            "HTTP requests being served",
+            [("http_requests_in_flight", (), self.in_flight)],
+        )
+        _family(
+            lines,
+            "db_queries_total",
+            "counter",
+            "SQL statements executed by database and statement kind",
+            (("db_queries_total", labels, n) for labels, n in self.queries.items()),
+        )
+        _family(
+            lines,
+            "db_query_errors_total",
+            "counter",
+            "SQL statements that raised, by database and statement kind",
+            (
+                ("db_query_errors_total", labels, n)
+                for labels, n in self.query_errors.items()
+            ),
+        )
+        _family(
+            lines,
+            "db_query_duration_seconds",
+            "histogram",
+            "SQL statement latency by database and statement kind",
+            self.query_latency.samples("db_query_duration_seconds"),
+        )
+        families: Dict[str, Tuple[str, str, List]] = {}
+        for name, kind, help_text, labels, value in extra:
+            family = families.setdefault(name, (kind, help_text, []))
+            family[2].append((name, labels, value))
+        for name, (kind, help_text, samples) in families.items():
+            _family(lines, name, kind, help_text, samples)
+        return "\n".join(lines) + "\n"
+
+
+def statement_kind(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+        return keyword.lower()
+    return "other"
+
+
+def _family(lines: List[str], name: str, kind: str, help_text: str, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{_labels(labels)} {_value(value)}")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _value(value) -> str:
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine: Engine, db: str, registry: Metrics = metrics):
+    """Times every statement `engine` sends with cursor execute events"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info.get("query_started", [])
+        if started:
+            registry.observe_query(db, statement, time.perf_counter() - started.pop())
+
+    def handle_error(context):
+        # a statement that raises never reaches after_cursor_execute, its
+        # start time would otherwise stay on the pooled connection
+        conn = context.connection
+        if conn is None or context.statement is None:
+            return
+        started = conn.info.get("query_started", [])
+        if started:
+            started.pop()
+            registry.observe_query_error(db, context.statement)
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware counting requests and timing them by route template
+    (not raw path, so path parameters do not explode the label space).
+    """
+
+    def __init__(self, app: ASGIApp, registry: Optional[Metrics] = None):
+        self.app = app
+        self.registry = registry or metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.registry.in_flight -= 1
+            # set by the router once the request has been matched
+            route = getattr(scope.get("route", None), "path", "unmatched")
+            self.registry.observe_request(
+                route, scope["method"], status_code, time.perf_counter() - start_time
+            )
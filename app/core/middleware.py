@@ -2,27 +2,25 @@ import json
 import time
 from datetime import datetime
 from logging import getLogger
-from typing import Any, Awaitable, Callable, Dict
+from typing import Any, Dict, Iterable, Optional, Tuple
 from urllib.parse import parse_qs
 
-from fastapi import BackgroundTasks, Request
+from fastapi import Request
+from fastapi.routing import APIRoute
 from jose.exceptions import JWTError
-from jwt.exceptions import InvalidSignatureError
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request as StarletteRequest
-from starlette.responses import Response
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from app.core.auth import decode_token
-from app.core.database import AsyncSessionLocal
+from app.core.audit import audit_writer
+from app.core.auth import verify_token
+from app.core.config import Settings
 from app.models import Event, User
-from app.services import create_audit_service
 
 logger = getLogger(__name__)
 
+settings = Settings()
 
-async def _bg_audit(entry: dict):
-    async with AsyncSessionLocal() as session:
-        await create_audit_service(session, entry)
+BODYLESS_METHODS = {"GET", "HEAD", "OPTIONS"}
 
 
 def actor_email(actor, claims):
@@ -64,9 +62,9 @@ def actor_id(actor, claims):
     return -1
 
 
-def get_actor_claims(token: str):
+def get_actor_claims(token: str, scope: Optional[Scope] = None):
     try:
-        payload = decode_token(token, False)
+        payload = verify_token(token, False, scope)
         email = payload.get("sub")
         user_uid = payload.get("user_uid")
         is_staff = payload.get("is_staff")
@@ -75,7 +73,7 @@ def get_actor_claims(token: str):
             "user_uid": user_uid,
             "is_staff": is_staff,
         }
-    except (InvalidSignatureError, JWTError) as e:
+    except JWTError as e:
         logger.error(f"Token decode error: {e}")
         return None
     except Exception as e:
@@ -83,153 +81,200 @@ def get_actor_claims(token: str):
         return None
 
 
-async def extract_form_data(request: Request) -> Dict[str, Any]:
+class FormCapture:
     """
-    Safely extract form fields (urlencoded or multipart) from `request`
-    without preventing downstream code (FastAPI/Dependencies) from reading
-    the body. Returns a dict where repeated fields become lists and file
-    uploads are returned as UploadFile instances.
+    Keeps a copy of the first `max_bytes` of an urlencoded body as it streams
+    past, so the audit entry can record the submitted fields without holding
+    or re-parsing the whole request.
     """
-    # snapshot body
-    body = await request.body()
 
-    # restore mechanism so downstream can read the same body again
-    async def _receive() -> dict:
-        return {"type": "http.request", "body": body, "more_body": False}
-
-    request._receive = _receive
-
-    content_type = (request.headers.get("content-type") or "").lower()
-
-    # application/x-www-form-urlencoded
-    if "application/x-www-form-urlencoded" in content_type:
-        decoded = body.decode("utf-8") if body else ""
-        parsed = parse_qs(decoded, keep_blank_values=True)
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+        self.truncated = False
+
+    def feed(self, chunk: bytes):
+        if self.truncated or not chunk:
+            return
+        room = self.max_bytes - len(self.buffer)
+        if len(chunk) > room:
+            self.buffer += chunk[:room]
+            self.truncated = True
+        else:
+            self.buffer += chunk
+
+    def fields(self) -> Dict[str, Any]:
+        body = bytes(self.buffer)
+        if self.truncated:
+            # the last pair may have been cut in half
+            body = body.rpartition(b"&")[0]
+        parsed = parse_qs(body.decode("utf-8", "replace"), keep_blank_values=True)
         # convert single-item lists to scalars
         data: Dict[str, Any] = {
             k: (v if len(v) > 1 else v[0]) for k, v in parsed.items()
         }
+        data.pop("password", None)
         return data
 
-    # multipart/form-data (files supported) - parse with a temporary Starlette Request
-    if "multipart/form-data" in content_type:
-        # create a temporary Starlette request that reads from our saved body
-        temp_scope = dict(request.scope)
-        temp_req = StarletteRequest(temp_scope, _receive)
-        form = await temp_req.form()
-        data: Dict[str, Any] = {}
-        for key, val in form.multi_items():
-            if key not in data:
-                data[key] = val
-            else:
-                if not isinstance(data[key], list):
-                    data[key] = [data[key]]
-                data[key].append(val)
-        return data
 
-    # no form data or unsupported content-type
-    return {}
-
-
-def detect_event_from_request(request: Request) -> Event:
-    path = request.url.path.lower()
-    method = request.method.upper()
-
-    # Book-related
-    if path.startswith("/books/loan-return") and method == "POST":
-        return Event.RETURN_BOOK
-    if path.startswith("/books/loan") and method == "POST":
-        return Event.CHECKOUT
-    if path.startswith("/books/generate-copies") and method == "POST":
-        return Event.CREATE_BK_COPIES
-    if path.startswith("/books/book-schedule") and method == "POST":
-        return Event.SCHEDULE_BOOK
-    if path == "/books" and method == "POST":
-        return Event.CREATE_BOOK
-    if path.startswith("/books/") and method == "PUT":
-        return Event.UPDATE_BOOK
-    if path.startswith("/books/update-bk-copies-status") and method == "PATCH":
-        return Event.UPDATE_BOOK_COPIES
-    if path.startswith("/books/fetch") and method == "GET":
-        return Event.FETCH_BOOK
-
-    # User-related
-    if path.startswith("/users/sign-up") and method == "POST":
-        return Event.CREATE_USER
-    if path.startswith("/users/login") and method == "POST":
-        return Event.LOGIN_USER
-    if path.startswith("/users/admin/login") and method == "POST":
-        return Event.LOGIN_ADMIN_USER
-    if path == "/users" and method == "GET":
-        return Event.FETCH_USER
-
-    return Event.UNIDENTIFIED_EVENT
-
-
-class AuditMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
-    ) -> Response:
-        start_time = time.time()
+# audit event of each endpoint, keyed by route name (the endpoint function name)
+ROUTE_EVENTS: Dict[str, Event] = {
+    # books_router
+    "get_all_books": Event.FETCH_BOOKS,
+    "get_book_by_ISBN": Event.FETCH_BOOK,
+    "search_books": Event.SEARCH_BOOKS,
+    "create_book": Event.CREATE_BOOK,
+    "update_book": Event.UPDATE_BOOK,
+    "add_book_copies": Event.CREATE_BK_COPIES,
+    "delete_book": Event.DELETE_BOOK,
+    "return_book_loan": Event.RETURN_BOOK,
+    "bulk_return_book_loans": Event.BULK_RETURN_BOOK,
+    "loan_book": Event.CHECKOUT,
+    "bulk_loan_books": Event.BULK_CHECKOUT,
+    "schedule_book": Event.SCHEDULE_BOOK,
+    "update_bk_copies": Event.UPDATE_BOOK_COPIES,
+    "update_bk_copies_ndjson": Event.UPDATE_BOOK_COPIES,
+    # users_router
+    "get_all_non_staff_users": Event.FETCH_USER,
+    "create_new_staff_user": Event.CREATE_STAFF_USER,
+    "create_new_user": Event.CREATE_USER,
+    "login_for_access_token": Event.LOGIN_USER,
+    "admin_login_for_access_token": Event.LOGIN_ADMIN_USER,
+    # imports_router
+    "import_books": Event.IMPORT_BOOKS,
+    "get_import_job": Event.FETCH_IMPORT,
+    # exports_router
+    "export_table": Event.EXPORT_TABLE,
+}
+
+
+# probes and scrapes, polled too often to be worth an audit entry each
+UNAUDITED_PATHS = {"/health/ready", "/metrics"}
+
+
+def build_event_map(routes: Iterable[BaseRoute]) -> Dict[Tuple[str, str], Event]:
+    """
+    Compiles the registered routes into a `(route template, method) -> Event`
+    map, so classifying a request is a single dict lookup after routing.
+    """
+    event_map: Dict[Tuple[str, str], Event] = {}
+    for route in routes:
+        if not isinstance(route, APIRoute):
+            continue
+        event = ROUTE_EVENTS.get(route.name, Event.UNIDENTIFIED_EVENT)
+        for method in route.methods:
+            event_map[(route.path, method)] = event
+    return event_map
+
+
+def detect_event_from_scope(
+    scope: Scope, event_map: Dict[Tuple[str, str], Event]
+) -> Event:
+    # set by the router once the request has been matched
+    route = scope.get("route", None)
+    if route is None:
+        return Event.UNIDENTIFIED_EVENT
+    return event_map.get(
+        (getattr(route, "path", None), scope["method"]), Event.UNIDENTIFIED_EVENT
+    )
+
+
+class AuditMiddleware:
+    """
+    Pure ASGI audit middleware. The receive stream is passed through untouched;
+    only urlencoded bodies are copied (up to `max_form_bytes`), multipart bodies
+    and files are never captured and bodyless methods skip capture entirely.
+    """
+
+    def __init__(
+        self, app: ASGIApp, max_form_bytes: int = settings.audit_form_max_bytes
+    ):
+        self.app = app
+        self.max_form_bytes = max_form_bytes
+        self.event_map: Optional[Dict[Tuple[str, str], Event]] = None
+
+    def _event_map(self, scope: Scope) -> Dict[Tuple[str, str], Event]:
+        if self.event_map is None:
+            # compiled in lifespan, built here only if lifespan did not run
+            app = scope["app"]
+            event_map = getattr(app.state, "audit_events", None)
+            if event_map is None:
+                event_map = build_event_map(app.routes)
+            self.event_map = event_map
+        return self.event_map
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in UNAUDITED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        request = Request(scope)
         token = None
         actor = None
         claims = None
-        event_type = detect_event_from_request(request)
-
-        form_data = await extract_form_data(request)
-        if "password" in form_data.keys():
-            del form_data["password"]
+        status_code = 500
+
+        capture = None
+        content_type = (request.headers.get("content-type") or "").lower()
+        if (
+            request.method not in BODYLESS_METHODS
+            and "application/x-www-form-urlencoded" in content_type
+        ):
+            capture = FormCapture(self.max_form_bytes)
+
+        async def receive_tee() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                capture.feed(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header[7:]
 
         if token:
-            claims = get_actor_claims(token)
-
-        response = await call_next(request)
-
-        if hasattr(request.state, "actor"):
-            actor = getattr(request.state, "actor", None)
-
-        response.background = BackgroundTasks()
-
-        if event_type == Event.UNIDENTIFIED_EVENT:
-            logger.warning("Unidentified event detected")
-
-        success = response.status_code < 400
-
-        extra_details = {
-            "timestamp": datetime.now().isoformat(),
-            "request_url": f"{request.url}",
-            "actor_email": actor_email(actor, claims),
-            "is_staff": actor_is_staff(actor, claims),
-            "latency": f"{round((time.time() - start_time) * 1000, 2)} ms",
-            "status_code": response.status_code,
-        }
-
-        if hasattr(request.state, "msg"):
-            msg: dict = getattr(request.state, "msg", {})
-            extra_details.update({"msg": msg.get("message", None)})
-
-        if form_data:
-            extra_details.update({"form": form_data})
-
-        audit_entry = {
-            "actor_id": actor_id(actor, claims),
-            "success": success,
-            "event": event_type,
-            "details": json.dumps(extra_details),
-        }
-
-        if response.background is None:
-            tasks = BackgroundTasks()
-            tasks.add_task(_bg_audit, audit_entry)
-            response.background = tasks
-        else:
-            response.background.add_task(_bg_audit, audit_entry)
-        return response
-
-    # avoid calling get_session() in middleware
-    # instead use a function that safely opens / closes, a db session and does the functionality
-    # add that function to the background tasks instead
+            claims = get_actor_claims(token, scope)
+
+        try:
+            await self.app(scope, receive_tee if capture else receive, send_wrapper)
+        finally:
+            state = scope.get("state", {})
+            actor = state.get("actor", None)
+            event_type = detect_event_from_scope(scope, self._event_map(scope))
+
+            if event_type == Event.UNIDENTIFIED_EVENT:
+                logger.warning("Unidentified event detected")
+
+            extra_details = {
+                "timestamp": datetime.now().isoformat(),
+                "request_url": f"{request.url}",
+                "actor_email": actor_email(actor, claims),
+                "is_staff": actor_is_staff(actor, claims),
+                "latency": f"{round((time.perf_counter() - start_time) * 1000, 2)} ms",
+                "status_code": status_code,
+            }
+
+            msg = state.get("msg", None)
+            if isinstance(msg, dict):
+                extra_details.update({"msg": msg.get("message", None)})
+
+            form_data = capture.fields() if capture else {}
+            if form_data:
+                extra_details.update({"form": form_data})
+
+            audit_entry = {
+                "actor_id": actor_id(actor, claims),
+                "success": status_code < 400,
+                "event": event_type,
+                "details": json.dumps(extra_details),
+            }
+
+            # written in batches by the audit writer, see app/core/audit.py
+            await audit_writer.submit(audit_entry)
@@ -0,0 +1,114 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import Settings
+from app.models import User
+
+settings = Settings()
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    The fields auth needs from a `User`, cached so authenticated requests do
+    not have to read the users table every time.
+    """
+
+    email: str
+    user_uid: str
+    is_active: bool
+    is_staff: bool
+    is_superuser: bool
+    fine_balance: int
+
+    @classmethod
+    def from_user(cls, user: User):
+        return cls(
+            email=user.email,
+            user_uid=user.user_uid,
+            is_active=user.is_active,
+            is_staff=user.is_staff,
+            is_superuser=user.is_superuser,
+            fine_balance=user.fine_balance,
+        )
+
+
+class PrincipalCache:
+    """
+    Bounded LRU of principals keyed by email, each entry living for `ttl`
+    seconds. Entries can be invalidated by email or user_uid.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, Principal]] = OrderedDict()
+        self._emails_by_uid: Dict[str, str] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, email: str) -> Optional[Principal]:
+        entry = self._entries.get(email)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(email)
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(email)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def put(self, principal: Principal) -> Principal:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return principal
+        self._remove(principal.email)
+        self._entries[principal.email] = (time.monotonic() + self.ttl, principal)
+        self._emails_by_uid[principal.user_uid] = principal.email
+        while len(self._entries) > self.maxsize:
+            email, _ = next(iter(self._entries.items()))
+            self._remove(email)
+        return principal
+
+    def invalidate(self, email: Optional[str] = None, user_uid: Optional[str] = None):
+        if email is None and user_uid is not None:
+            email = self._emails_by_uid.get(user_uid)
+        if email is not None and self._remove(email):
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._emails_by_uid.clear()
+
+    def _remove(self, email: str) -> bool:
+        entry = self._entries.pop(email, None)
+        if entry is None:
+            return False
+        self._emails_by_uid.pop(entry[1].user_uid, None)
+        return True
+
+
+principal_cache = PrincipalCache(
+    settings.principal_cache_size, settings.principal_cache_ttl
+)
+
+
+def invalidate_on_commit(
+    session, email: Optional[str] = None, user_uid: Optional[str] = None
+):
+    """
+    Invalidates a principal once `session` commits. Invalidating any earlier
+    lets a concurrent request cache the row as it was before the commit.
+    """
+    session.info.setdefault("principal_invalidations", []).append((email, user_uid))
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_pending(session):
+    # a rollback leaves nothing stale, invalidating anyway only costs a miss
+    for email, user_uid in session.info.pop("principal_invalidations", ()):
+        principal_cache.invalidate(email=email, user_uid=user_uid)
@@ -1,7 +1,37 @@
-from sqlalchemy import select, desc
+from datetime import datetime
+from sqlalchemy import (
+    and_,
+    case,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import Book, BookCopy, User, Loan, BkCopySchedule, Audit, LoanStatus
-from typing import List, Set
+from sqlalchemy.schema import CreateColumn, UniqueConstraint
+from app.core.principals import invalidate_on_commit
+from app.utils import generate_barcode, generate_book_copy_barcodes
+from app.models import (
+    BOOK_SEARCH_DDL,
+    BOOK_SEARCH_TABLE,
+    BOOK_SEARCH_VECTOR,
+    COPY_COUNTER_COLUMNS,
+    BkCopyStatus,
+    Book,
+    BookCopy,
+    User,
+    Loan,
+    BkCopySchedule,
+    Audit,
+    LoanStatus,
+    ScheduleStatus,
+)
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 async def get_book_by_id(db: AsyncSession, book_id: int):
@@ -9,6 +39,221 @@ async def get_book_by_id(db: AsyncSession, book_id: int):
     return book
 
 
+BOOK_LIST_COLUMNS = (
+    Book.id,
+    Book.title,
+    Book.author,
+    Book.isbn,
+    Book.library_barcode,
+    Book.available,
+    Book.location,
+)
+
+
+def _book_list_stmt(
+    author: Optional[str] = None,
+    location: Optional[str] = None,
+    available: Optional[bool] = None,
+):
+    stmt = select(*BOOK_LIST_COLUMNS).order_by(Book.id)
+    if author is not None:
+        stmt = stmt.where(Book.author == author)
+    if location is not None:
+        stmt = stmt.where(Book.location == location)
+    if available is not None:
+        stmt = stmt.where(Book.available == available)
+    return stmt
+
+
+async def get_books_page(db: AsyncSession, after_id: int, limit: int, **filters):
+    stmt = _book_list_stmt(**filters).where(Book.id > after_id).limit(limit)
+    result = await db.execute(stmt)
+    return result.mappings().all()
+
+
+async def stream_books(
+    db: AsyncSession, after_id: int = 0, batch_size: int = 1000, **filters
+):
+    stmt = (
+        _book_list_stmt(**filters)
+        .where(Book.id > after_id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for row in result.mappings():
+        yield row
+
+
+# exportable tables and the timestamp their time-range filters apply to
+EXPORT_TABLES = {
+    "loans": (Loan.__table__, Loan.checked_out_at),
+    "book_copies": (BookCopy.__table__, None),
+    "audit": (Audit.__table__, Audit.audited_at),
+}
+
+
+async def stream_export(
+    db: AsyncSession,
+    table_name: str,
+    after_id: int = 0,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 1000,
+):
+    """
+    Every row of an export table after `after_id` in primary key order, read
+    through a server-side cursor `batch_size` rows at a time. The key of the
+    last row received is the cursor to resume from.
+    """
+    table, timestamp = EXPORT_TABLES[table_name]
+    key = table.primary_key.columns.values()[0]
+    stmt = select(table).where(key > after_id).order_by(key)
+    if since is not None:
+        stmt = stmt.where(timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(timestamp < until)
+    result = await db.stream(stmt.execution_options(yield_per=batch_size))
+    async for row in result.mappings():
+        yield row
+
+
+def dialect_name(db: AsyncSession) -> str:
+    return db.get_bind().dialect.name
+
+
+async def index_book_text(db: AsyncSession, book: Book):
+    # postgres keeps its expression index up to date by itself
+    if dialect_name(db) != "sqlite":
+        return
+    params = {"id": book.id, "title": book.title, "author": book.author}
+    await db.execute(text(f"DELETE FROM {BOOK_SEARCH_TABLE} WHERE rowid = :id"), params)
+    await db.execute(
+        text(
+            f"INSERT INTO {BOOK_SEARCH_TABLE} (rowid, title, author) "
+            "VALUES (:id, :title, :author)"
+        ),
+        params,
+    )
+
+
+async def create_book_search_index(db: AsyncSession) -> bool:
+    """
+    Creates the search table (SQLite) or index (Postgres) if it is missing,
+    True if it had to. The Postgres index fills itself, a new SQLite table
+    still needs `rebuild_book_search_index`.
+    """
+    dialect = dialect_name(db)
+    if dialect not in BOOK_SEARCH_DDL:
+        return False
+    if dialect == "sqlite":
+        exists = await db.scalar(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": BOOK_SEARCH_TABLE},
+        )
+    else:
+        exists = await db.scalar(text("SELECT to_regclass('ix_books_search')"))
+    if exists:
+        return False
+    await db.execute(text(BOOK_SEARCH_DDL[dialect]))
+    return True
+
+
+async def rebuild_book_search_index(db: AsyncSession):
+    await create_book_search_index(db)
+    if dialect_name(db) != "sqlite":
+        await db.execute(text("REINDEX INDEX ix_books_search"))
+        return
+    await db.execute(text(f"DELETE FROM {BOOK_SEARCH_TABLE}"))
+    await db.execute(
+        text(
+            f"INSERT INTO {BOOK_SEARCH_TABLE} (rowid, title, author) "
+            "SELECT id, title, author FROM books"
+        )
+    )
+
+
+# indexes of older databases that app.models replaced with composite ones
+SUPERSEDED_INDEXES = ("ix_book_copies_book_isbn", "ix_bk_copy_schedules_status")
+
+
+def _add_missing_schema(connection) -> List[str]:
+    inspector = inspect(connection)
+    added = []
+    for table in Book.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            # every column added since has a server default to fill old rows
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            added.append(f"{table.name}.{column.name}")
+        indexes = inspector.get_indexes(table.name)
+        unique = {tuple(index["column_names"]) for index in indexes if index["unique"]}
+        unique.update(
+            tuple(constraint["column_names"])
+            for constraint in inspector.get_unique_constraints(table.name)
+        )
+        for index in table.indexes:
+            if index.name not in {index["name"] for index in indexes}:
+                index.create(connection)
+                added.append(index.name)
+        for constraint in table.constraints:
+            keys = tuple(constraint.columns.keys())
+            if not isinstance(constraint, UniqueConstraint) or keys in unique:
+                continue
+            # existing tables cannot take a constraint, a unique index does the same
+            name = constraint.name or f"uq_{table.name}_{'_'.join(keys)}"
+            connection.execute(
+                text(f"CREATE UNIQUE INDEX {name} ON {table.name} ({', '.join(keys)})")
+            )
+            added.append(name)
+    return added
+
+
+async def upgrade_schema(db: AsyncSession) -> List[str]:
+    """
+    Adds the columns, indexes and unique constraints of app.models that
+    tables created by an older release lack, create_all leaves existing
+    tables alone, and drops SUPERSEDED_INDEXES. Returns what it added,
+    as table.column or index names, empty once the schema is current.
+    """
+    connection = await db.connection()
+    added = await connection.run_sync(_add_missing_schema)
+    for name in SUPERSEDED_INDEXES:
+        await db.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    return added
+
+
+async def search_books(db: AsyncSession, terms: List[str], limit: int, offset: int):
+    """
+    Ranked prefix search, every term has to match the title or the author.
+    `terms` must be plain word characters, see `app.utils.search_terms`.
+    """
+    columns = ", ".join(f"books.{column.key}" for column in BOOK_LIST_COLUMNS)
+    params = {"limit": limit, "offset": offset}
+    if dialect_name(db) == "sqlite":
+        params["match"] = " ".join(f'"{term}"*' for term in terms)
+        stmt = text(
+            f"SELECT {columns} FROM {BOOK_SEARCH_TABLE} "
+            f"JOIN books ON books.id = {BOOK_SEARCH_TABLE}.rowid "
+            f"WHERE {BOOK_SEARCH_TABLE} MATCH :match "
+            f"ORDER BY {BOOK_SEARCH_TABLE}.rank, books.id LIMIT :limit OFFSET :offset"
+        )
+    else:
+        params["match"] = " & ".join(f"{term}:*" for term in terms)
+        stmt = text(
+            f"SELECT {columns} FROM books "
+            f"WHERE {BOOK_SEARCH_VECTOR} @@ to_tsquery('simple', :match) "
+            f"ORDER BY ts_rank({BOOK_SEARCH_VECTOR}, to_tsquery('simple', :match)) "
+            "DESC, books.id LIMIT :limit OFFSET :offset"
+        )
+    result = await db.execute(stmt, params)
+    return result.mappings().all()
+
+
 async def get_book_by_barcode(db: AsyncSession, barcode: str):
     stmt = select(Book).where(Book.library_barcode == barcode)
     result = await db.execute(stmt)
@@ -21,14 +266,50 @@ async def get_book_by_isbn(db: AsyncSession, bk_isbn: int):
     return result.scalar_one_or_none()
 
 
-async def get_last_book_copy(db: AsyncSession, book: Book):
+async def reserve_copy_serials(
+    db: AsyncSession, isbn: str, count: int
+) -> Optional[int]:
+    """
+    Atomically reserves a block of `count` copy serials for `isbn` and
+    returns the first one, None when there is no such book.
+    """
+    blocks = await reserve_copy_serial_blocks(db, {isbn: count})
+    if isbn not in blocks:
+        return None
+    return blocks[isbn][1]
+
+
+async def reserve_copy_serial_blocks(db: AsyncSession, counts: Dict[str, int]):
+    """
+    Reserves `counts[isbn]` consecutive copy serials for every isbn with one
+    UPDATE and returns {isbn: (library_barcode, first serial)}. The book rows
+    are locked by the UPDATE until the transaction ends, so concurrent
+    reservations get disjoint blocks. Copies inserted without a reservation
+    are skipped over via MAX(serial), a seek on the (book_isbn, serial)
+    unique index.
+    """
+    highest = func.coalesce(
+        select(func.max(BookCopy.serial))
+        .where(BookCopy.book_isbn == Book.isbn)
+        .scalar_subquery(),
+        0,
+    )
+    last = case((Book.copy_serial >= highest, Book.copy_serial), else_=highest)
     stmt = (
-        select(BookCopy)
-        .order_by(desc(BookCopy.serial))
-        .where(BookCopy.book_isbn == book.isbn)
+        update(Book)
+        .where(Book.isbn.in_(list(counts)))
+        .values(
+            copy_serial=last + case(counts, value=Book.isbn, else_=0),
+            updated_at=Book.updated_at,
+        )
+        .returning(Book.isbn, Book.library_barcode, Book.copy_serial)
+        .execution_options(synchronize_session=False)
     )
     result = await db.execute(stmt)
-    return result.scalars().first()
+    return {
+        isbn: (library_barcode, reserved - counts[isbn] + 1)
+        for isbn, library_barcode, reserved in result.all()
+    }
 
 
 async def get_bk_copy_by_barcode(db: AsyncSession, barcode: str):
@@ -37,36 +318,146 @@ async def get_bk_copy_by_barcode(db: AsyncSession, barcode: str):
     return result.scalar_one_or_none()
 
 
-async def get_reserved_bk_copy_by_barcode(db: AsyncSession, barcode: str):
-    stmt = select(BookCopy).where(
-        BookCopy.copy_barcode == barcode, BookCopy.status == "RESERVED"
+def _active_loans_count():
+    # correlated to the enclosing users row
+    return (
+        select(func.count())
+        .select_from(Loan)
+        .where(Loan.user_uid == User.user_uid, Loan.status == LoanStatus.ACTIVE)
+        .scalar_subquery()
     )
+
+
+async def get_loan_eligibility(db: AsyncSession, user_uid: str):
+    """
+    Fine balance and number of active loans of `user_uid` in one round trip,
+    None when the user does not exist.
+    """
+    stmt = select(
+        User.user_uid,
+        User.fine_balance,
+        _active_loans_count().label("active_loans"),
+    ).where(User.user_uid == user_uid)
     result = await db.execute(stmt)
-    return result.scalar_one_or_none()
+    return result.one_or_none()
 
 
-async def get_active_schedule(db: AsyncSession, isbn: int, user_uid: str):
-    stmt = (
+async def get_checkout_context(db: AsyncSession, isbn: str, user_uid: str):
+    """
+    Everything checkout needs to know about `user_uid` in one round trip: the
+    fine balance, the number of active loans and the user's active schedule
+    (id and reserved copy barcode) for `isbn`, if any.
+    Returns None when the user does not exist.
+    """
+    schedule = (
         select(BkCopySchedule)
         .join(BookCopy, BkCopySchedule.bk_copy_barcode == BookCopy.copy_barcode)
         .where(
-            BkCopySchedule.status == "ACTIVE",
-            BkCopySchedule.user_uid == user_uid,
+            BkCopySchedule.status == ScheduleStatus.ACTIVE,
+            BkCopySchedule.user_uid == User.user_uid,
             BookCopy.book_isbn == isbn,
         )
+        .order_by(BkCopySchedule.id)
+        .limit(1)
     )
+    stmt = select(
+        User.user_uid,
+        User.fine_balance,
+        _active_loans_count().label("active_loans"),
+        schedule.with_only_columns(BkCopySchedule.id)
+        .scalar_subquery()
+        .label("schedule_id"),
+        schedule.with_only_columns(BkCopySchedule.bk_copy_barcode)
+        .scalar_subquery()
+        .label("schedule_barcode"),
+    ).where(User.user_uid == user_uid)
     result = await db.execute(stmt)
-    return result.scalars().first()
+    return result.one_or_none()
 
 
-async def update_bk_schedule(
+async def get_active_schedules(
     db: AsyncSession,
-    bk_copy_schedule: BkCopySchedule,
-    update_data: dict,
+    user_uid: str,
+    isbns: Iterable[str] = (),
+    barcodes: Iterable[str] = (),
 ):
-    for key, value in update_data.items():
-        setattr(bk_copy_schedule, key, value)
-    await db.flush()
+    """
+    Active schedules of `user_uid` on any of `isbns` or reserving any of
+    `barcodes`, as (id, bk_copy_barcode, book_isbn) rows oldest first.
+    """
+    stmt = (
+        select(BkCopySchedule.id, BkCopySchedule.bk_copy_barcode, BookCopy.book_isbn)
+        .join(BookCopy, BkCopySchedule.bk_copy_barcode == BookCopy.copy_barcode)
+        .where(
+            BkCopySchedule.status == ScheduleStatus.ACTIVE,
+            BkCopySchedule.user_uid == user_uid,
+            or_(
+                BookCopy.book_isbn.in_(list(isbns)),
+                BkCopySchedule.bk_copy_barcode.in_(list(barcodes)),
+            ),
+        )
+        .order_by(BkCopySchedule.id)
+    )
+    result = await db.execute(stmt)
+    return result.all()
+
+
+async def consume_schedules(db: AsyncSession, schedule_ids: Iterable[int]):
+    stmt = (
+        update(BkCopySchedule)
+        .where(BkCopySchedule.id.in_(list(schedule_ids)))
+        .values(status=ScheduleStatus.CONSUMED)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(stmt)
+
+
+async def expire_schedules(db: AsyncSession, cutoff: datetime, batch_size: int):
+    """
+    Marks up to `batch_size` active schedules made before `cutoff` as expired,
+    oldest first, and returns the barcodes of the copies they reserved.
+    """
+    overdue = (
+        select(BkCopySchedule.id)
+        .where(
+            BkCopySchedule.status == ScheduleStatus.ACTIVE,
+            BkCopySchedule.created_at < cutoff,
+        )
+        .order_by(BkCopySchedule.created_at)
+        .limit(batch_size)
+    )
+    stmt = (
+        update(BkCopySchedule)
+        .where(
+            BkCopySchedule.id.in_(overdue),
+            # recheck, the schedule may have been consumed meanwhile
+            BkCopySchedule.status == ScheduleStatus.ACTIVE,
+        )
+        .values(status=ScheduleStatus.EXPIRED)
+        .returning(BkCopySchedule.bk_copy_barcode)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def release_reserved_copies(db: AsyncSession, barcodes: Iterable[str]):
+    """
+    Moves the copies among `barcodes` that are still reserved back to
+    AVAILABLE in one UPDATE and returns the ISBN of each copy released.
+    """
+    stmt = (
+        update(BookCopy)
+        .where(
+            BookCopy.copy_barcode.in_(list(barcodes)),
+            BookCopy.status == BkCopyStatus.RESERVED,
+        )
+        .values(status=BkCopyStatus.AVAILABLE)
+        .returning(BookCopy.book_isbn)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
 
 
 async def get_user_active_loans(db: AsyncSession, user_uid: str):
@@ -82,9 +473,143 @@ async def create_new_book(db: AsyncSession, book: Book):
     await db.flush()
 
 
-async def add_book_copies(db: AsyncSession, copies: List[BookCopy]):
-    db.add_all(copies)
-    await db.flush()
+BOOK_COPY_COLUMNS = ("book_isbn", "serial", "copy_barcode", "status")
+
+
+async def insert_book_copies(
+    db: AsyncSession,
+    isbn: str,
+    library_barcode: str,
+    first_serial: int,
+    quantity: int,
+    chunk_size: int = 5000,
+):
+    """
+    Inserts `quantity` available copies of `isbn` with consecutive serials
+    from `first_serial`, see `insert_copy_blocks`.
+    """
+    await insert_copy_blocks(
+        db, [(isbn, library_barcode, first_serial, quantity)], chunk_size
+    )
+
+
+def _copy_block_rows(blocks, chunk_size: int):
+    # (isbn, serial, barcode) rows of every block, `chunk_size` at a time
+    chunk = []
+    for isbn, library_barcode, first_serial, quantity in blocks:
+        for start in range(0, quantity, chunk_size):
+            count = min(chunk_size, quantity - start)
+            serial = first_serial + start
+            barcodes = generate_book_copy_barcodes(library_barcode, serial, count)
+            for i, barcode in enumerate(barcodes):
+                chunk.append((isbn, serial + i, barcode))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+
+async def insert_copy_blocks(
+    db: AsyncSession,
+    blocks: Iterable[Tuple[str, str, int, int]],
+    chunk_size: int = 5000,
+):
+    """
+    Inserts available copies for (isbn, library_barcode, first_serial,
+    quantity) blocks without building ORM objects. Rows are generated and
+    sent `chunk_size` at a time: COPY on asyncpg, a multi-row INSERT elsewhere.
+    """
+    copy_records = None
+    if dialect_name(db) == "postgresql":
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        copy_records = raw.driver_connection.copy_records_to_table
+
+    for chunk in _copy_block_rows(blocks, chunk_size):
+        if copy_records is not None:
+            await copy_records(
+                BookCopy.__tablename__,
+                columns=BOOK_COPY_COLUMNS,
+                records=[row + (BkCopyStatus.AVAILABLE.name,) for row in chunk],
+            )
+        else:
+            await db.execute(
+                insert(BookCopy),
+                [
+                    {
+                        "book_isbn": isbn,
+                        "serial": serial,
+                        "copy_barcode": barcode,
+                        "status": BkCopyStatus.AVAILABLE,
+                    }
+                    for isbn, serial, barcode in chunk
+                ],
+            )
+
+
+BOOK_IMPORT_COLUMNS = ("title", "author", "location")
+
+
+async def get_books_by_titles(db: AsyncSession, titles: Iterable[str]):
+    stmt = select(Book.title, Book.isbn).where(Book.title.in_(list(titles)))
+    result = await db.execute(stmt)
+    return dict(result.all())
+
+
+async def unused_library_barcodes(db: AsyncSession, count: int) -> List[str]:
+    """
+    `count` distinct random library barcodes no book has yet. Candidates that
+    are taken, by a book or by another candidate, are drawn again.
+    """
+    barcodes = set()
+    while len(barcodes) < count:
+        candidates = {generate_barcode() for _ in range(count - len(barcodes))}
+        candidates -= barcodes
+        taken = await db.scalars(
+            select(Book.library_barcode).where(Book.library_barcode.in_(candidates))
+        )
+        barcodes |= candidates - set(taken)
+    return list(barcodes)
+
+
+async def upsert_books(db: AsyncSession, rows: List[dict]):
+    """
+    Inserts `rows` with one multi-row INSERT, books whose isbn already exists
+    get their title, author and location updated instead.
+    Returns the (id, isbn) of every row.
+    """
+    dialect = postgresql if dialect_name(db) == "postgresql" else sqlite
+    # a random barcode that collides would roll back the whole batch
+    barcodes = await unused_library_barcodes(db, len(rows))
+    stmt = dialect.insert(Book).values(
+        [
+            {**row, "library_barcode": barcode, "available": False}
+            for row, barcode in zip(rows, barcodes)
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Book.isbn],
+        set_={column: stmt.excluded[column] for column in BOOK_IMPORT_COLUMNS},
+    ).returning(Book.id, Book.isbn)
+    result = await db.execute(stmt)
+    return result.all()
+
+
+async def index_books_text(db: AsyncSession, book_ids: Iterable[int]):
+    # set-based index_book_text
+    if dialect_name(db) != "sqlite":
+        return
+    ids = ", ".join(str(int(book_id)) for book_id in book_ids)
+    if not ids:
+        return
+    await db.execute(text(f"DELETE FROM {BOOK_SEARCH_TABLE} WHERE rowid IN ({ids})"))
+    await db.execute(
+        text(
+            f"INSERT INTO {BOOK_SEARCH_TABLE} (rowid, title, author) "
+            f"SELECT id, title, author FROM books WHERE id IN ({ids})"
+        )
+    )
 
 
 async def update_book(
@@ -97,12 +622,171 @@ async def update_book(
     await db.flush()
 
 
-async def get_book_copy(db: AsyncSession, isbn: int):
-    stmt = select(BookCopy).where(
-        BookCopy.book_isbn == isbn, BookCopy.status == "AVAILABLE"
+async def shift_copy_counters(
+    db: AsyncSession,
+    isbn: str,
+    from_status: Optional[BkCopyStatus],
+    to_status: BkCopyStatus,
+    count: int = 1,
+):
+    """
+    Moves `count` copies of `isbn` between the status counters of its book,
+    `from_status=None` means the copies are new.
+    """
+    deltas = {COPY_COUNTER_COLUMNS[to_status]: count}
+    if from_status is None:
+        deltas["copies_total"] = count
+    else:
+        from_column = COPY_COUNTER_COLUMNS[from_status]
+        deltas[from_column] = deltas.get(from_column, 0) - count
+    # counter changes are not edits of the book itself
+    values = {"updated_at": Book.updated_at}
+    for column, delta in deltas.items():
+        values[column] = getattr(Book, column) + delta
+    available_delta = deltas.get("copies_available", 0)
+    if available_delta:
+        values["available"] = Book.copies_available + available_delta > 0
+    stmt = (
+        update(Book)
+        .where(Book.isbn == isbn)
+        .values(**values)
+        .execution_options(synchronize_session="fetch")
+    )
+    await db.execute(stmt)
+
+
+def _count_copies(status: Optional[BkCopyStatus] = None):
+    stmt = (
+        select(func.count())
+        .select_from(BookCopy)
+        .where(BookCopy.book_isbn == Book.isbn)
+    )
+    if status is not None:
+        stmt = stmt.where(BookCopy.status == status)
+    return stmt.scalar_subquery()
+
+
+async def recount_copy_counters(
+    db: AsyncSession, isbns: Optional[Iterable[str]] = None
+):
+    """
+    Recomputes the copy counters from book_copies in one set-based UPDATE,
+    for every book or only for `isbns`. Returns the number of books updated.
+    """
+    values = {"updated_at": Book.updated_at, "copies_total": _count_copies()}
+    for status, column in COPY_COUNTER_COLUMNS.items():
+        values[column] = _count_copies(status)
+    values["available"] = _count_copies(BkCopyStatus.AVAILABLE) > 0
+    if isbns is None:
+        # full reconciliation, not worth syncing loaded books
+        stmt = update(Book).execution_options(synchronize_session=False)
+    else:
+        stmt = (
+            update(Book)
+            .where(Book.isbn.in_(list(isbns)))
+            .execution_options(synchronize_session="fetch")
+        )
+    result = await db.execute(stmt.values(**values))
+    return result.rowcount
+
+
+async def claim_book_copy(
+    db: AsyncSession,
+    to_status: BkCopyStatus,
+    isbn: Optional[str] = None,
+    barcode: Optional[str] = None,
+    from_status: BkCopyStatus = BkCopyStatus.AVAILABLE,
+):
+    """
+    Atomically moves one copy of `isbn` (or the copy `barcode`) from
+    `from_status` to `to_status` and returns it, or None when there is no such
+    copy. The status check is part of the UPDATE itself so a copy can only be
+    claimed once; on Postgres concurrent claimers skip rows locked by others
+    instead of queueing behind them.
+    """
+    candidate = select(BookCopy.copy_id).where(BookCopy.status == from_status)
+    if isbn is not None:
+        candidate = candidate.where(BookCopy.book_isbn == isbn)
+    if barcode is not None:
+        candidate = candidate.where(BookCopy.copy_barcode == barcode)
+    candidate = candidate.limit(1)
+    if dialect_name(db) == "postgresql":
+        candidate = candidate.with_for_update(skip_locked=True)
+    stmt = (
+        update(BookCopy)
+        .where(
+            BookCopy.copy_id == candidate.scalar_subquery(),
+            BookCopy.status == from_status,
+        )
+        .values(status=to_status)
+        .returning(BookCopy)
+    )
+    result = await db.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+async def claim_book_copies(
+    db: AsyncSession, to_status: BkCopyStatus, counts: Dict[str, int]
+):
+    """
+    Set-based `claim_book_copy` for several titles: moves up to `counts[isbn]`
+    available copies of each isbn to `to_status` in a single UPDATE and
+    returns the claimed copies. A title may yield fewer copies than asked for.
+    """
+    ranked = (
+        select(
+            BookCopy.copy_id,
+            BookCopy.book_isbn,
+            func.row_number()
+            .over(partition_by=BookCopy.book_isbn, order_by=BookCopy.copy_id)
+            .label("rank"),
+        )
+        .where(
+            BookCopy.status == BkCopyStatus.AVAILABLE,
+            BookCopy.book_isbn.in_(list(counts)),
+        )
+        .subquery()
+    )
+    wanted = select(ranked.c.copy_id).where(
+        ranked.c.rank <= case(counts, value=ranked.c.book_isbn, else_=0)
+    )
+    stmt = (
+        update(BookCopy)
+        .where(
+            BookCopy.copy_id.in_(wanted),
+            # recheck, a concurrent claimer may have taken the row meanwhile
+            BookCopy.status == BkCopyStatus.AVAILABLE,
+        )
+        .values(status=to_status)
+        .returning(BookCopy)
+        .execution_options(synchronize_session=False)
     )
     result = await db.execute(stmt)
-    return result.scalars().first()
+    return result.scalars().all()
+
+
+async def claim_book_copies_by_barcode(
+    db: AsyncSession,
+    to_status: BkCopyStatus,
+    barcodes: Dict[BkCopyStatus, Iterable[str]],
+):
+    """
+    Moves the copies in `barcodes[from_status]` that are still in
+    `from_status` to `to_status` in a single UPDATE and returns them.
+    """
+    conditions = [
+        and_(BookCopy.copy_barcode.in_(list(codes)), BookCopy.status == from_status)
+        for from_status, codes in barcodes.items()
+    ]
+    stmt = (
+        update(BookCopy)
+        .where(or_(*conditions))
+        .values(status=to_status)
+        .returning(BookCopy)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
 
 
 async def get_book_copy_by_barcode(db: AsyncSession, copy_barcode_: str):
@@ -140,25 +824,200 @@ async def create_new_user(db: AsyncSession, user: User):
     return user
 
 
-async def create_loan(db: AsyncSession, loan: Loan):
-    db.add(loan)
-    await db.flush()
-    await db.refresh(loan)
-    return loan
+async def create_loan(db: AsyncSession, loan_data: dict):
+    # server defaults come back with the insert, no refresh needed
+    stmt = insert(Loan).values(**loan_data).returning(Loan)
+    result = await db.execute(stmt)
+    return result.scalar_one()
 
 
-async def get_all_non_staff_users(db: AsyncSession):
-    stmt = select(User).where(~User.is_staff, ~User.is_superuser)
-    result = await db.execute(stmt)
+async def create_loans(db: AsyncSession, loans_data: List[dict]):
+    # one multi-row insert, the returned loans are in no particular order
+    stmt = insert(Loan).returning(Loan)
+    result = await db.execute(stmt, loans_data)
     return result.scalars().all()
 
 
+USER_LIST_COLUMNS = (
+    User.id,
+    User.email,
+    User.card_number,
+    User.is_active,
+    User.is_staff,
+    User.is_superuser,
+    User.created_at,
+    User.updated_at,
+)
+
+
+def _non_staff_users_stmt(
+    is_active: Optional[bool] = None,
+    has_fines: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
+    stmt = (
+        select(*USER_LIST_COLUMNS)
+        .where(~User.is_staff, ~User.is_superuser)
+        .order_by(User.id)
+    )
+    if is_active is not None:
+        stmt = stmt.where(User.is_active == is_active)
+    if has_fines is not None:
+        stmt = stmt.where(
+            User.fine_balance > 0 if has_fines else User.fine_balance <= 0
+        )
+    if created_after is not None:
+        stmt = stmt.where(User.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(User.created_at < created_before)
+    return stmt
+
+
+async def get_non_staff_users_page(
+    db: AsyncSession, after_id: int, limit: int, **filters
+):
+    stmt = _non_staff_users_stmt(**filters).where(User.id > after_id).limit(limit)
+    result = await db.execute(stmt)
+    return result.mappings().all()
+
+
+async def stream_non_staff_users(
+    db: AsyncSession, after_id: int = 0, batch_size: int = 1000, **filters
+):
+    stmt = (
+        _non_staff_users_stmt(**filters)
+        .where(User.id > after_id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for row in result.mappings():
+        yield row
+
+
 async def get_loan_by_id(db: AsyncSession, _loan_id: str):
-    stmt = select(Loan).where(Loan.loan_id == _loan_id)
+    # locked until the transaction ends, fines are accrued under the same lock,
+    # see get_overdue_loans
+    stmt = select(Loan).where(Loan.loan_id == _loan_id).with_for_update()
     result = await db.execute(stmt)
     return result.scalar_one_or_none()
 
 
+async def get_loans_for_return(db: AsyncSession, loan_ids: Iterable[str]):
+    """
+    Loans in `loan_ids` with the status and isbn of their book copy, as
+    (loan_id, user_uid, bk_copy_barcode, status, due_at, fine_accrued,
+    copy_status, book_isbn) rows. The loan rows stay locked until the
+    transaction ends.
+    """
+    stmt = (
+        select(
+            Loan.loan_id,
+            Loan.user_uid,
+            Loan.status,
+            Loan.bk_copy_barcode,
+            Loan.due_at,
+            Loan.fine_accrued,
+            BookCopy.status.label("copy_status"),
+            BookCopy.book_isbn,
+        )
+        .outerjoin(BookCopy, Loan.bk_copy_barcode == BookCopy.copy_barcode)
+        .where(Loan.loan_id.in_(list(loan_ids)))
+        # the copy is on the nullable side of the join, only loans can be locked
+        .with_for_update(of=Loan)
+    )
+    result = await db.execute(stmt)
+    return result.all()
+
+
+async def check_in_book_copies(db: AsyncSession, barcodes: Iterable[str]):
+    """
+    Moves the borrowed copies among `barcodes` to IN_CHECK in one UPDATE and
+    returns the barcodes actually moved.
+    """
+    stmt = (
+        update(BookCopy)
+        .where(
+            BookCopy.copy_barcode.in_(list(barcodes)),
+            BookCopy.status == BkCopyStatus.BORROWED,
+        )
+        .values(status=BkCopyStatus.IN_CHECK)
+        .returning(BookCopy.copy_barcode)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return set(result.scalars().all())
+
+
+async def close_loans(
+    db: AsyncSession,
+    loan_ids: Iterable[str],
+    status: LoanStatus,
+    returned_at: datetime,
+):
+    stmt = (
+        update(Loan)
+        .where(Loan.loan_id.in_(list(loan_ids)))
+        .values(status=status, returned_at=returned_at)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(stmt)
+
+
+async def get_overdue_loans(
+    db: AsyncSession,
+    now: datetime,
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+):
+    """
+    Up to `limit` active loans due before `now` as (id, user_uid, due_at,
+    fine_accrued) rows, in (due_at, id) order so the scan walks the
+    (status, due_at) index. `after` is the (due_at, id) of the last row seen.
+    The rows stay locked until the transaction ends. Returns lock their loans
+    as well (get_loan_by_id, get_loans_for_return), so a return waits for the
+    accrual to commit and then reads the fine it accrued, and the other way
+    round.
+    """
+    stmt = (
+        select(Loan.id, Loan.user_uid, Loan.due_at, Loan.fine_accrued)
+        .where(Loan.status == LoanStatus.ACTIVE, Loan.due_at < now)
+        .order_by(Loan.due_at, Loan.id)
+        .limit(limit)
+        .with_for_update()
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(Loan.due_at, Loan.id) > tuple_(*after))
+    result = await db.execute(stmt)
+    return result.all()
+
+
+async def set_accrued_fines(db: AsyncSession, fines: Dict[int, int]):
+    """Sets `fine_accrued` of the loans keyed by id in `fines`, one executemany"""
+    await db.execute(
+        update(Loan),
+        [{"id": loan_id, "fine_accrued": fine} for loan_id, fine in fines.items()],
+    )
+
+
+async def add_user_fines(db: AsyncSession, fines: Dict[str, int]):
+    """
+    Adds `fines[user_uid]` to each user's fine balance in one atomic
+    `fine_balance = fine_balance + CASE user_uid ... END` UPDATE.
+    """
+    if not fines:
+        return
+    stmt = (
+        update(User)
+        .where(User.user_uid.in_(list(fines)))
+        .values(fine_balance=User.fine_balance + case(fines, value=User.user_uid))
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(stmt)
+    for user_uid in fines:
+        invalidate_on_commit(db, user_uid=user_uid)
+
+
 async def create_default_superuser(db: AsyncSession, admin_user: User):
     db.add(admin_user)
     await db.flush()
@@ -172,6 +1031,7 @@ async def update_user(
     for key, value in update_data.items():
         setattr(user, key, value)
     await db.flush()
+    invalidate_on_commit(db, email=user.email, user_uid=user.user_uid)
 
 
 async def get_default_superuser(db: AsyncSession, email: str):
@@ -222,16 +1082,23 @@ async def add_audit(db: AsyncSession, audit: Audit):
     await db.flush()
 
 
-async def get_bk_copies_by_barcode(db: AsyncSession, barcodes: Set[str]):
-    stmt = select(BookCopy).where(BookCopy.copy_barcode.in_(barcodes))
-    result = await db.execute(stmt)
-    return result.scalars().all()
+async def add_audits(db: AsyncSession, entries: List[dict]):
+    await db.execute(insert(Audit), entries)
 
 
-async def update_bk_copies_status(
-    db: AsyncSession, bk_copies: List[BookCopy], update_data: List[dict]
+async def set_bk_copies_status(
+    db: AsyncSession, status: BkCopyStatus, barcodes: Iterable[str]
 ):
-    for i, data in enumerate(update_data):
-        for key, value in data.items():
-            setattr(bk_copies[i], key, value)
-    await db.flush()
+    """
+    Sets the status of every copy in `barcodes` with one UPDATE and returns
+    the (copy_barcode, book_isbn) rows that were found.
+    """
+    stmt = (
+        update(BookCopy)
+        .where(BookCopy.copy_barcode.in_(list(barcodes)))
+        .values(status=status)
+        .returning(BookCopy.copy_barcode, BookCopy.book_isbn)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return result.all()
@@ -0,0 +1,277 @@
+"""
+Bulk catalogue import: books and their copies from a CSV or JSONL file.
+
+Every row is a `BookImportRow` (title, author, location, isbn and an optional
+number of copies). Rows are read and validated in a worker thread and written
+in batches, each batch in its own transaction: books are upserted by isbn with
+one multi-row insert and their copies are created with chunked inserts. Rows
+that fail are recorded on the job and the import carries on.
+
+Re-importing a file is safe for the books, which are upserted, but `copies`
+is a number of copies to add: importing the same file twice creates them twice.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import crud
+from app.core.config import Settings
+from app.schemas.book import BookImportRow
+from app.utils import generate_random_id
+
+logger = logging.getLogger(__name__)
+
+settings = Settings()
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+# errors kept on a job, the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class ImportJob:
+    source: str
+    job_id: str = field(default_factory=lambda: f"IM-{generate_random_id()}")
+    status: str = "pending"
+    rows_read: int = 0
+    books_imported: int = 0
+    copies_created: int = 0
+    rows_failed: int = 0
+    errors: List[dict] = field(default_factory=list)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    def fail_row(self, line: int, isbn: Optional[str], error: str):
+        self.rows_failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "isbn": isbn, "error": error})
+
+
+class ImportJobs:
+    """
+    Recent import jobs by id. Jobs run as background tasks of the process,
+    the oldest finished jobs are forgotten past `maxsize`.
+    """
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._tasks = set()
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self._jobs.get(job_id)
+
+    def add(self, job: ImportJob):
+        self._jobs[job.job_id] = job
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.maxsize:
+                break
+            if self._jobs[job_id].finished_at is not None:
+                del self._jobs[job_id]
+
+    def start(self, job: ImportJob, file: BinaryIO, fmt: str, session_factory):
+        """
+        Imports the binary `file` in the background and closes it afterwards.
+        """
+        self.add(job)
+        task = asyncio.create_task(
+            import_file(session_factory, job, file, fmt),
+            name=f"import-{job.job_id}",
+        )
+        # keep a reference until the task is done
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def cancel_all(self):
+        """
+        Stops running imports, batches already committed stay imported.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+import_jobs = ImportJobs()
+
+
+def format_from_filename(filename: str) -> Optional[str]:
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension == "ndjson":
+        return "jsonl"
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def read_rows(file, fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Yields (line, raw row, parse error) for every record of a text file.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        for raw in reader:
+            # empty cells fall back to the schema defaults
+            yield reader.line_num, {k: v for k, v in raw.items() if k and v}, None
+        return
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(raw, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, raw, None
+
+
+def _validation_message(e: ValidationError) -> str:
+    error = e.errors()[0]
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def _validated_batches(
+    job: ImportJob,
+    rows: Iterator[Tuple[int, Optional[dict], Optional[str]]],
+    batch_size: int,
+) -> Iterator[List[Tuple[int, BookImportRow]]]:
+    # first line of every isbn and the isbn of every title seen so far
+    seen_isbns: Dict[str, int] = {}
+    seen_titles: Dict[str, str] = {}
+    batch = []
+    for line, raw, error in rows:
+        job.rows_read += 1
+        if error:
+            job.fail_row(line, None, error)
+            continue
+        try:
+            row = BookImportRow.model_validate(raw)
+        except ValidationError as e:
+            job.fail_row(line, str(raw.get("isbn", "")) or None, _validation_message(e))
+            continue
+        if row.isbn in seen_isbns:
+            job.fail_row(
+                line,
+                row.isbn,
+                f"Duplicate ISBN, first seen on line {seen_isbns[row.isbn]}",
+            )
+            continue
+        if seen_titles.get(row.title, row.isbn) != row.isbn:
+            job.fail_row(
+                line, row.isbn, f"Title already used by ISBN-{seen_titles[row.title]}"
+            )
+            continue
+        seen_isbns[row.isbn] = line
+        seen_titles[row.title] = row.isbn
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def import_rows(
+    session_factory,
+    job: ImportJob,
+    rows: Iterator[Tuple[int, Optional[dict], Optional[str]]],
+    batch_size: int = settings.import_batch_size,
+):
+    """
+    Imports `rows` from `read_rows`. Reading and validating block, so each
+    batch is put together in a worker thread and only written on the loop.
+    """
+    job.status = "running"
+    job.started_at = datetime.now(timezone.utc)
+    batches = _validated_batches(job, rows, batch_size)
+    try:
+        while batch := await asyncio.to_thread(next, batches, None):
+            await _import_batch(session_factory, job, batch)
+    except asyncio.CancelledError:
+        job.status = "failed"
+        raise
+    except Exception as e:
+        logger.error(f"Import {job.job_id} failed: {e}")
+        job.status = "failed"
+    else:
+        job.status = "completed"
+    finally:
+        job.finished_at = datetime.now(timezone.utc)
+    logger.info(
+        f"Import {job.job_id} {job.status}: {job.books_imported} books, "
+        f"{job.copies_created} copies, {job.rows_failed} rows failed"
+    )
+    return job
+
+
+async def import_file(session_factory, job: ImportJob, file: BinaryIO, fmt: str):
+    """
+    Imports an open binary file, e.g. the spool of an upload, and closes it.
+    """
+    with io.TextIOWrapper(file, encoding="utf-8-sig", newline="") as text:
+        return await import_rows(session_factory, job, read_rows(text, fmt))
+
+
+async def _import_batch(session_factory, job: ImportJob, batch: List[tuple]):
+    rows = batch
+    counts = {}
+    async with session_factory() as session:
+        try:
+            taken = await crud.get_books_by_titles(
+                session, {row.title for _, row in batch}
+            )
+            rows = []
+            for line, row in batch:
+                owner = taken.get(row.title, row.isbn)
+                if owner != row.isbn:
+                    job.fail_row(line, row.isbn, f"Title already used by ISBN-{owner}")
+                    continue
+                rows.append((line, row))
+            if not rows:
+                return
+            books = await crud.upsert_books(
+                session,
+                [
+                    row.model_dump(include={"isbn", *crud.BOOK_IMPORT_COLUMNS})
+                    for _, row in rows
+                ],
+            )
+            counts = {row.isbn: row.copies for _, row in rows if row.copies}
+            if counts:
+                blocks = await crud.reserve_copy_serial_blocks(session, counts)
+                await crud.insert_copy_blocks(
+                    session,
+                    [
+                        (isbn, library_barcode, first_serial, counts[isbn])
+                        for isbn, (library_barcode, first_serial) in blocks.items()
+                    ],
+                    settings.bulk_insert_chunk_size,
+                )
+            await crud.recount_copy_counters(session, [row.isbn for _, row in rows])
+            await crud.index_books_text(session, [book_id for book_id, _ in books])
+            await session.commit()
+        except SQLAlchemyError as e:
+            await session.rollback()
+            logger.error(f"Import {job.job_id} batch failed: {e}")
+            for line, row in rows:
+                job.fail_row(line, row.isbn, "Database error, batch rolled back")
+            return
+    job.books_imported += len(rows)
+    job.copies_created += sum(counts.values())
+    logger.info(
+        f"Import {job.job_id}: {job.rows_read} rows read, {job.books_imported} books, "
+        f"{job.copies_created} copies, {job.rows_failed} failed"
+    )
@@ -1,30 +1,59 @@
 from fastapi import FastAPI
+from app import services
 from app.core.config import Settings
 from contextlib import asynccontextmanager
-from app.core.middleware import AuditMiddleware
-from app.routers import books, users
-from app.core.database import engine, Base, AsyncSessionLocal
-from app.core.auth import create_superuser
+from app.core.audit import audit_writer
+from app.core.middleware import AuditMiddleware, build_event_map
+from app.routers import books, exports, health, imports, metrics, users
+from app.core.database import (
+    engine, replica_engine, Base, AsyncSessionLocal, dispose_engines, warm_up_pool
+)
+from app.core.metrics import MetricsMiddleware, instrument_engine
+from app.core.auth import create_superuser, shutdown_hash_executor
+from app.imports import import_jobs
+from app.schedules import schedule_expirer
 
 settings = Settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await warm_up_pool(engine)
+    if replica_engine is not engine:
+        await warm_up_pool(replica_engine)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     async with AsyncSessionLocal() as session:
+        # create_all only creates missing tables, not their new columns
+        await services.upgrade_schema_service(session)
         if not settings.test_mode:
             await create_superuser(session)         
+    app.state.audit_events = build_event_map(app.routes)
+    await audit_writer.start()
+    await schedule_expirer.start()
     yield
-    await engine.dispose()
+    await schedule_expirer.stop()
+    await import_jobs.cancel_all()
+    await audit_writer.stop()
+    shutdown_hash_executor()
+    await dispose_engines()
     
 app = FastAPI(lifespan=lifespan)
 
 if not settings.test_mode:
     app.add_middleware(AuditMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine.sync_engine, "primary")
+    if replica_engine is not engine:
+        instrument_engine(replica_engine.sync_engine, "replica")
 
 app.include_router(books.books_router)
 app.include_router(users.users_router)
+app.include_router(imports.imports_router)
+app.include_router(exports.exports_router)
+app.include_router(health.health_router)
+if settings.metrics_enabled:
+    app.include_router(metrics.metrics_router)
 
 @app.get('/')
 async def root():
@@ -1,7 +1,20 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import JSON, Boolean, DateTime, Enum, ForeignKey, Integer, String, func
+from sqlalchemy import (
+    DDL,
+    JSON,
+    Boolean,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    event,
+    func,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.database import Base
@@ -23,14 +36,23 @@ class LoanStatus(enum.Enum):
 
 class Event(enum.Enum):
     CHECKOUT = "checkout"
+    BULK_CHECKOUT = "bulk_checkout"
     CREATE_BOOK = "create_book"
     CREATE_BK_COPIES = "create_bk_copies"
     CREATE_USER = "create_user"
+    CREATE_STAFF_USER = "create_staff_user"
+    DELETE_BOOK = "delete_book"
+    EXPORT_TABLE = "export_table"
     FETCH_BOOK = "fecth_book"
+    FETCH_BOOKS = "fetch_books"
     FETCH_USER = "fetch_user"
+    FETCH_IMPORT = "fetch_import"
+    IMPORT_BOOKS = "import_books"
+    SEARCH_BOOKS = "search_books"
     LOGIN_ADMIN_USER = "login_admin_user"
     LOGIN_USER = "login_user"
     RETURN_BOOK = "return_book"
+    BULK_RETURN_BOOK = "bulk_return_book"
     SCHEDULE_BOOK = "schedule_book"
     UPDATE_BOOK = "update_book"
     UPDATE_BOOK_COPIES = "update_book_copies"
@@ -65,6 +87,18 @@ class Book(Base):
     )
     available: Mapped[bool] = mapped_column(Boolean, default=True)
     location: Mapped[str] = mapped_column(String(50), nullable=False)
+    # denormalized copy counters, see COPY_COUNTER_COLUMNS
+    copies_total: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    copies_available: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0"
+    )
+    copies_borrowed: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    copies_reserved: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    copies_in_check: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    copies_lost: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    copies_damaged: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # last copy serial handed out, see crud.reserve_copy_serials
+    copy_serial: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -73,6 +107,48 @@ class Book(Base):
     )
 
 
+# Book counter column kept for each copy status
+COPY_COUNTER_COLUMNS = {
+    BkCopyStatus.AVAILABLE: "copies_available",
+    BkCopyStatus.BORROWED: "copies_borrowed",
+    BkCopyStatus.RESERVED: "copies_reserved",
+    BkCopyStatus.IN_CHECK: "copies_in_check",
+    BkCopyStatus.LOST: "copies_lost",
+    BkCopyStatus.DAMAGED: "copies_damaged",
+}
+
+
+# Full-text search over book titles and authors.
+# On Postgres an expression GIN index keeps itself up to date, on SQLite an FTS5
+# table keyed by books.id is maintained by crud.index_book_text.
+BOOK_SEARCH_TABLE = "books_fts"
+BOOK_SEARCH_VECTOR = (
+    "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, ''))"
+)
+
+# create_all only runs these together with books, databases that already had
+# the table get them from crud.create_book_search_index
+BOOK_SEARCH_DDL = {
+    "sqlite": (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {BOOK_SEARCH_TABLE} "
+        "USING fts5(title, author, prefix='2 3')"
+    ),
+    "postgresql": (
+        "CREATE INDEX IF NOT EXISTS ix_books_search ON books "
+        f"USING GIN ({BOOK_SEARCH_VECTOR})"
+    ),
+}
+for dialect, statement in BOOK_SEARCH_DDL.items():
+    event.listen(
+        Book.__table__, "after_create", DDL(statement).execute_if(dialect=dialect)
+    )
+event.listen(
+    Book.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {BOOK_SEARCH_TABLE}").execute_if(dialect="sqlite"),
+)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -102,6 +178,12 @@ class User(Base):
 
 class Loan(Base):
     __tablename__ = "loans"
+    __table_args__ = (
+        # active loans of a user, checkout eligibility
+        Index("ix_loans_user_uid_status", "user_uid", "status"),
+        # overdue active loans, scanned by the fine accrual job
+        Index("ix_loans_status_due_at", "status", "due_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     loan_id: Mapped[str] = mapped_column(
@@ -121,6 +203,8 @@ class Loan(Base):
         DateTime(timezone=True), default=default_loan_due_date
     )
     returned_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    # fine already added to the user's balance while the loan was overdue
+    fine_accrued: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=True, onupdate=func.now()
     )
@@ -130,13 +214,19 @@ class Loan(Base):
 
 class BookCopy(Base):
     __tablename__ = "book_copies"
+    __table_args__ = (
+        # also serves lookups of the copies of an isbn
+        UniqueConstraint("book_isbn", "serial", name="uq_book_copies_isbn_serial"),
+        # copies of an isbn in a given status, copy claims and recounts
+        Index("ix_book_copies_isbn_status", "book_isbn", "status"),
+    )
 
     copy_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     book_isbn: Mapped[str] = mapped_column(
-        String(50), ForeignKey("books.isbn"), nullable=False, index=True
+        String(50), ForeignKey("books.isbn"), nullable=False
     )
     serial: Mapped[int] = mapped_column(Integer, nullable=False)
-    copy_barcode: Mapped[str] = mapped_column(String(50), nullable=False)
+    copy_barcode: Mapped[str] = mapped_column(String(50), nullable=False, unique=True)
     status: Mapped[enum.Enum] = mapped_column(
         Enum(BkCopyStatus), default=BkCopyStatus.AVAILABLE
     )
@@ -146,6 +236,12 @@ class BookCopy(Base):
 
 class BkCopySchedule(Base):
     __tablename__ = "bk_copy_schedules"
+    __table_args__ = (
+        # active schedules of a user, checkout and bulk checkout
+        Index("ix_bk_copy_schedules_user_uid_status", "user_uid", "status"),
+        # overdue active schedules, looked up by the expiry job (app/schedules.py)
+        Index("ix_bk_copy_schedules_status_created_at", "status", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_uid: Mapped[int] = mapped_column(
@@ -158,7 +254,7 @@ class BkCopySchedule(Base):
         String(50), nullable=False, default=generate_schedule_id
     )
     status: Mapped[enum.Enum] = mapped_column(
-        Enum(ScheduleStatus), default=ScheduleStatus.ACTIVE, index=True
+        Enum(ScheduleStatus), default=ScheduleStatus.ACTIVE
     )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
@@ -1,19 +1,26 @@
-from typing import Annotated
+from typing import Annotated, Literal, Optional
 
 from fastapi import APIRouter, Body, Depends, Form, Query, Request, status
+from fastapi.responses import StreamingResponse
 
 from app import services
 from app.core.auth import get_current_active_user, get_current_staff_user
-from app.core.database import AsyncSession, get_session
+from app.core.database import AsyncSession, get_read_session, get_session
 from app.schemas.book import (
     BkCopyLoanResponse,
     BkCopyUpdateResponse,
     BookCopyForm,
     BookCreate,
+    BookListResponse,
+    BookSearchResponse,
     BookResponse,
     BookUpdate,
+    BulkLoanRequest,
+    BulkLoanResponse,
+    BulkLoanReturnResponse,
     FullScheduleInfo,
     ListBkUpdate,
+    ListLoanReturn,
     LoanForm,
     LoanReturnForm,
 )
@@ -21,9 +28,40 @@ from app.schemas.book import (
 books_router = APIRouter(prefix="/books")
 
 
-@books_router.get("")
-async def get_all_books(request: Request):
-    return {"books": []}
+@books_router.get("", response_model=BookListResponse)
+async def get_all_books(
+    request: Request,
+    cursor: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=500)] = 50,
+    author: Annotated[Optional[str], Query()] = None,
+    location: Annotated[Optional[str], Query()] = None,
+    available: Annotated[Optional[bool], Query()] = None,
+    format: Annotated[Literal["json", "ndjson"], Query()] = "json",
+    user_role_exc: tuple = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_session),
+):
+    current_user, role, exc = user_role_exc
+    request.state.exceptions = exc
+    filters = {"author": author, "location": location, "available": available}
+    if format == "ndjson":
+        # everything after the cursor, streamed in id order
+        lines = services.stream_books_service(request, db, cursor, filters)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    return await services.get_books_page_service(request, db, cursor, limit, filters)
+
+
+@books_router.get("/search", response_model=BookSearchResponse)
+async def search_books(
+    request: Request,
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    user_role_exc: tuple = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_session),
+):
+    current_user, role, exc = user_role_exc
+    request.state.exceptions = exc
+    return await services.search_books_service(request, db, q, limit, offset)
 
 
 # tested
@@ -32,7 +70,7 @@ async def get_book_by_ISBN(
     request: Request,
     isbn: Annotated[int, Query()],
     user_role_exc: tuple = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_session),
+    db: AsyncSession = Depends(get_read_session),
 ):
     current_user, role, exc = user_role_exc
     request.state.exceptions = exc
@@ -106,6 +144,21 @@ async def return_book_loan(
     return message
 
 
+@books_router.post("/loan-returns", response_model=BulkLoanReturnResponse)
+async def bulk_return_book_loans(
+    request: Request,
+    data: ListLoanReturn = Body(),
+    staff_user_exc: tuple = Depends(get_current_staff_user),
+    db: AsyncSession = Depends(get_session),
+):
+    staff_user, role, exc = staff_user_exc
+    request.state.exceptions = exc
+    parsed = data.model_dump()
+    return await services.bulk_return_book_loans_service(
+        request, db, parsed["returns"]
+    )
+
+
 # tested
 @books_router.post(
     "/loan-book", response_model=BkCopyLoanResponse, status_code=status.HTTP_201_CREATED
@@ -123,6 +176,20 @@ async def loan_book(
     return loan_info
 
 
+@books_router.post(
+    "/loan-books", response_model=BulkLoanResponse, status_code=status.HTTP_201_CREATED
+)
+async def bulk_loan_books(
+    request: Request,
+    data: BulkLoanRequest = Body(),
+    staff_user_exc: tuple = Depends(get_current_staff_user),
+    db: AsyncSession = Depends(get_session),
+):
+    staff_user, role, exc = staff_user_exc
+    request.state.exceptions = exc
+    return await services.bulk_loan_books_service(request, db, **data.model_dump())
+
+
 @books_router.post(
     "/book-schedule/{isbn}",
     response_model=FullScheduleInfo,
@@ -156,5 +223,21 @@ async def update_bk_copies(
     return await services.update_bk_copies_status(request, db, parsed["book_copies"])
 
 
+# for large inventories: an application/x-ndjson body with one
+# {"copy_barcode", "status"} object per line, applied as it streams in
+@books_router.patch(
+    "/update-bk-copies-status/ndjson", response_model=BkCopyUpdateResponse
+)
+async def update_bk_copies_ndjson(
+    request: Request,
+    staff_user_exc: tuple = Depends(get_current_staff_user),
+    db: AsyncSession = Depends(get_session),
+):
+    staff_user, role, exc = staff_user_exc
+    request.state.exceptions = exc
+    updates = services.ndjson_bk_copy_updates(request.stream())
+    return await services.update_bk_copies_status(request, db, updates)
+
+
 # fastapi depends should return a single value, you can unpack
 # after
@@ -0,0 +1,44 @@
+from datetime import datetime
+from typing import Annotated, Literal, Optional
+
+from fastapi import APIRouter, Depends, Path, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app import services
+from app.core.auth import get_current_admin_user
+from app.core.database import AsyncSession, get_read_session
+
+exports_router = APIRouter(prefix="/exports")
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# full dumps in primary key order, resume an interrupted export by passing
+# the key of the last row received as `cursor`
+@exports_router.get("/{table}")
+async def export_table(
+    request: Request,
+    table: Annotated[Literal["loans", "book_copies", "audit"], Path()],
+    format: Annotated[Literal["ndjson", "csv"], Query()] = "ndjson",
+    gzip: Annotated[bool, Query()] = False,
+    cursor: Annotated[int, Query(ge=0)] = 0,
+    since: Annotated[Optional[datetime], Query()] = None,
+    until: Annotated[Optional[datetime], Query()] = None,
+    admin_user_exc: tuple = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_read_session),
+):
+    admin_user, role, exc = admin_user_exc
+    request.state.exceptions = exc
+    chunks = services.stream_export_service(
+        request, db, table, format, gzip, cursor, since, until
+    )
+    filename = f"{table}.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
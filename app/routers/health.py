@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.database import get_engine, pool_status
+
+logger = logging.getLogger(__name__)
+
+health_router = APIRouter(prefix="/health")
+
+READY_TIMEOUT = 2.0
+
+
+# readiness probe, unauthenticated and not audited (see UNAUDITED_PATHS)
+@health_router.get("/ready")
+async def readiness(engine: AsyncEngine = Depends(get_engine)):
+    try:
+        async with asyncio.timeout(READY_TIMEOUT):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+    except (SQLAlchemyError, OSError, TimeoutError) as e:
+        # driver errors can name the host, database and user, keep them in the log
+        logger.error(f"Readiness check failed: {type(e).__name__}: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={
+                "status": "unavailable",
+                "database": "unavailable",
+                "pool": pool_status(engine),
+            },
+        )
+    return {"status": "ready", "database": "ok", "pool": pool_status(engine)}
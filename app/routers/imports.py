@@ -0,0 +1,38 @@
+from typing import Annotated, Literal, Optional
+
+from fastapi import APIRouter, Depends, File, Query, Request, UploadFile, status
+
+from app import services
+from app.core.auth import get_current_staff_user
+from app.core.database import get_session_factory
+from app.schemas.book import ImportJobResponse
+
+imports_router = APIRouter(prefix="/imports")
+
+
+@imports_router.post(
+    "/books", response_model=ImportJobResponse, status_code=status.HTTP_202_ACCEPTED
+)
+async def import_books(
+    request: Request,
+    file: Annotated[UploadFile, File()],
+    format: Annotated[Optional[Literal["csv", "jsonl"]], Query()] = None,
+    staff_user_exc: tuple = Depends(get_current_staff_user),
+    session_factory=Depends(get_session_factory),
+):
+    staff_user, role, exc = staff_user_exc
+    request.state.exceptions = exc
+    return await services.start_book_import_service(
+        request, file, format, session_factory
+    )
+
+
+@imports_router.get("/{job_id}", response_model=ImportJobResponse)
+async def get_import_job(
+    request: Request,
+    job_id: str,
+    staff_user_exc: tuple = Depends(get_current_staff_user),
+):
+    staff_user, role, exc = staff_user_exc
+    request.state.exceptions = exc
+    return await services.get_import_job_service(request, job_id)
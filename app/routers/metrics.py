@@ -0,0 +1,71 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.audit import audit_writer
+from app.core.database import engine, pool_status, replica_engine
+from app.core.metrics import metrics
+from app.schedules import schedule_expirer
+
+metrics_router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+POOL_GAUGES = {
+    "size": "Connections the pool keeps open",
+    "checked_in": "Idle connections in the pool",
+    "checked_out": "Connections in use",
+    "overflow": "Connections opened beyond the pool size",
+}
+POOL_COUNTERS = {
+    "checkouts": "Connection checkouts",
+    "wait_seconds": "Time spent waiting for a connection",
+    "timeouts": "Checkouts that timed out waiting for a connection",
+}
+
+
+def runtime_samples():
+    """Samples read at scrape time: pools, the audit queue and schedule expiry"""
+    engines = {"primary": engine}
+    if replica_engine is not engine:
+        engines["replica"] = replica_engine
+    for db, db_engine in engines.items():
+        status = pool_status(db_engine)
+        labels = (("db", db),)
+        for key, help_text in POOL_GAUGES.items():
+            if key in status:
+                yield f"db_pool_{key}", "gauge", help_text, labels, status[key]
+        for key, help_text in POOL_COUNTERS.items():
+            if key in status:
+                yield f"db_pool_{key}_total", "counter", help_text, labels, status[key]
+
+    yield (
+        "audit_queue_depth",
+        "gauge",
+        "Audit entries waiting to be written",
+        (),
+        (audit_writer.depth),
+    )
+    for outcome, count in audit_writer.stats.items():
+        yield (
+            "audit_entries_total",
+            "counter",
+            "Audit entries by outcome",
+            (("outcome", outcome),),
+            count,
+        )
+    for key, count in schedule_expirer.stats.items():
+        yield (
+            f"schedule_expiry_{key}_total",
+            "counter",
+            "Book schedule expiry runs, expired schedules, released copies, failures",
+            (),
+            count,
+        )
+
+
+# Prometheus scrape target, unauthenticated and not audited (see UNAUDITED_PATHS)
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.render(runtime_samples()), media_type=PROMETHEUS_CONTENT_TYPE
+    )
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, status, Depends, Form, Request
+from fastapi import APIRouter, status, Depends, Form, Query, Request
+from fastapi.responses import StreamingResponse
 from app import services
 from app.core.auth import get_current_staff_user, get_current_admin_user
-from app.core.database import get_session, AsyncSession
-from typing import Annotated
+from app.core.database import get_read_session, get_session, AsyncSession
+from datetime import datetime
+from typing import Annotated, Literal, Optional
 from app.schemas.token import TokenResponse
 from app.schemas.user import UserCreate, UserLogin, UserListResponse
 
@@ -12,13 +14,32 @@ users_router = APIRouter(prefix='/users')
 @users_router.get('', response_model=UserListResponse)
 async def get_all_non_staff_users(
     request: Request,
+    cursor: Annotated[int, Query(ge=0)]=0,
+    limit: Annotated[int, Query(ge=1, le=500)]=50,
+    is_active: Annotated[Optional[bool], Query()]=None,
+    has_fines: Annotated[Optional[bool], Query()]=None,
+    created_after: Annotated[Optional[datetime], Query()]=None,
+    created_before: Annotated[Optional[datetime], Query()]=None,
+    format: Annotated[Literal['json', 'ndjson'], Query()]='json',
     staff_user_exc: tuple=Depends(get_current_staff_user),
-    db: AsyncSession=Depends(get_session),
+    db: AsyncSession=Depends(get_read_session),
     ):
     
-    staff_user, exc = staff_user_exc
+    staff_user, role, exc = staff_user_exc
     request.state.exceptions = exc
-    users = await services.get_all_non_staff_users_service(request, db)
+    filters = {
+        'is_active': is_active,
+        'has_fines': has_fines,
+        'created_after': created_after,
+        'created_before': created_before
+    }
+    if format == 'ndjson':
+        # export of every patron after the cursor
+        lines = services.stream_non_staff_users_service(request, db, cursor, filters)
+        return StreamingResponse(lines, media_type='application/x-ndjson')
+    users = await services.get_non_staff_users_page_service(
+        request, db, cursor, limit, filters
+    )
     return users
 
 @users_router.post('/create-staff-user')
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import crud
+from app.core.config import Settings
+from app.core.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+settings = Settings()
+
+
+class ScheduleExpirer:
+    """
+    Expires book schedules that were not consumed within `hold_hours` and puts
+    their reserved copies back on the shelf. `run_once` works through every
+    overdue schedule in batches of `batch_size`, one transaction per batch;
+    `start` repeats it every `interval` seconds in the background.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        hold_hours: float = settings.schedule_hold_hours,
+        interval: float = settings.schedule_expiry_interval,
+        batch_size: int = settings.schedule_expiry_batch_size,
+    ):
+        self.session_factory = session_factory
+        self.hold_hours = hold_hours
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stats: Dict[str, int] = {
+            "runs": 0,
+            "expired": 0,
+            "released": 0,
+            "failed": 0,
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        now = now or datetime.now(timezone.utc)
+        return now - timedelta(hours=self.hold_hours)
+
+    async def start(self):
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run(), name="schedule-expirer")
+        logger.info("Schedule expirer started")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info(f"Schedule expirer stopped: {self.stats}")
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """
+        Expires every schedule made before the hold window, returns how many.
+        """
+        cutoff = self.cutoff(now)
+        expired = 0
+        while True:
+            async with self.session_factory() as session:
+                try:
+                    barcodes = await crud.expire_schedules(
+                        session, cutoff, self.batch_size
+                    )
+                    if not barcodes:
+                        break
+                    isbns = Counter(
+                        await crud.release_reserved_copies(session, barcodes)
+                    )
+                    await crud.recount_copy_counters(session, isbns)
+                except SQLAlchemyError:
+                    await session.rollback()
+                    self.stats["failed"] += 1
+                    raise
+                await session.commit()
+            expired += len(barcodes)
+            self.stats["expired"] += len(barcodes)
+            self.stats["released"] += sum(isbns.values())
+            if len(barcodes) < self.batch_size:
+                break
+        self.stats["runs"] += 1
+        if expired:
+            logger.info(f"Expired {expired} book schedules")
+        return expired
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except SQLAlchemyError as e:
+                logger.error(f"Error expiring book schedules: {e}")
+            await asyncio.sleep(self.interval)
+
+
+schedule_expirer = ScheduleExpirer()
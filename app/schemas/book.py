@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, PositiveInt
+from pydantic import BaseModel, ConfigDict, Field, NonNegativeInt, PositiveInt
 
 
 class BookBase(BaseModel):
@@ -15,6 +15,11 @@ class BookCreate(BookBase):
     isbn: str
 
 
+class BookImportRow(BookCreate):
+    # copies to add, not a total: importing the row again adds them again
+    copies: NonNegativeInt = 0
+
+
 class BookUpdate(BaseModel):
     title: Optional[str] = None
     author: Optional[str] = None
@@ -26,11 +31,39 @@ class BookResponse(BookBase):
     id: PositiveInt
     isbn: str
     library_barcode: str
+    copies_total: int = 0
+    copies_available: int = 0
+    copies_borrowed: int = 0
+    copies_reserved: int = 0
+    copies_in_check: int = 0
+    copies_lost: int = 0
+    copies_damaged: int = 0
     created_at: datetime
     updated_at: Optional[datetime] = None
     model_config = ConfigDict(from_attributes=True)
 
 
+class BookSummary(BaseModel):
+    id: PositiveInt
+    title: str
+    author: str
+    isbn: str
+    library_barcode: str
+    available: bool
+    location: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class BookListResponse(BaseModel):
+    books: list[BookSummary]
+    next_cursor: Optional[int] = None
+
+
+class BookSearchResponse(BaseModel):
+    books: list[BookSummary]
+    next_offset: Optional[int] = None
+
+
 class BookCopyForm(BaseModel):
     isbn: str
     quantity: PositiveInt
@@ -68,6 +101,27 @@ class LoanReturnForm(BaseModel):
     loan_id: str
 
 
+class ListLoanReturn(BaseModel):
+    returns: list[LoanReturnForm] = Field(max_length=1000)
+
+
+class LoanReturnResult(BaseModel):
+    loan_id: str
+    bk_copy_barcode: str
+    success: bool
+    detail: Optional[str] = None
+    status: Optional[str] = None
+    days_late: int = 0
+    fine: int = 0
+
+
+class BulkLoanReturnResponse(BaseModel):
+    results: list[LoanReturnResult]
+    num_returned: int
+    num_failed: int
+    total_fines: int
+
+
 class BkCopyResponse(BaseModel):
     book_isbn: str
     copy_barcode: str
@@ -82,6 +136,29 @@ class BkCopyLoanResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class BulkLoanRequest(BaseModel):
+    user_uid: str
+    isbns: list[str] = Field(default_factory=list, max_length=20)
+    copy_barcodes: list[str] = Field(default_factory=list, max_length=20)
+
+
+class BulkLoanItemResult(BaseModel):
+    item: str
+    kind: Literal["isbn", "copy_barcode"]
+    success: bool
+    detail: Optional[str] = None
+    loan: Optional[LoanResponse] = None
+    book_copy: Optional[BkCopyResponse] = None
+    was_scheduled: bool = False
+
+
+class BulkLoanResponse(BaseModel):
+    user_uid: str
+    results: list[BulkLoanItemResult]
+    num_loaned: int
+    num_failed: int
+
+
 class BkCopyScheduleInfo(BaseModel):
     user_uid: str
     bk_copy_barcode: str
@@ -112,3 +189,23 @@ class BkCopyUpdateResponse(BaseModel):
     not_found_barcodes: list[str]
     num_not_found: int
     model_config = ConfigDict(from_attributes=True)
+
+
+class ImportRowError(BaseModel):
+    line: int
+    isbn: Optional[str] = None
+    error: str
+
+
+class ImportJobResponse(BaseModel):
+    job_id: str
+    source: str
+    status: Literal["pending", "running", "completed", "failed"]
+    rows_read: int
+    books_imported: int
+    copies_created: int
+    rows_failed: int
+    errors: list[ImportRowError]
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    model_config = ConfigDict(from_attributes=True)
@@ -27,7 +27,8 @@ class UserResponse(UserBase):
 
     model_config = ConfigDict(from_attributes=True)
 
-class UserListResponse(UserBase):
+class UserListResponse(BaseModel):
     users: List[UserResponse]
+    next_cursor: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
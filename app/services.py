@@ -1,34 +1,51 @@
+import enum
+import io
 import logging
-from datetime import timedelta, datetime, timezone
-from fastapi import HTTPException, status, Request
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status, Request, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from app import crud
+from pydantic import ValidationError
+from app import crud, imports
 from app.utils import (
-    generate_book_copy_barcode,
+    chunked,
+    compute_loan_fine,
+    csv_lines,
     generate_staff_id,
+    gzip_chunks,
+    loan_return_time,
+    ndjson_lines,
+    ndjson_records,
     reraise_exceptions,
-    safe_datetime_compare,
+    search_terms,
 )
 from app.models import (
     BkCopySchedule,
     Book,
-    BookCopy,
     User,
     BkCopyStatus,
-    Loan,
-    ScheduleStatus,
     Audit,
     LoanStatus,
 )
-from app.core.auth import authenticate_user, create_access_token, hash_password
+from app.core.auth import (
+    authenticate_user,
+    create_access_token,
+    hash_password_async,
+)
+from app.core.principals import Principal, principal_cache
 from app.core.config import Settings
-from typing import List
+from app.schemas.book import BkCopyUpdate
+from collections import Counter, defaultdict
+from typing import AsyncIterable, Iterable, List, Optional
 
 logger = logging.getLogger(__name__)
 
 settings = Settings()
 
+# loan eligibility limits, been a bit easy here
+MAX_ACTIVE_LOANS = 3
+MAX_FINE_BALANCE = 10
+
 loan_eligibility_exception = HTTPException(
     status.HTTP_403_FORBIDDEN, detail="User is not eligble for anymore loans"
 )
@@ -72,6 +89,7 @@ async def create_new_book_service(
         reraise_exceptions(request)
         book = Book(**book_data)
         await crud.create_new_book(db, book)
+        await crud.index_book_text(db, book)
         logger.info(f"New book created: {book_data['title']}")
     except IntegrityError as e:
         logger.warning(f"Integrity error creating book: {e}")
@@ -105,9 +123,117 @@ async def get_book_by_isbn_service(request: Request, db: AsyncSession, isbn: int
         return book
 
 
+async def get_books_page_service(
+    request: Request, db: AsyncSession, cursor: int, limit: int, filters: dict
+):
+    try:
+        reraise_exceptions(request)
+        # one extra row tells whether there is a next page
+        rows = await crud.get_books_page(db, cursor, limit + 1, **filters)
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        logger.error(f"DataBase error listing books: {e}")
+        await db.rollback()
+        raise internal_error_exception
+    else:
+        books = rows[:limit]
+        next_cursor = books[-1]["id"] if len(rows) > limit else None
+        return {"books": books, "next_cursor": next_cursor}
+
+
+def stream_books_service(
+    request: Request, db: AsyncSession, cursor: int, filters: dict
+):
+    reraise_exceptions(request)
+    return ndjson_lines(crud.stream_books(db, cursor, **filters))
+
+
+async def _export_values(rows):
+    # enums as their stored value, everything else is left to the encoder
+    async for row in rows:
+        yield {
+            key: value.value if isinstance(value, enum.Enum) else value
+            for key, value in row.items()
+        }
+
+
+def export_chunks(
+    db: AsyncSession,
+    table_name: str,
+    fmt: str,
+    compress: bool,
+    cursor: int,
+    since: Optional[datetime],
+    until: Optional[datetime],
+):
+    """
+    Encoded chunks of a full export of `table_name`, see crud.stream_export.
+    Raises ValueError for a time range on a table without a timestamp.
+    """
+    table, timestamp = crud.EXPORT_TABLES[table_name]
+    if timestamp is None and (since or until):
+        raise ValueError(f"{table_name} has no timestamp to filter on")
+    rows = _export_values(
+        crud.stream_export(
+            db, table_name, cursor, since, until, settings.export_batch_size
+        )
+    )
+    if fmt == "csv":
+        chunks = csv_lines(rows, [column.name for column in table.columns])
+    else:
+        chunks = ndjson_lines(rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def stream_export_service(
+    request: Request,
+    db: AsyncSession,
+    table_name: str,
+    fmt: str,
+    compress: bool,
+    cursor: int,
+    since: Optional[datetime],
+    until: Optional[datetime],
+):
+    reraise_exceptions(request)
+    try:
+        return export_chunks(db, table_name, fmt, compress, cursor, since, until)
+    except ValueError as e:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+
+
+async def search_books_service(
+    request: Request, db: AsyncSession, query: str, limit: int, offset: int
+):
+    try:
+        reraise_exceptions(request)
+        terms = search_terms(query)
+        if not terms:
+            raise HTTPException(
+                status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail="Search query has no searchable words",
+            )
+        # one extra row tells whether there is a next page
+        rows = await crud.search_books(db, terms, limit + 1, offset)
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        logger.error(f"DataBase error searching books: {e}")
+        await db.rollback()
+        raise internal_error_exception
+    else:
+        next_offset = offset + limit if len(rows) > limit else None
+        return {"books": rows[:limit], "next_offset": next_offset}
+
+
 # tested
 async def update_book_service(
-    request: Request, db: AsyncSession, update_data: dict, isbn: int, current_user: User
+    request: Request,
+    db: AsyncSession,
+    update_data: dict,
+    isbn: int,
+    current_user: Principal,
 ):
     try:
         reraise_exceptions(request)
@@ -115,6 +241,7 @@ async def update_book_service(
         if not book:
             raise book_not_found_exception
         await crud.update_book(db, book, update_data)
+        await crud.index_book_text(db, book)
         logger.info(f"Book-{book.library_barcode} updated")
     except IntegrityError as e:
         await db.rollback()
@@ -143,25 +270,21 @@ async def add_book_copies_service(
 ):
     try:
         reraise_exceptions(request)
-        book_copies = []
-        last_serial = 0
         book = await crud.get_book_by_isbn(db, isbn)
         if not book:
             raise book_not_found_exception
-        book_lib_barcode = book.library_barcode
-        # get last bookcopy where isbn == book.isbn
-        last_book_copy = await crud.get_last_book_copy(db, book)
-        if last_book_copy:
-            last_serial = last_book_copy.serial
-        for i in range(quantity):
-            bk_copy_serial = last_serial + 1
-            barcode = generate_book_copy_barcode(book_lib_barcode, bk_copy_serial)
-            book_copy = BookCopy(
-                book_isbn=isbn, serial=bk_copy_serial, copy_barcode=barcode
-            )
-            book_copies.append(book_copy)
-            last_serial += 1
-        await crud.add_book_copies(db, book_copies)
+        first_serial = await crud.reserve_copy_serials(db, book.isbn, quantity)
+        await crud.insert_book_copies(
+            db,
+            book.isbn,
+            book.library_barcode,
+            first_serial,
+            quantity,
+            chunk_size=settings.bulk_insert_chunk_size,
+        )
+        await crud.shift_copy_counters(
+            db, isbn, None, BkCopyStatus.AVAILABLE, count=quantity
+        )
         logger.info(f"Created {quantity} copies of {isbn}")
     except IntegrityError as e:
         await db.rollback()
@@ -186,67 +309,53 @@ async def loan_book_service(
 ):
     created_loan = None
     updated_bk_copy = None
+    bk_schedule_is_available = False
     try:
-        user = await crud.get_user_by_uid(db, user_uid)
-        if not user:
+        # eligibility and the user's schedule for this isbn in one query
+        context = await crud.get_checkout_context(db, isbn, user_uid)
+        if not context:
             raise user_not_found_exception
-        bk_schedule_is_available = (
-            False  # determines which return is used depending on if bk_schedule is None
-        )
-        user_loans = await crud.get_user_active_loans(db, user.user_uid)
-        if (len(user_loans) >= 3) or (user.fine_balance >= 10):  # been a bit easy here
+        if (context.active_loans >= MAX_ACTIVE_LOANS) or (
+            context.fine_balance >= MAX_FINE_BALANCE
+        ):
             raise loan_eligibility_exception
 
-        bk_schedule = await crud.get_active_schedule(
-            db, isbn, user.user_uid
-        )  # returns first record
-        if bk_schedule:
-            reserved_bk_copy = await crud.get_reserved_bk_copy_by_barcode(
-                db, bk_schedule.bk_copy_barcode
+        if context.schedule_id is not None:
+            # only succeeds while the scheduled copy is still reserved
+            updated_bk_copy = await crud.claim_book_copy(
+                db,
+                BkCopyStatus.BORROWED,
+                barcode=context.schedule_barcode,
+                from_status=BkCopyStatus.RESERVED,
             )
-            if not reserved_bk_copy:
-                raise HTTPException(
-                    status.HTTP_404_NOT_FOUND, detail="Scheduled book copy not found"
-                )
-            if reserved_bk_copy.status != BkCopyStatus.RESERVED:
+            if not updated_bk_copy:
                 raise HTTPException(
                     status.HTTP_409_CONFLICT,
                     detail="Scheduled book copy is not available",
                 )
-            loan_data = {
-                "user_uid": user.user_uid,
-                "bk_copy_barcode": reserved_bk_copy.copy_barcode,
-            }
-            loan = Loan(**loan_data)
-            created_loan = await crud.create_loan(db, loan)
-            updated_bk_copy = await crud.update_bk_copy(
-                db, reserved_bk_copy, {"status": BkCopyStatus.BORROWED}
-            )
-            await crud.update_bk_schedule(
-                db, bk_schedule, {"status": ScheduleStatus.CONSUMED}
-            )
-            logger.info("Retrieved scheduled book copy")
+            await crud.consume_schedules(db, [context.schedule_id])
+            from_status = BkCopyStatus.RESERVED
             bk_schedule_is_available = True
-
-        if not bk_schedule_is_available:
-            book_copy = await crud.get_book_copy(db, isbn)
-            if not book_copy:
+            logger.info("Retrieved scheduled book copy")
+        else:
+            # claimed atomically, concurrent checkouts never get the same copy
+            updated_bk_copy = await crud.claim_book_copy(
+                db, BkCopyStatus.BORROWED, isbn=isbn
+            )
+            if not updated_bk_copy:
                 raise HTTPException(
                     status.HTTP_404_NOT_FOUND,
                     detail=f"There are no available copies of ISBN-{isbn} currently and user does not have any active schedules",
                 )
-            loan_data = {
-                "user_uid": user.user_uid,
-                "bk_copy_barcode": book_copy.copy_barcode,
-            }
-
-            loan = Loan(**loan_data)
-            created_loan = await crud.create_loan(db, loan)
-            updated_bk_copy = await crud.update_bk_copy(
-                db, book_copy, {"status": BkCopyStatus.BORROWED}
-            )
-
+            from_status = BkCopyStatus.AVAILABLE
             logger.info("Retrieved book copy")
+
+        loan_data = {
+            "user_uid": context.user_uid,
+            "bk_copy_barcode": updated_bk_copy.copy_barcode,
+        }
+        created_loan = await crud.create_loan(db, loan_data)
+        await crud.shift_copy_counters(db, isbn, from_status, BkCopyStatus.BORROWED)
     except IntegrityError as e:
         logger.warning(f"Integrity error fetching book_copy: {e}")
         await db.rollback()
@@ -261,16 +370,171 @@ async def loan_book_service(
         raise internal_error_exception
     else:
         await db.commit()
-        if bk_schedule_is_available:
-            return {
-                "loan": created_loan,
-                "book_copy": updated_bk_copy,
-                "was_scheduled": True,
-            }
         return {
             "loan": created_loan,
             "book_copy": updated_bk_copy,
-            "was_scheduled": False,
+            "was_scheduled": bk_schedule_is_available,
+        }
+
+
+# tested
+async def bulk_loan_books_service(
+    request: Request,
+    db: AsyncSession,
+    user_uid: str,
+    isbns: List[str],
+    copy_barcodes: List[str],
+):
+    """
+    Checks out a stack of items for one user in a single transaction.
+    Eligibility is checked once, copies are claimed with at most two set-based
+    UPDATEs and the loans are written with one multi-row insert. Items that
+    cannot be lent are reported individually instead of failing the request.
+    """
+    reraise_exceptions(request)
+    items = [("isbn", isbn) for isbn in isbns] + [
+        ("copy_barcode", barcode) for barcode in copy_barcodes
+    ]
+    if not items:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_CONTENT, detail="No items to check out"
+        )
+    results = [{"item": value, "kind": kind, "success": False} for kind, value in items]
+    try:
+        user = await crud.get_loan_eligibility(db, user_uid)
+        if not user:
+            raise user_not_found_exception
+        if (user.active_loans >= MAX_ACTIVE_LOANS) or (
+            user.fine_balance >= MAX_FINE_BALANCE
+        ):
+            raise loan_eligibility_exception
+
+        # items past the user's remaining allowance are not attempted
+        allowance = MAX_ACTIVE_LOANS - user.active_loans
+        attempted = []
+        seen_barcodes = set()
+        for result in results:
+            if result["kind"] == "copy_barcode":
+                if result["item"] in seen_barcodes:
+                    result["detail"] = "Duplicate book copy"
+                    continue
+                seen_barcodes.add(result["item"])
+            if len(attempted) >= allowance:
+                result["detail"] = "Loan limit reached"
+                continue
+            attempted.append(result)
+
+        attempted_isbns = {r["item"] for r in attempted if r["kind"] == "isbn"}
+        attempted_barcodes = {
+            r["item"] for r in attempted if r["kind"] == "copy_barcode"
+        }
+        schedules = await crud.get_active_schedules(
+            db, user.user_uid, attempted_isbns, attempted_barcodes
+        )
+        schedule_by_barcode = {row.bk_copy_barcode: row.id for row in schedules}
+        schedules_by_isbn = defaultdict(list)
+        for row in schedules:
+            # a reserved copy asked for by barcode is not handed out twice
+            if row.bk_copy_barcode not in attempted_barcodes:
+                schedules_by_isbn[row.book_isbn].append(row.bk_copy_barcode)
+
+        # reserved copies of the user are lent first, see loan_book_service
+        isbn_counts = Counter()
+        by_status = {BkCopyStatus.AVAILABLE: set(), BkCopyStatus.RESERVED: set()}
+        for result in attempted:
+            if result["kind"] == "copy_barcode":
+                barcode = result["item"]
+            elif schedules_by_isbn[result["item"]]:
+                barcode = schedules_by_isbn[result["item"]].pop(0)
+            else:
+                isbn_counts[result["item"]] += 1
+                continue
+            if barcode in schedule_by_barcode:
+                by_status[BkCopyStatus.RESERVED].add(barcode)
+                result["was_scheduled"] = True
+            else:
+                by_status[BkCopyStatus.AVAILABLE].add(barcode)
+            result["barcode"] = barcode
+
+        claimed = {}
+        if any(by_status.values()):
+            for bk_copy in await crud.claim_book_copies_by_barcode(
+                db, BkCopyStatus.BORROWED, by_status
+            ):
+                claimed[bk_copy.copy_barcode] = bk_copy
+        claimed_by_isbn = defaultdict(list)
+        if isbn_counts:
+            for bk_copy in await crud.claim_book_copies(
+                db, BkCopyStatus.BORROWED, isbn_counts
+            ):
+                claimed_by_isbn[bk_copy.book_isbn].append(bk_copy)
+
+        lent = []
+        for result in attempted:
+            barcode = result.pop("barcode", None)
+            if barcode is not None:
+                bk_copy = claimed.get(barcode)
+            elif claimed_by_isbn[result["item"]]:
+                bk_copy = claimed_by_isbn[result["item"]].pop()
+            else:
+                bk_copy = None
+            if bk_copy is None:
+                result["detail"] = (
+                    f"There are no available copies of ISBN-{result['item']} currently"
+                    if result["kind"] == "isbn"
+                    else "Book copy not found or not available"
+                )
+                result.pop("was_scheduled", None)
+                continue
+            result["book_copy"] = bk_copy
+            lent.append(result)
+
+        if lent:
+            consumed = [
+                schedule_by_barcode[r["book_copy"].copy_barcode]
+                for r in lent
+                if r.get("was_scheduled")
+            ]
+            if consumed:
+                await crud.consume_schedules(db, consumed)
+            loans = await crud.create_loans(
+                db,
+                [
+                    {
+                        "user_uid": user.user_uid,
+                        "bk_copy_barcode": r["book_copy"].copy_barcode,
+                    }
+                    for r in lent
+                ],
+            )
+            loan_by_barcode = {loan.bk_copy_barcode: loan for loan in loans}
+            for result in lent:
+                loan = loan_by_barcode[result["book_copy"].copy_barcode]
+                result.update({"success": True, "loan": loan})
+            await crud.recount_copy_counters(
+                db, {r["book_copy"].book_isbn for r in lent}
+            )
+    except IntegrityError as e:
+        logger.warning(f"Integrity error during bulk checkout: {e}")
+        await db.rollback()
+        raise HTTPException(
+            status.HTTP_409_CONFLICT, detail="Loan with this id already exists"
+        )
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        logger.error(f"DataBase error during bulk checkout: {e}")
+        await db.rollback()
+        raise internal_error_exception
+    else:
+        await db.commit()
+        num_loaned = sum(r["success"] for r in results)
+        logger.info(f"Bulk checkout lent {num_loaned} of {len(results)} items")
+        return {
+            "user_uid": user.user_uid,
+            "results": results,
+            "num_loaned": num_loaned,
+            "num_failed": len(results) - num_loaned,
         }
 
 
@@ -283,7 +547,7 @@ async def create_user_service(
     try:
         # reraise_exceptions(request)
         data = user_data.copy()
-        data["password"] = hash_password(data["password"])
+        data["password"] = await hash_password_async(data["password"])
         user = await crud.create_new_user(db, User(**data))
         request.state.actor = user
         logger.info("Created new user successfully")
@@ -299,6 +563,7 @@ async def create_user_service(
         raise internal_error_exception  # update exceptions
     else:
         await db.commit()
+        principal_cache.invalidate(email=user.email, user_uid=user.user_uid)
         return {"message": "User created successfully", "user_uid": user.user_uid}
 
 
@@ -337,21 +602,30 @@ async def login_user_service(
         return {"access_token": token, "token_type": "bearer"}
 
 
-async def get_all_non_staff_users_service(
-    request: Request,
-    db: AsyncSession,
+async def get_non_staff_users_page_service(
+    request: Request, db: AsyncSession, cursor: int, limit: int, filters: dict
 ):
     try:
         reraise_exceptions(request)
-        users = await crud.get_all_non_staff_users(db)
-        return users
+        # one extra row tells whether there is a next page
+        rows = await crud.get_non_staff_users_page(db, cursor, limit + 1, **filters)
     except HTTPException:
-        await db.rollback()
         raise
     except SQLAlchemyError as e:
-        await db.rollback()  # is rollback even necessary here?
+        await db.rollback()
         logger.error(f"DataBase error fetching users: {e}")
         raise internal_error_exception
+    else:
+        users = rows[:limit]
+        next_cursor = users[-1]["id"] if len(rows) > limit else None
+        return {"users": users, "next_cursor": next_cursor}
+
+
+def stream_non_staff_users_service(
+    request: Request, db: AsyncSession, cursor: int, filters: dict
+):
+    reraise_exceptions(request)
+    return ndjson_lines(crud.stream_non_staff_users(db, cursor, **filters))
 
 
 async def return_book_loan_service(
@@ -375,6 +649,10 @@ async def return_book_loan_service(
                 status.HTTP_422_UNPROCESSABLE_CONTENT,
                 detail="Book-copy-barcode not the same as stated by loan",
             )
+        if loan.status != LoanStatus.ACTIVE:
+            raise HTTPException(
+                status.HTTP_409_CONFLICT, detail="Loan is not active"
+            )
 
         book_returned = await crud.get_book_copy_by_barcode(db, bk_copy_barcode_)
         if not book_returned:
@@ -385,22 +663,21 @@ async def return_book_loan_service(
                 detail="This book copy is not currently on loan",
             )
         await crud.update_bk_copy(db, book_returned, {"status": BkCopyStatus.IN_CHECK})
+        await crud.shift_copy_counters(
+            db, book_returned.book_isbn, BkCopyStatus.BORROWED, BkCopyStatus.IN_CHECK
+        )
 
-        returned_at = datetime.now(timezone.utc).replace(
-            minute=0, second=0, microsecond=0
-        )  # + timedelta(days=14)
+        returned_at = loan_return_time()
         loan_status = LoanStatus.RETURNED
-        if safe_datetime_compare(returned_at, loan.due_at):  # overdue
+        fined, days_deltas, fine_fee = compute_loan_fine(returned_at, loan.due_at)
+        if fined:  # overdue
             loan_status = LoanStatus.RETURNED_LATE
-            days_deltas = (returned_at.date() - loan.due_at.date()).days
-            fine = 100 * days_deltas
-            fine_fee = fine
-            fined = True
-            user = await crud.get_user_by_id(db, loan.user_id)
-            if not user:
-                raise user_not_found_exception
-            updated_fine = fine + user.fine_balance
-            await crud.update_user(db, user, update_data={"fine_balance": updated_fine})
+            # part of the fine may already have been accrued,
+            # see accrue_loan_fines_service
+            if fine_fee > loan.fine_accrued:
+                await crud.add_user_fines(
+                    db, {loan.user_uid: fine_fee - loan.fine_accrued}
+                )
 
         loan_data = {"status": loan_status, "returned_at": returned_at}
         await crud.update_loan(db, loan, loan_data)
@@ -424,9 +701,166 @@ async def return_book_loan_service(
         )
 
 
+async def bulk_return_book_loans_service(
+    request: Request, db: AsyncSession, returns: List[dict]
+):
+    """
+    Clears a batch of loans (a book-drop bin) in one transaction. Loans and
+    copies are resolved with one IN query, fines are computed in one pass and
+    summed per user, copies, loans and fine balances are then written with
+    set-based UPDATEs. Every item gets its own result.
+    """
+    reraise_exceptions(request)
+    if not returns:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_CONTENT, detail="No loans to return"
+        )
+    results = [
+        {
+            "loan_id": item["loan_id"],
+            "bk_copy_barcode": item["bk_copy_barcode"],
+            "success": False,
+        }
+        for item in returns
+    ]
+    returned_at = loan_return_time()
+    try:
+        loans = {
+            row.loan_id: row
+            for row in await crud.get_loans_for_return(
+                db, {item["loan_id"] for item in returns}
+            )
+        }
+        candidates = []
+        seen = set()
+        for result in results:
+            loan = loans.get(result["loan_id"])
+            if result["loan_id"] in seen:
+                result["detail"] = "Duplicate loan"
+            elif not loan:
+                result["detail"] = "Loan not found"
+            elif result["bk_copy_barcode"] != loan.bk_copy_barcode:
+                result["detail"] = "Book-copy-barcode not the same as stated by loan"
+            elif loan.status != LoanStatus.ACTIVE:
+                # its copy may be borrowed again, under a newer loan
+                result["detail"] = "Loan is not active"
+            elif loan.copy_status is None:
+                result["detail"] = "Book copy not found"
+            elif loan.copy_status != BkCopyStatus.BORROWED:
+                result["detail"] = "This book copy is not currently on loan"
+            else:
+                candidates.append(result)
+            seen.add(result["loan_id"])
+
+        checked_in = set()
+        if candidates:
+            checked_in = await crud.check_in_book_copies(
+                db, [r["bk_copy_barcode"] for r in candidates]
+            )
+        loan_ids = {LoanStatus.RETURNED: [], LoanStatus.RETURNED_LATE: []}
+        fines = Counter()
+        isbns = set()
+        for result in candidates:
+            if result["bk_copy_barcode"] not in checked_in:
+                # returned by someone else since it was read
+                result["detail"] = "This book copy is not currently on loan"
+                continue
+            loan = loans[result["loan_id"]]
+            late, days_late, fine = compute_loan_fine(returned_at, loan.due_at)
+            loan_status = LoanStatus.RETURNED_LATE if late else LoanStatus.RETURNED
+            loan_ids[loan_status].append(loan.loan_id)
+            if fine > loan.fine_accrued:
+                fines[loan.user_uid] += fine - loan.fine_accrued
+            isbns.add(loan.book_isbn)
+            result.update(
+                {
+                    "success": True,
+                    "status": loan_status.value,
+                    "days_late": days_late,
+                    "fine": fine,
+                }
+            )
+
+        for loan_status, ids in loan_ids.items():
+            if ids:
+                await crud.close_loans(db, ids, loan_status, returned_at)
+        if fines:
+            await crud.add_user_fines(db, fines)
+        if isbns:
+            await crud.recount_copy_counters(db, isbns)
+    except HTTPException:
+        await db.rollback()
+        raise
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"DataBase error clearing loans: {e}")
+        raise internal_error_exception
+    else:
+        await db.commit()
+        num_returned = sum(r["success"] for r in results)
+        logger.info(f"Bulk return cleared {num_returned} of {len(results)} loans")
+        return {
+            "results": results,
+            "num_returned": num_returned,
+            "num_failed": len(results) - num_returned,
+            "total_fines": sum(r.get("fine", 0) for r in results),
+        }
+
+
+async def accrue_loan_fines_service(
+    db: AsyncSession,
+    now: Optional[datetime] = None,
+    batch_size: int = settings.fine_accrual_batch_size,
+):
+    """
+    Brings the fine balance of users with overdue loans up to date, meant to
+    run nightly. Overdue active loans are read in batches; each batch gets
+    its fines computed in one pass, written back as `fine_accrued` in one
+    executemany and added to the users in one UPDATE, so a rerun only
+    charges the days that passed since the last one. Commits per batch.
+    """
+    now = now or loan_return_time()
+    totals = {"loans": 0, "users": 0, "fines": 0}
+    users = set()
+    after = None
+    try:
+        while True:
+            loans = await crud.get_overdue_loans(db, now, batch_size, after)
+            if not loans:
+                break
+            after = (loans[-1].due_at, loans[-1].id)
+            accrued = {}
+            fines = Counter()
+            for loan in loans:
+                _, _, fine = compute_loan_fine(now, loan.due_at)
+                if fine > loan.fine_accrued:
+                    accrued[loan.id] = fine
+                    fines[loan.user_uid] += fine - loan.fine_accrued
+            if accrued:
+                await crud.set_accrued_fines(db, accrued)
+                await crud.add_user_fines(db, fines)
+            # also releases the row locks of a batch with nothing to charge
+            await db.commit()
+            totals["loans"] += len(accrued)
+            totals["fines"] += sum(fines.values())
+            users.update(fines)
+            if len(loans) < batch_size:
+                break
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"DataBase error accruing loan fines: {e}")
+        raise
+    totals["users"] = len(users)
+    logger.info(
+        f"Accrued {totals['fines']} in fines on {totals['loans']} overdue loans "
+        f"of {totals['users']} users"
+    )
+    return totals
+
+
 # tested
 async def schedule_book_copy_service(
-    request: Request, db: AsyncSession, isbn: int, current_user: User
+    request: Request, db: AsyncSession, isbn: int, current_user: Principal
 ):
     try:
         reraise_exceptions(request)
@@ -434,12 +868,12 @@ async def schedule_book_copy_service(
         if (len(user_loans) >= 3) or (current_user.fine_balance >= 10):
             raise schd_eligibility_exception
 
-        book_copy = await crud.get_book_copy(db, isbn)
+        book_copy = await crud.claim_book_copy(db, BkCopyStatus.RESERVED, isbn=isbn)
         if not book_copy:
             raise book_not_found_exception
 
-        await crud.update_bk_copy(
-            db, book_copy, update_data={"status": BkCopyStatus.RESERVED}
+        await crud.shift_copy_counters(
+            db, isbn, BkCopyStatus.AVAILABLE, BkCopyStatus.RESERVED
         )
         schedule_data = {
             "user_uid": current_user.user_uid,
@@ -463,11 +897,47 @@ async def schedule_book_copy_service(
         await db.commit()
         return {
             "message": "Schedule has been successfuly created",
-            "note": "All schedules that have'nt been consumed will be cleared by 6pm",
+            "note": (
+                "Schedules that are not consumed expire after "
+                f"{settings.schedule_hold_hours:g} hours"
+            ),
             "schedule_info": schedule,
         }
 
 
+async def reconcile_copy_counters_service(db: AsyncSession):
+    try:
+        books = await crud.recount_copy_counters(db)
+        logger.info(f"Reconciled copy counters of {books} books")
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"DataBase error reconciling copy counters: {e}")
+        raise
+    else:
+        await db.commit()
+        return books
+
+
+async def upgrade_schema_service(db: AsyncSession):
+    try:
+        added = await crud.upgrade_schema(db)
+        for name in added:
+            logger.info(f"Upgraded schema, added {name}")
+        if any(name.startswith("books.copies_") for name in added):
+            # new counter columns start out at 0
+            await crud.recount_copy_counters(db)
+        # create_all skips the search index when books already existed
+        if await crud.create_book_search_index(db):
+            await crud.rebuild_book_search_index(db)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"DataBase error upgrading schema: {e}")
+        raise
+    else:
+        await db.commit()
+        return added
+
+
 async def create_audit_service(db: AsyncSession, details: dict):
     try:
         audit = Audit(**details)
@@ -483,6 +953,17 @@ async def create_audit_service(db: AsyncSession, details: dict):
         await db.commit()
 
 
+async def create_audits_service(db: AsyncSession, entries: List[dict]):
+    try:
+        await crud.add_audits(db, entries)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"DataBase error creating {len(entries)} audits: {e}")
+        raise
+    else:
+        await db.commit()
+
+
 async def create_staff_user_service(
     request: Request,
     db: AsyncSession,
@@ -491,7 +972,7 @@ async def create_staff_user_service(
     try:
         reraise_exceptions(request)
         data = user_data.copy()
-        data["password"] = hash_password(data["password"])
+        data["password"] = await hash_password_async(data["password"])
         data["user_uid"] = generate_staff_id()
         user = await crud.create_new_user(db, User(**data))
         logger.info("Created new staff user successfully")
@@ -507,33 +988,70 @@ async def create_staff_user_service(
         raise internal_error_exception  # update exceptions
     else:
         await db.commit()
+        principal_cache.invalidate(email=user.email, user_uid=user.user_uid)
         msg = {"message": "Staff user created successfully", "user_uid": user.user_uid}
         request.state.msg = msg
         return msg
 
 
-async def update_bk_copies_status(request: Request, db: AsyncSession, data: List[dict]):
+async def ndjson_bk_copy_updates(chunks: AsyncIterable[bytes]):
+    """
+    Validated `BkCopyUpdate` items of a streamed NDJSON body, one per line.
+    """
+    try:
+        async for line_number, record in ndjson_records(chunks):
+            try:
+                yield BkCopyUpdate.model_validate(record).model_dump()
+            except ValidationError as e:
+                raise HTTPException(
+                    status.HTTP_422_UNPROCESSABLE_CONTENT,
+                    detail=(
+                        f"Invalid book copy update on line {line_number}: "
+                        f"{e.errors()[0]['msg']}"
+                    ),
+                )
+    except ValueError as e:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"Invalid NDJSON body: {e}"
+        )
+
+
+async def update_bk_copies_status(
+    request: Request,
+    db: AsyncSession,
+    data: Iterable[dict] | AsyncIterable[dict],
+):
+    """
+    Applies `data` in chunks with one UPDATE ... WHERE copy_barcode IN (...)
+    per target status, later items for a barcode win. `data` may be an async
+    iterable so streamed bodies are never held in memory as a whole.
+    """
+    requested = set()
+    found = set()
+    isbns = set()
     try:
         reraise_exceptions(request)
-        barcodes = {item["copy_barcode"] for item in data}  # remove duplicates
-        book_copies = await crud.get_bk_copies_by_barcode(db, barcodes)
-        if not book_copies:
+        async for chunk in chunked(data, settings.bulk_update_chunk_size):
+            latest = {item["copy_barcode"]: item["status"] for item in chunk}
+            by_status = defaultdict(list)
+            for barcode, copy_status in latest.items():
+                by_status[BkCopyStatus[copy_status]].append(barcode)
+            for copy_status, barcodes in by_status.items():
+                for barcode, isbn in await crud.set_bk_copies_status(
+                    db, copy_status, barcodes
+                ):
+                    found.add(barcode)
+                    isbns.add(isbn)
+            requested.update(latest)
+        if not found:
             raise HTTPException(
                 status.HTTP_404_NOT_FOUND,
                 detail="No book copies found for the provided barcodes",
             )
-        fetched_barcodes = {bk.copy_barcode for bk in book_copies}
-        not_found = barcodes - fetched_barcodes
-
-        filtered_data = [
-            item for item in data if item["copy_barcode"] in fetched_barcodes
-        ]
-        bk_map = {bk.copy_barcode: bk for bk in book_copies}
-        ordered_copies = [bk_map[item["copy_barcode"]] for item in filtered_data]
-        book_copies = list(book_copies)
-
-        await crud.update_bk_copies_status(db, ordered_copies, filtered_data)
+        async for chunk in chunked(isbns, settings.bulk_update_chunk_size):
+            await crud.recount_copy_counters(db, chunk)
     except HTTPException:
+        await db.rollback()
         raise
     except SQLAlchemyError as e:
         logger.error(f"DataBase error updating book_copies: {e}")
@@ -541,10 +1059,43 @@ async def update_bk_copies_status(request: Request, db: AsyncSession, data: List
         raise internal_error_exception  # update exceptions
     else:
         await db.commit()
+        not_found = requested - found
         msg = {
-            "message": f"Updated {len(book_copies)} book copies successfully",
+            "message": f"Updated {len(found)} book copies successfully",
             "not_found_barcodes": list(not_found),
             "num_not_found": len(not_found),
         }
         request.state.msg = msg
         return msg
+
+
+async def start_book_import_service(
+    request: Request, upload: UploadFile, fmt: Optional[str], session_factory
+):
+    """
+    Imports the uploaded file in the background, progress is read back with
+    `get_import_job_service`.
+    """
+    reraise_exceptions(request)
+    fmt = fmt or imports.format_from_filename(upload.filename)
+    if fmt not in imports.IMPORT_FORMATS:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail="Unknown import format, upload a .csv or .jsonl file or pass format",
+        )
+    # the upload is already spooled, the import takes the file over because
+    # the request closes its UploadFiles when it ends
+    await upload.seek(0)
+    spool, upload.file = upload.file, io.BytesIO()
+    job = imports.ImportJob(source=upload.filename or "upload")
+    imports.import_jobs.start(job, spool, fmt, session_factory)
+    logger.info(f"Started import {job.job_id} of {job.source}")
+    return job
+
+
+async def get_import_job_service(request: Request, job_id: str):
+    reraise_exceptions(request)
+    job = imports.import_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
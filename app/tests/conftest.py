@@ -8,11 +8,20 @@ from typing import List
 
 load_dotenv()
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-from app.core.auth import hash_password
+from app import crud
+from app.core.auth import hash_password, token_cache
 from app.core.config import Settings
-from app.core.database import Base, get_session
+from app.core.database import (
+    Base,
+    get_engine,
+    get_read_session,
+    get_session,
+    get_session_factory,
+)
+from app.core.principals import principal_cache
 from app.main import app
 from app.models import Book, User, BookCopy
 from app.utils import generate_book_copy_barcode
@@ -44,6 +53,13 @@ def anyio_backend():
     return "asyncio"
 
 
+@pytest.fixture(scope="function", autouse=True)
+def clear_auth_caches():
+    # every test gets a fresh database, cached principals would outlive it
+    token_cache.clear()
+    principal_cache.clear()
+
+
 @pytest.fixture(scope="function")
 async def setup_db():
     async with test_engine.begin() as conn:
@@ -60,12 +76,49 @@ async def test_session(setup_db):
         yield session
 
 
+@pytest.fixture(scope="function")
+async def session_factory(setup_db):
+    return TestAsyncSessionLocal
+
+
+@pytest.fixture(scope="function")
+async def file_session_factory(tmp_path):
+    # concurrent transactions need separate connections to a shared database
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'concurrency.db'}",
+        pool_size=20,
+        connect_args={"timeout": 30},
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    yield factory
+    await engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def query_counter():
+    # statements sent to the test database while the fixture is active
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sync_engine = test_engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
 @pytest.fixture(scope="function")
 async def client(test_session):
     async def override_get_session():
         yield test_session
 
     app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_session
+    app.dependency_overrides[get_session_factory] = lambda: TestAsyncSessionLocal
+    app.dependency_overrides[get_engine] = lambda: test_engine
     async with AsyncClient(transport=ASGITransport(app=app), base_url=BASE_URL) as ac:
         yield ac
     app.dependency_overrides.clear()
@@ -145,8 +198,10 @@ async def mock_book_copies(test_session, mock_book) -> (str, List[BookCopy]):
             book_isbn=isbn, serial=bk_copy_serial, copy_barcode=cp_barcode
         )
         bk_copies.append(book_copy)
+        last_serial = bk_copy_serial
     test_session.add_all(bk_copies)
     await test_session.flush()
+    await crud.recount_copy_counters(test_session, [isbn])
     for bk in bk_copies:
         await test_session.refresh(bk)
         refreshed_bk_copies.append(bk)
@@ -0,0 +1,49 @@
+import pytest
+
+from app.core.middleware import build_event_map, detect_event_from_scope
+from app.main import app
+from app.models import Event
+from app.routers.books import books_router
+from app.routers.exports import exports_router
+from app.routers.imports import imports_router
+from app.routers.users import users_router
+
+
+@pytest.fixture(scope="module")
+def event_map():
+    return build_event_map(app.routes)
+
+
+@pytest.mark.parametrize(
+    "route",
+    [
+        *books_router.routes,
+        *users_router.routes,
+        *imports_router.routes,
+        *exports_router.routes,
+    ],
+    ids=lambda route: route.name,
+)
+def test_every_route_has_an_event(event_map, route):
+    for method in route.methods:
+        assert event_map[(route.path, method)] != Event.UNIDENTIFIED_EVENT
+
+
+@pytest.mark.parametrize(
+    "path, method, event",
+    [
+        ("/books/loan-book", "POST", Event.CHECKOUT),
+        ("/books/loan-return", "POST", Event.RETURN_BOOK),
+        ("/books/{isbn}", "PUT", Event.UPDATE_BOOK),
+        ("/books/book-schedule/{isbn}", "POST", Event.SCHEDULE_BOOK),
+    ],
+)
+def test_routed_scope_resolves_event(event_map, path, method, event):
+    route = next(route for route in app.routes if getattr(route, "path", None) == path)
+    scope = {"type": "http", "method": method, "route": route}
+    assert detect_event_from_scope(scope, event_map) == event
+
+
+def test_unrouted_scope_is_unidentified(event_map):
+    scope = {"type": "http", "method": "GET"}
+    assert detect_event_from_scope(scope, event_map) == Event.UNIDENTIFIED_EVENT
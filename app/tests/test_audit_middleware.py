@@ -0,0 +1,103 @@
+import json
+from typing import Annotated
+
+import pytest
+from fastapi import FastAPI, Form, Request, UploadFile
+from httpx import ASGITransport, AsyncClient
+
+from app.core import middleware
+from app.core.middleware import AuditMiddleware
+
+
+@pytest.fixture(scope="function")
+def audit_entries(monkeypatch):
+    entries = []
+
+    async def submit(entry: dict):
+        entries.append(entry)
+        return True
+
+    monkeypatch.setattr(middleware.audit_writer, "submit", submit)
+    return entries
+
+
+@pytest.fixture(scope="function")
+async def audited_client():
+    app = FastAPI()
+    app.add_middleware(AuditMiddleware, max_form_bytes=64)
+
+    @app.post("/users/login")
+    async def login(
+        request: Request,
+        email: Annotated[str, Form()],
+        password: Annotated[str, Form()],
+    ):
+        request.state.actor = {"email": email}
+        return {"email": email, "password_length": len(password)}
+
+    @app.post("/upload")
+    async def upload(file: UploadFile):
+        return {"size": len(await file.read())}
+
+    @app.get("/books/fetch")
+    async def fetch():
+        return {}
+
+    @app.get("/health/ready")
+    async def readiness():
+        return {}
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        yield ac
+
+
+def details(entry: dict) -> dict:
+    return json.loads(entry["details"])
+
+
+@pytest.mark.anyio
+async def test_urlencoded_fields_are_captured_without_password(
+    audited_client, audit_entries
+):
+    form_data = {"email": "mock@gmail.com", "password": "12345678"}
+    response = await audited_client.post("/users/login", data=form_data)
+    assert response.status_code == 200
+    # downstream still reads the full body
+    assert response.json() == {"email": "mock@gmail.com", "password_length": 8}
+    entry = audit_entries[0]
+    assert entry["success"]
+    assert details(entry)["form"] == {"email": "mock@gmail.com"}
+    assert details(entry)["actor_email"] == "mock@gmail.com"
+
+
+@pytest.mark.anyio
+async def test_form_capture_is_capped(audited_client, audit_entries):
+    form_data = {"email": "mock@gmail.com", "password": "x" * 200}
+    response = await audited_client.post("/users/login", data=form_data)
+    assert response.json()["password_length"] == 200
+    assert details(audit_entries[0])["form"] == {"email": "mock@gmail.com"}
+
+
+@pytest.mark.anyio
+async def test_multipart_body_is_not_captured(audited_client, audit_entries):
+    files = {"file": ("big.bin", b"0" * 1024 * 1024)}
+    response = await audited_client.post("/upload", files=files)
+    assert response.json() == {"size": 1024 * 1024}
+    assert "form" not in details(audit_entries[0])
+
+
+@pytest.mark.anyio
+async def test_get_requests_are_audited(audited_client, audit_entries):
+    response = await audited_client.get("/books/fetch")
+    assert response.status_code == 200
+    assert details(audit_entries[0])["status_code"] == 200
+    assert "form" not in details(audit_entries[0])
+
+
+@pytest.mark.anyio
+async def test_probes_are_not_audited(audited_client, audit_entries):
+    response = await audited_client.get("/health/ready")
+    assert response.status_code == 200
+    assert audit_entries == []
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.audit import AuditWriter
+from app.models import Audit, Event
+
+
+def make_entry(i: int = 0):
+    return {
+        "actor_id": f"USER-{i}",
+        "success": True,
+        "event": Event.FETCH_BOOK,
+        "details": json.dumps({"n": i}),
+    }
+
+
+async def count_audits(session_factory):
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(Audit))
+
+
+@pytest.mark.anyio
+async def test_flushes_in_batches_and_drains_on_stop(session_factory):
+    writer = AuditWriter(session_factory, batch_size=10, flush_interval=60)
+    await writer.start()
+    for i in range(25):
+        assert await writer.submit(make_entry(i))
+    await asyncio.sleep(0.1)
+    # two full batches written by size, the remainder waits for the interval
+    assert await count_audits(session_factory) == 20
+    await writer.stop()
+    assert await count_audits(session_factory) == 25
+    assert writer.stats["queued"] == 25
+    assert writer.stats["flushed"] == 25
+    assert writer.stats["dropped"] == 0
+
+
+@pytest.mark.anyio
+async def test_flushes_by_interval(session_factory):
+    writer = AuditWriter(session_factory, batch_size=100, flush_interval=0.05)
+    await writer.start()
+    await writer.submit(make_entry())
+    await asyncio.sleep(0.2)
+    assert await count_audits(session_factory) == 1
+    await writer.stop()
+
+
+@pytest.mark.anyio
+async def test_drops_when_queue_is_full(session_factory):
+    writer = AuditWriter(
+        session_factory, max_queue=2, batch_size=1, enqueue_timeout=0.01
+    )
+    release = asyncio.Event()
+    flush = writer._flush
+
+    async def stalled_flush(batch):
+        await release.wait()
+        await flush(batch)
+
+    writer._flush = stalled_flush
+    await writer.start()
+    assert await writer.submit(make_entry(0))
+    await asyncio.sleep(0.01)  # the flusher takes the first entry and stalls
+    results = [await writer.submit(make_entry(i)) for i in range(1, 5)]
+    assert results == [True, True, False, False]
+    assert writer.stats["dropped"] == 2
+    release.set()
+    await writer.stop()
+    assert await count_audits(session_factory) == 3
+
+
+@pytest.mark.anyio
+async def test_spills_to_file_when_not_running(session_factory, tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    writer = AuditWriter(
+        session_factory, overflow_policy="spill", spill_path=str(spill_path)
+    )
+    assert not await writer.submit(make_entry(7))
+    lines = spill_path.read_text().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["event"] == "FETCH_BOOK"
+    assert writer.stats["spilled"] == 1
+
+
+@pytest.mark.anyio
+async def test_spills_off_the_event_loop(session_factory, tmp_path):
+    writer = AuditWriter(
+        session_factory, overflow_policy="spill", spill_path=str(tmp_path / "s.jsonl")
+    )
+    spill = writer._spill
+    threads = []
+
+    def recording_spill(entries):
+        threads.append(threading.get_ident())
+        spill(entries)
+
+    writer._spill = recording_spill
+    assert not await writer.submit(make_entry(1))
+    assert threads and threads[0] != threading.get_ident()
+    assert writer.stats["spilled"] == 1
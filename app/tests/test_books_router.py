@@ -1,4 +1,22 @@
+import json
+from datetime import timedelta
+
 import pytest
+from fastapi import Request
+from sqlalchemy import select, text
+
+from app import crud, services
+from app.core.principals import Principal
+from app.models import (
+    BOOK_SEARCH_TABLE,
+    BkCopyStatus,
+    Book,
+    BookCopy,
+    Loan,
+    LoanStatus,
+    User,
+)
+from app.utils import loan_return_time
 
 
 @pytest.mark.anyio
@@ -97,3 +115,497 @@ async def test_update_bk_copies(admin_auth_client, mock_book_copies):
     data = response.json()
     assert "message" in data
     assert data["num_not_found"] == 0
+
+
+@pytest.fixture(scope="function")
+async def mock_catalogue(test_session):
+    books = [
+        Book(
+            title=f"catalogue {i}",
+            author="tolkien" if i % 2 else "austen",
+            location="a1",
+            isbn=f"9780000{i:04}",
+        )
+        for i in range(7)
+    ]
+    test_session.add_all(books)
+    await test_session.flush()
+    return books
+
+
+@pytest.mark.anyio
+async def test_list_books_keyset_pagination(auth_client, mock_catalogue):
+    seen = []
+    cursor = 0
+    while cursor is not None:
+        response = await auth_client.get(
+            f"{auth_client.base_url}/books", params={"cursor": cursor, "limit": 3}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["books"]) <= 3
+        seen.extend(book["isbn"] for book in data["books"])
+        cursor = data["next_cursor"]
+    assert seen == [book.isbn for book in mock_catalogue]
+
+
+@pytest.mark.anyio
+async def test_list_books_filters(auth_client, mock_catalogue):
+    response = await auth_client.get(
+        f"{auth_client.base_url}/books", params={"author": "tolkien"}
+    )
+    assert response.status_code == 200
+    books = response.json()["books"]
+    assert len(books) == 3
+    assert {book["author"] for book in books} == {"tolkien"}
+
+
+@pytest.mark.anyio
+async def test_list_books_ndjson(auth_client, mock_catalogue):
+    response = await auth_client.get(
+        f"{auth_client.base_url}/books", params={"format": "ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["isbn"] for row in rows] == [book.isbn for book in mock_catalogue]
+
+
+@pytest.mark.anyio
+async def test_search_books(admin_auth_client):
+    books = [
+        {"title": "The Hobbit", "author": "tolkien", "location": "a1", "isbn": "101"},
+        {"title": "Emma", "author": "jane austen", "location": "a2", "isbn": "102"},
+        {
+            "title": "Persuasion",
+            "author": "jane austen",
+            "location": "a2",
+            "isbn": "103",
+        },
+    ]
+    for form_data in books:
+        response = await admin_auth_client.post(
+            f"{admin_auth_client.base_url}/books", data=form_data
+        )
+        assert response.status_code == 201
+
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/books/search", params={"q": "hob"}
+    )
+    assert response.status_code == 200
+    assert [book["isbn"] for book in response.json()["books"]] == ["101"]
+
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/books/search",
+        params={"q": "austen", "limit": 1},
+    )
+    data = response.json()
+    assert len(data["books"]) == 1
+    assert data["next_offset"] == 1
+
+    # the index follows title updates
+    response = await admin_auth_client.put(
+        f"{admin_auth_client.base_url}/books/102",
+        data={"title": "Sense and Sensibility"},
+    )
+    assert response.status_code == 204
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/books/search", params={"q": "sensib austen"}
+    )
+    assert [book["isbn"] for book in response.json()["books"]] == ["102"]
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/books/search", params={"q": "emma"}
+    )
+    assert response.json()["books"] == []
+
+
+@pytest.mark.anyio
+async def test_search_index_added_to_existing_database(
+    admin_auth_client, test_session, mock_book
+):
+    # a database created before search existed has books but no search table
+    await test_session.execute(text(f"DROP TABLE {BOOK_SEARCH_TABLE}"))
+    await test_session.commit()
+
+    assert await crud.create_book_search_index(test_session)
+    assert not await crud.create_book_search_index(test_session)
+    await crud.rebuild_book_search_index(test_session)
+    await test_session.commit()
+    found = await crud.search_books(test_session, ["mock1"], 10, 0)
+    assert [book.isbn for book in found] == [mock_book.isbn]
+
+    # the rebuild also recreates a missing table by itself
+    await test_session.execute(text(f"DROP TABLE {BOOK_SEARCH_TABLE}"))
+    await crud.rebuild_book_search_index(test_session)
+    await test_session.commit()
+
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books",
+        data={
+            "title": "Emma",
+            "author": "jane austen",
+            "location": "a2",
+            "isbn": "102",
+        },
+    )
+    assert response.status_code == 201
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/books/search", params={"q": "emma"}
+    )
+    assert [book["isbn"] for book in response.json()["books"]] == ["102"]
+
+
+@pytest.mark.anyio
+async def test_schema_upgraded_on_existing_database(test_session, mock_book_copies):
+    isbn, bk_copies = mock_book_copies
+    await test_session.commit()
+    # a database created before the copy counters and the composite indexes
+    for column in ("copies_total", "copies_available"):
+        await test_session.execute(text(f"ALTER TABLE books DROP COLUMN {column}"))
+    await test_session.execute(text("DROP INDEX ix_loans_status_due_at"))
+    await test_session.execute(
+        text("CREATE INDEX ix_book_copies_book_isbn ON book_copies (book_isbn)")
+    )
+    await test_session.commit()
+
+    added = await services.upgrade_schema_service(test_session)
+    assert added == [
+        "books.copies_total",
+        "books.copies_available",
+        "ix_loans_status_due_at",
+    ]
+    counters = await test_session.execute(
+        text("SELECT copies_total, copies_available FROM books WHERE isbn = :isbn"),
+        {"isbn": isbn},
+    )
+    assert counters.one() == (len(bk_copies), len(bk_copies))
+    indexes = await test_session.scalars(
+        text("SELECT name FROM sqlite_master WHERE type = 'index'")
+    )
+    assert "ix_book_copies_book_isbn" not in indexes.all()
+    assert await services.upgrade_schema_service(test_session) == []
+
+
+@pytest.mark.anyio
+async def test_copy_counters_follow_status_changes(
+    admin_auth_client, mock_book_copies, mock_user
+):
+    isbn, _ = mock_book_copies
+    url = f"{admin_auth_client.base_url}/books/fetch?isbn={isbn}"
+    book = (await admin_auth_client.get(url)).json()
+    assert (book["copies_total"], book["copies_available"]) == (5, 5)
+
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/generate-copies",
+        data={"isbn": isbn, "quantity": 2},
+    )
+    assert response.status_code == 201
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-book",
+        data={"user_uid": mock_user.user_uid, "isbn": isbn},
+    )
+    assert response.status_code == 201
+    book = (await admin_auth_client.get(url)).json()
+    assert book["copies_total"] == 7
+    assert book["copies_available"] == 6
+    assert book["copies_borrowed"] == 1
+    assert book["available"]
+
+
+@pytest.mark.anyio
+async def test_reconcile_copy_counters(test_session, mock_book_copies):
+    isbn, bk_copies = mock_book_copies
+    bk_copies[0].status = BkCopyStatus.LOST
+    bk_copies[1].status = BkCopyStatus.DAMAGED
+    await test_session.flush()
+    assert await services.reconcile_copy_counters_service(test_session) == 1
+    book = await crud.get_book_by_isbn(test_session, isbn)
+    await test_session.refresh(book)
+    assert book.copies_available == 3
+    assert (book.copies_lost, book.copies_damaged) == (1, 1)
+
+
+# round trips allowed per checkout, see services.loan_book_service
+CHECKOUT_QUERY_BUDGET = 5
+
+
+@pytest.mark.anyio
+async def test_loan_book_query_budget(
+    test_session, mock_book_copies, mock_user, query_counter
+):
+    isbn, _ = mock_book_copies
+    request = Request({"type": "http"})
+    loan_info = await services.loan_book_service(
+        request, test_session, isbn, mock_user.user_uid
+    )
+    assert not loan_info["was_scheduled"]
+    assert loan_info["loan"].loan_id and loan_info["loan"].checked_out_at
+    assert len(query_counter) <= CHECKOUT_QUERY_BUDGET
+
+    await services.schedule_book_copy_service(
+        request, test_session, isbn, Principal.from_user(mock_user)
+    )
+    query_counter.clear()
+    loan_info = await services.loan_book_service(
+        request, test_session, isbn, mock_user.user_uid
+    )
+    assert loan_info["was_scheduled"]
+    assert loan_info["book_copy"].status == BkCopyStatus.BORROWED
+    assert len(query_counter) <= CHECKOUT_QUERY_BUDGET
+
+    context = await crud.get_checkout_context(test_session, isbn, mock_user.user_uid)
+    assert context.active_loans == 2
+    assert context.schedule_id is None
+
+
+@pytest.mark.anyio
+async def test_bulk_loan_books(
+    admin_auth_client, test_session, mock_book_copies, mock_user, query_counter
+):
+    isbn, bk_copies = mock_book_copies
+    payload = {
+        "user_uid": mock_user.user_uid,
+        "isbns": [isbn, isbn],
+        "copy_barcodes": [bk_copies[-1].copy_barcode, bk_copies[0].copy_barcode],
+    }
+    query_counter.clear()
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-books", json=payload
+    )
+    assert response.status_code == 201
+    data = response.json()
+    assert (data["num_loaned"], data["num_failed"]) == (3, 1)
+    results = data["results"]
+    assert [r["success"] for r in results] == [True, True, True, False]
+    assert results[2]["book_copy"]["copy_barcode"] == bk_copies[-1].copy_barcode
+    assert results[3]["detail"] == "Loan limit reached"
+    lent = {r["loan"]["bk_copy_barcode"] for r in results if r["success"]}
+    assert len(lent) == 3
+    # one transaction, not one checkout per item
+    assert sum(q.startswith("INSERT INTO loans") for q in query_counter) == 1
+
+    book = await crud.get_book_by_isbn(test_session, isbn)
+    await test_session.refresh(book)
+    assert (book.copies_available, book.copies_borrowed) == (2, 3)
+
+    # the user is now at the loan limit
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-books", json=payload
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_bulk_loan_uses_schedules(
+    test_session, mock_book_copies, mock_user, query_counter
+):
+    isbn, _ = mock_book_copies
+    request = Request({"type": "http"})
+    schedule = await services.schedule_book_copy_service(
+        request, test_session, isbn, Principal.from_user(mock_user)
+    )
+    reserved = schedule["schedule_info"].bk_copy_barcode
+    query_counter.clear()
+    data = await services.bulk_loan_books_service(
+        request, test_session, mock_user.user_uid, [isbn, "00001111", isbn], []
+    )
+    assert (data["num_loaned"], data["num_failed"]) == (2, 1)
+    first, missing, second = data["results"]
+    assert first["was_scheduled"] and first["book_copy"].copy_barcode == reserved
+    assert missing["detail"].startswith("There are no available copies")
+    assert not second.get("was_scheduled")
+    assert len(query_counter) <= 7
+    context = await crud.get_checkout_context(test_session, isbn, mock_user.user_uid)
+    assert (context.active_loans, context.schedule_id) == (2, None)
+
+
+async def make_overdue(session, loan_id: str, days: int):
+    loan = await crud.get_loan_by_id(session, loan_id)
+    loan.due_at = loan_return_time() - timedelta(days=days)
+    await session.commit()
+
+
+@pytest.mark.anyio
+async def test_late_return_fines_user(
+    admin_auth_client, test_session, mock_book_copies, mock_user
+):
+    isbn, _ = mock_book_copies
+    loan_info = await services.loan_book_service(
+        Request({"type": "http"}), test_session, isbn, mock_user.user_uid
+    )
+    loan = loan_info["loan"]
+    await make_overdue(test_session, loan.loan_id, 2)
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-return",
+        data={"loan_id": loan.loan_id, "bk_copy_barcode": loan.bk_copy_barcode},
+    )
+    assert response.status_code == 200
+    assert response.json()["fine"] == "200"
+    user = await crud.get_user_by_uid(test_session, mock_user.user_uid)
+    await test_session.refresh(user)
+    assert user.fine_balance == 200
+
+
+@pytest.mark.anyio
+async def test_bulk_return_book_loans(
+    admin_auth_client, test_session, mock_book_copies, mock_user, query_counter
+):
+    isbn, _ = mock_book_copies
+    lent = await services.bulk_loan_books_service(
+        Request({"type": "http"}), test_session, mock_user.user_uid, [isbn] * 3, []
+    )
+    loans = [r["loan"] for r in lent["results"]]
+    await make_overdue(test_session, loans[0].loan_id, 2)
+    await make_overdue(test_session, loans[1].loan_id, 3)
+    returns = [
+        {"loan_id": loan.loan_id, "bk_copy_barcode": loan.bk_copy_barcode}
+        for loan in loans
+    ]
+    returns += [
+        {"loan_id": "LN-missing", "bk_copy_barcode": loans[0].bk_copy_barcode},
+        returns[2],
+    ]
+    query_counter.clear()
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-returns", json={"returns": returns}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["num_returned"], data["num_failed"]) == (3, 2)
+    assert data["total_fines"] == 500
+    results = data["results"]
+    assert [r["fine"] for r in results[:3]] == [200, 300, 0]
+    assert [r["status"] for r in results[:3]] == [
+        LoanStatus.RETURNED_LATE.value,
+        LoanStatus.RETURNED_LATE.value,
+        LoanStatus.RETURNED.value,
+    ]
+    assert results[3]["detail"] == "Loan not found"
+    assert results[4]["detail"] == "Duplicate loan"
+    # fines of one user are added with a single update
+    assert sum(q.startswith("UPDATE users") for q in query_counter) == 1
+
+    user = await test_session.get(User, mock_user.id)
+    await test_session.refresh(user)
+    assert user.fine_balance == 500
+    book = await crud.get_book_by_isbn(test_session, isbn)
+    await test_session.refresh(book)
+    assert (book.copies_borrowed, book.copies_in_check) == (0, 3)
+    for loan in loans:
+        returned = await test_session.get(Loan, loan.id)
+        await test_session.refresh(returned)
+        assert returned.returned_at is not None
+
+    # already returned
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-returns",
+        json={"returns": returns[:1]},
+    )
+    assert response.json()["results"][0]["detail"] == "Loan is not active"
+
+
+@pytest.mark.anyio
+async def test_bulk_return_rejects_closed_loan_of_relent_copy(
+    admin_auth_client, test_session, mock_book_copies, mock_user
+):
+    _, copies = mock_book_copies
+    barcode = copies[0].copy_barcode
+
+    async def lend():
+        lent = await services.bulk_loan_books_service(
+            Request({"type": "http"}), test_session, mock_user.user_uid, [], [barcode]
+        )
+        return lent["results"][0]["loan"]
+
+    old_loan = await lend()
+    returns = [{"loan_id": old_loan.loan_id, "bk_copy_barcode": barcode}]
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-returns", json={"returns": returns}
+    )
+    assert response.json()["num_returned"] == 1
+    # inspected, back on the shelf and lent again; the old loan would be late now
+    await crud.set_bk_copies_status(test_session, BkCopyStatus.AVAILABLE, [barcode])
+    await test_session.commit()
+    await make_overdue(test_session, old_loan.loan_id, 3)
+    new_loan = await lend()
+
+    returns.append({"loan_id": new_loan.loan_id, "bk_copy_barcode": barcode})
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-returns", json={"returns": returns}
+    )
+    results = response.json()["results"]
+    assert results[0]["detail"] == "Loan is not active"
+    assert (results[1]["success"], results[1]["fine"]) == (True, 0)
+
+    loans = await test_session.scalars(
+        select(Loan).where(Loan.loan_id.in_([old_loan.loan_id, new_loan.loan_id]))
+    )
+    for loan in loans:
+        await test_session.refresh(loan)
+        assert loan.status == LoanStatus.RETURNED
+    user = await crud.get_user_by_uid(test_session, mock_user.user_uid)
+    await test_session.refresh(user)
+    assert user.fine_balance == 0
+
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/books/loan-return",
+        data={"loan_id": old_loan.loan_id, "bk_copy_barcode": barcode},
+    )
+    assert response.status_code == 409
+
+
+
+@pytest.mark.anyio
+async def test_insert_book_copies_in_chunks(test_session, mock_book_copies):
+    isbn, bk_copies = mock_book_copies
+    book = await crud.get_book_by_isbn(test_session, isbn)
+    first_serial = await crud.reserve_copy_serials(test_session, isbn, 25)
+    assert first_serial == len(bk_copies) + 1
+    await crud.insert_book_copies(
+        test_session, isbn, book.library_barcode, first_serial, 25, chunk_size=10
+    )
+    stmt = (
+        select(BookCopy)
+        .where(BookCopy.book_isbn == isbn, BookCopy.serial >= first_serial)
+        .order_by(BookCopy.serial)
+    )
+    copies = (await test_session.execute(stmt)).scalars().all()
+    assert [c.serial for c in copies] == list(range(first_serial, first_serial + 25))
+    assert copies[-1].copy_barcode == f"COPY-{book.library_barcode}-030"
+    assert {c.status for c in copies} == {BkCopyStatus.AVAILABLE}
+
+
+@pytest.mark.anyio
+async def test_update_bk_copies_ndjson(
+    admin_auth_client, test_session, mock_book_copies, query_counter
+):
+    isbn, bk_copies = mock_book_copies
+    lines = [{"copy_barcode": bk.copy_barcode, "status": "LOST"} for bk in bk_copies]
+    # a later line for the same barcode wins
+    lines.append({"copy_barcode": bk_copies[0].copy_barcode, "status": "DAMAGED"})
+    lines.append({"copy_barcode": "COPY-missing", "status": "AVAILABLE"})
+    body = "\n".join(json.dumps(line) for line in lines) + "\n"
+    query_counter.clear()
+    response = await admin_auth_client.patch(
+        f"{admin_auth_client.base_url}/books/update-bk-copies-status/ndjson",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == f"Updated {len(bk_copies)} book copies successfully"
+    assert data["not_found_barcodes"] == ["COPY-missing"]
+    # one UPDATE per target status, not one per copy
+    assert sum(q.startswith("UPDATE book_copies") for q in query_counter) == 3
+
+    book = await crud.get_book_by_isbn(test_session, isbn)
+    await test_session.refresh(book)
+    assert (book.copies_available, book.copies_lost, book.copies_damaged) == (0, 4, 1)
+
+    response = await admin_auth_client.patch(
+        f"{admin_auth_client.base_url}/books/update-bk-copies-status/ndjson",
+        content='{"copy_barcode": "x", "status": "BORROWED"}\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+    assert "line 1" in response.json()["detail"]
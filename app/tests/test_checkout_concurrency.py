@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException, Request
+from sqlalchemy import func, insert, select
+
+from app import crud, services
+from app.models import BkCopyStatus, Book, BookCopy, Loan, User
+from app.utils import generate_book_copy_barcode
+
+COPIES = 50
+USERS = 100
+ATTEMPTS_PER_USER = 2
+
+
+async def seed(session_factory):
+    async with session_factory() as session:
+        book = Book(title="popular", author="someone", location="a1", isbn="4242")
+        session.add(book)
+        await session.flush()
+        await session.execute(
+            insert(BookCopy),
+            [
+                {
+                    "book_isbn": book.isbn,
+                    "serial": serial,
+                    "copy_barcode": generate_book_copy_barcode(
+                        book.library_barcode, serial
+                    ),
+                }
+                for serial in range(1, COPIES + 1)
+            ],
+        )
+        await session.execute(
+            insert(User),
+            [
+                {
+                    "full_name": f"Patron {i}",
+                    "email": f"patron{i}@gmail.com",
+                    "password": "x",
+                    "user_uid": f"USER-AA-{i:08}",
+                    "card_number": f"LB-AA-{i:08}",
+                }
+                for i in range(USERS)
+            ],
+        )
+        await crud.recount_copy_counters(session, [book.isbn])
+        await session.commit()
+        return book.isbn
+
+
+@pytest.mark.anyio
+async def test_concurrent_checkouts_never_lend_a_copy_twice(file_session_factory):
+    isbn = await seed(file_session_factory)
+    request = Request({"type": "http"})
+
+    async def checkout(user_uid: str):
+        async with file_session_factory() as session:
+            try:
+                await services.loan_book_service(request, session, isbn, user_uid)
+            except HTTPException as e:
+                return e.status_code
+            return 201
+
+    user_uids = [f"USER-AA-{i:08}" for i in range(USERS)] * ATTEMPTS_PER_USER
+    start = time.perf_counter()
+    results = await asyncio.gather(*(checkout(uid) for uid in user_uids))
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(results)} concurrent checkouts in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.0f}/s)")
+
+    assert results.count(201) == COPIES
+    assert set(results) == {201, 404}
+    async with file_session_factory() as session:
+        loans = (await session.execute(select(Loan.bk_copy_barcode))).scalars().all()
+        assert len(loans) == len(set(loans)) == COPIES
+        borrowed = await session.scalar(
+            select(func.count())
+            .select_from(BookCopy)
+            .where(BookCopy.status == BkCopyStatus.BORROWED)
+        )
+        assert borrowed == COPIES
+        book = await crud.get_book_by_isbn(session, isbn)
+        assert (book.copies_available, book.copies_borrowed) == (0, COPIES)
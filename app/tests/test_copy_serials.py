@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, services
+from app.models import Book, BookCopy
+
+GENERATORS = 10
+COPIES_PER_CALL = 20
+
+
+@pytest.mark.anyio
+async def test_concurrent_copy_generation_gets_disjoint_serials(file_session_factory):
+    async with file_session_factory() as session:
+        session.add(
+            Book(title="consortium", author="someone", location="a1", isbn="77")
+        )
+        await session.commit()
+
+    async def generate():
+        async with file_session_factory() as session:
+            try:
+                await services.add_book_copies_service(
+                    Request({"type": "http"}), session, COPIES_PER_CALL, "77"
+                )
+            except HTTPException as e:
+                return e.status_code
+            return 201
+
+    results = await asyncio.gather(*(generate() for _ in range(GENERATORS)))
+    assert results == [201] * GENERATORS
+
+    total = GENERATORS * COPIES_PER_CALL
+    async with file_session_factory() as session:
+        stmt = select(BookCopy.serial, BookCopy.copy_barcode).where(
+            BookCopy.book_isbn == "77"
+        )
+        rows = (await session.execute(stmt)).all()
+        assert sorted(serial for serial, _ in rows) == list(range(1, total + 1))
+        assert len({barcode for _, barcode in rows}) == total
+        book = await crud.get_book_by_isbn(session, "77")
+        assert (book.copy_serial, book.copies_total) == (total, total)
+
+
+@pytest.mark.anyio
+async def test_serials_skip_copies_inserted_without_reservation(
+    test_session, mock_book_copies
+):
+    isbn, bk_copies = mock_book_copies
+    # the fixture inserts copies directly, the counter is still 0
+    assert await crud.reserve_copy_serials(test_session, isbn, 3) == len(bk_copies) + 1
+    assert await crud.reserve_copy_serials(test_session, isbn, 1) == len(bk_copies) + 4
+    assert await crud.reserve_copy_serials(test_session, "missing", 1) is None
+
+
+@pytest.mark.anyio
+async def test_duplicate_serial_is_rejected(test_session, mock_book_copies):
+    isbn, bk_copies = mock_book_copies
+    test_session.add(
+        BookCopy(book_isbn=isbn, serial=bk_copies[0].serial, copy_barcode="COPY-dup")
+    )
+    with pytest.raises(IntegrityError):
+        await test_session.flush()
@@ -0,0 +1,112 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud
+from app.models import Audit, Event
+
+
+async def add_audits(session, count: int, audited_at: datetime):
+    session.add_all(
+        [
+            Audit(
+                actor_id=f"actor-{i}",
+                success=True,
+                event=Event.FETCH_BOOKS,
+                details="{}",
+                audited_at=audited_at + timedelta(minutes=i),
+            )
+            for i in range(count)
+        ]
+    )
+    await session.commit()
+
+
+def ndjson(body: bytes):
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+@pytest.mark.anyio
+async def test_export_book_copies_ndjson(admin_auth_client, mock_book_copies):
+    isbn, copies = mock_book_copies
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/exports/book_copies"
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert 'filename="book_copies.ndjson"' in response.headers["content-disposition"]
+    rows = ndjson(response.content)
+    assert [row["copy_barcode"] for row in rows] == [c.copy_barcode for c in copies]
+    assert rows[0]["status"] == "AVAILABLE"
+    assert rows[0]["book_isbn"] == isbn
+
+
+@pytest.mark.anyio
+async def test_export_resumes_from_cursor(admin_auth_client, mock_book_copies):
+    _, copies = mock_book_copies
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/exports/book_copies",
+        params={"cursor": copies[1].copy_id, "format": "csv"},
+    )
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["copy_id"]) for row in rows] == [c.copy_id for c in copies[2:]]
+
+
+@pytest.mark.anyio
+async def test_export_audit_time_range_gzip(admin_auth_client, test_session):
+    start = datetime(2026, 1, 1, 12, 0)
+    await add_audits(test_session, 10, start)
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/exports/audit",
+        params={
+            "gzip": True,
+            "since": (start + timedelta(minutes=2)).isoformat(),
+            "until": (start + timedelta(minutes=5)).isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="audit.ndjson.gz"' in response.headers["content-disposition"]
+    rows = ndjson(gzip.decompress(response.content))
+    assert [row["actor_id"] for row in rows] == ["actor-2", "actor-3", "actor-4"]
+    assert rows[0]["event"] == Event.FETCH_BOOKS.value
+
+
+@pytest.mark.anyio
+async def test_empty_csv_export_has_a_header(admin_auth_client):
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/exports/loans", params={"format": "csv"}
+    )
+    assert response.status_code == 200
+    columns = crud.EXPORT_TABLES["loans"][0].columns.keys()
+    assert response.text.splitlines() == [",".join(columns)]
+
+
+@pytest.mark.anyio
+async def test_export_rejects_time_range_without_timestamp(admin_auth_client):
+    response = await admin_auth_client.get(
+        f"{admin_auth_client.base_url}/exports/book_copies",
+        params={"since": "2026-01-01T00:00:00"},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_export_requires_staff(auth_client):
+    response = await auth_client.get(f"{auth_client.base_url}/exports/loans")
+    assert response.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_stream_export_batches(test_session):
+    await add_audits(test_session, 25, datetime(2026, 1, 1))
+    ids = [
+        row["id"]
+        async for row in crud.stream_export(test_session, "audit", 5, batch_size=4)
+    ]
+    assert ids == list(range(6, 26))
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import Request
+
+from app import crud, services
+from app.models import User
+from app.utils import loan_return_time
+
+
+async def lend(session, isbn, user, due_in_days):
+    lent = await services.bulk_loan_books_service(
+        Request({"type": "http"}), session, user.user_uid, [isbn] * len(due_in_days), []
+    )
+    loans = [r["loan"] for r in lent["results"]]
+    for loan, days in zip(loans, due_in_days):
+        loan.due_at = loan_return_time() + timedelta(days=days)
+    await session.commit()
+    return loans
+
+
+async def fine_balance(session, user: User):
+    await session.refresh(user)
+    return user.fine_balance
+
+
+@pytest.mark.anyio
+async def test_accrue_loan_fines(test_session, mock_book_copies, mock_user):
+    isbn, _ = mock_book_copies
+    loans = await lend(test_session, isbn, mock_user, [-2, -3, 1])
+
+    totals = await services.accrue_loan_fines_service(test_session, batch_size=1)
+    assert totals == {"loans": 2, "users": 1, "fines": 500}
+    assert await fine_balance(test_session, mock_user) == 500
+    for loan in loans:
+        await test_session.refresh(loan)
+    assert [loan.fine_accrued for loan in loans] == [200, 300, 0]
+
+    # rerunning on the same day charges nothing
+    totals = await services.accrue_loan_fines_service(test_session)
+    assert totals == {"loans": 0, "users": 0, "fines": 0}
+    assert await fine_balance(test_session, mock_user) == 500
+
+    # two days later every loan is overdue, only the new days are charged
+    later = loan_return_time() + timedelta(days=2)
+    totals = await services.accrue_loan_fines_service(test_session, now=later)
+    assert totals == {"loans": 3, "users": 1, "fines": 500}
+    assert await fine_balance(test_session, mock_user) == 1000
+
+
+@pytest.mark.anyio
+async def test_return_charges_only_unaccrued_fine(
+    test_session, mock_book_copies, mock_user
+):
+    isbn, copies = mock_book_copies
+    first, second = await lend(test_session, isbn, mock_user, [-2, -3])
+    await services.accrue_loan_fines_service(test_session)
+    # lending and accrual use set-based updates behind the session's back
+    for instance in [*copies, first, second]:
+        await test_session.refresh(instance)
+    assert await fine_balance(test_session, mock_user) == 500
+
+    request = Request({"type": "http"})
+    response = await services.return_book_loan_service(
+        request, test_session, first.bk_copy_barcode, first.loan_id
+    )
+    assert response["fine"] == "200"
+    response = await services.bulk_return_book_loans_service(
+        request,
+        test_session,
+        [{"loan_id": second.loan_id, "bk_copy_barcode": second.bk_copy_barcode}],
+    )
+    assert response["total_fines"] == 300
+    assert await fine_balance(test_session, mock_user) == 500
+    # returned loans are no longer scanned
+    assert await crud.get_overdue_loans(test_session, loan_return_time(), 10) == []
@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import Settings
+from app.core.database import (
+    TimedQueuePool,
+    engine_options,
+    get_engine,
+    pool_status,
+    warm_up_pool,
+)
+from app.main import app
+
+
+@pytest.mark.anyio
+async def test_ready(client):
+    response = await client.get("/health/ready")
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["status"], data["database"]) == ("ready", "ok")
+    assert "pool" in data["pool"]
+
+
+@pytest.mark.anyio
+async def test_not_ready_when_database_is_unreachable(client, tmp_path):
+    missing = tmp_path / "missing" / "library.db"
+    broken = create_async_engine(f"sqlite+aiosqlite:///{missing}")
+    app.dependency_overrides[get_engine] = lambda: broken
+    response = await client.get("/health/ready")
+    assert response.status_code == 503
+    data = response.json()
+    assert (data["status"], data["database"]) == ("unavailable", "unavailable")
+    # the driver error stays in the log
+    assert str(missing) not in response.text
+    await broken.dispose()
+
+
+def test_engine_options_from_settings():
+    settings = Settings(db_pool_size=7, db_max_overflow=3, db_statement_cache_size=0)
+    assert engine_options("sqlite+aiosqlite:///:memory:", settings) == {
+        "echo": False,
+        "future": True,
+    }
+    options = engine_options("sqlite+aiosqlite:///library.db", settings)
+    assert options["poolclass"] is TimedQueuePool
+    assert (options["pool_size"], options["max_overflow"]) == (7, 3)
+    assert "connect_args" not in options
+    options = engine_options("postgresql+asyncpg://u:p@db/library", settings)
+    assert options["connect_args"] == {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+    }
+
+
+@pytest.mark.anyio
+async def test_warm_up_pool(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}"
+    engine = create_async_engine(url, **engine_options(url, Settings(db_pool_size=3)))
+    await warm_up_pool(engine, 3)
+    status = pool_status(engine)
+    assert (status["size"], status["checked_in"], status["checked_out"]) == (3, 3, 0)
+    assert status["checkouts"] == 3 and status["timeouts"] == 0
+    await engine.dispose()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from app import crud, imports
+from app.models import Book, BookCopy
+
+CSV_ROWS = """title,author,location,isbn,copies
+The Hobbit,tolkien,a1,101,3
+Emma,jane austen,a2,102,
+Emma,someone else,a2,103,1
+Persuasion,jane austen,a2,104,not-a-number
+Mansfield Park,jane austen,a2,101,1
+,nobody,a3,105,1
+"""
+
+
+async def wait_for(client, job_id: str):
+    for _ in range(100):
+        response = await client.get(f"{client.base_url}/imports/{job_id}")
+        job = response.json()
+        if job["status"] not in ("pending", "running"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError("import did not finish")
+
+
+@pytest.mark.anyio
+async def test_import_books_csv(admin_auth_client, test_session):
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/imports/books",
+        files={"file": ("catalogue.csv", CSV_ROWS.encode(), "text/csv")},
+    )
+    assert response.status_code == 202
+    job = await wait_for(admin_auth_client, response.json()["job_id"])
+
+    assert job["status"] == "completed"
+    assert (job["rows_read"], job["books_imported"], job["rows_failed"]) == (6, 2, 4)
+    assert job["copies_created"] == 3
+    errors = {error["line"]: error["error"] for error in job["errors"]}
+    assert errors[4] == "Title already used by ISBN-102"
+    assert errors[5].startswith("copies:")
+    assert errors[6] == "Duplicate ISBN, first seen on line 2"
+    assert errors[7].startswith("title:")
+
+    book = await crud.get_book_by_isbn(test_session, "101")
+    await test_session.refresh(book)
+    assert (book.copies_total, book.copies_available, book.copy_serial) == (3, 3, 3)
+    emma = await crud.get_book_by_isbn(test_session, "102")
+    assert not emma.available
+    # imported books are searchable
+    found = await crud.search_books(test_session, ["hobbit"], 10, 0)
+    assert [row.isbn for row in found] == ["101"]
+
+
+@pytest.mark.anyio
+async def test_import_upserts_and_adds_copies(
+    session_factory, test_session, mock_book_copies
+):
+    isbn, bk_copies = mock_book_copies
+    await test_session.commit()
+    rows = [
+        {
+            "title": "renamed",
+            "author": "a",
+            "location": "b9",
+            "isbn": isbn,
+            "copies": 2,
+        },
+        {"title": "new", "author": "a", "location": "b9", "isbn": "900"},
+    ]
+    lines = iter(json.dumps(row) + "\n" for row in rows + ["not json"])
+    job = imports.ImportJob(source="test.jsonl")
+    await imports.import_rows(
+        session_factory, job, imports.read_rows(lines, "jsonl"), batch_size=1
+    )
+    assert (job.books_imported, job.copies_created, job.rows_failed) == (2, 2, 1)
+    assert job.errors[0]["error"].startswith("Expected a JSON object")
+
+    async with session_factory() as session:
+        book = await crud.get_book_by_isbn(session, isbn)
+        assert (book.title, book.location) == ("renamed", "b9")
+        assert book.copies_total == len(bk_copies) + 2
+        serials = await session.scalar(
+            select(func.max(BookCopy.serial)).where(BookCopy.book_isbn == isbn)
+        )
+        assert serials == len(bk_copies) + 2
+
+
+@pytest.mark.anyio
+async def test_import_unknown_format(admin_auth_client):
+    response = await admin_auth_client.post(
+        f"{admin_auth_client.base_url}/imports/books",
+        files={"file": ("catalogue.xlsx", b"", "application/octet-stream")},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_upsert_books_redraws_taken_barcodes(
+    monkeypatch, test_session, mock_book
+):
+    # the first draws collide with an existing book and with each other
+    draws = iter(
+        [mock_book.library_barcode, "BK-0000001", "BK-0000001", "BK-0000002"]
+    )
+    monkeypatch.setattr(crud, "generate_barcode", lambda: next(draws))
+    rows = [
+        {"title": "new1", "author": "a", "location": "b9", "isbn": "901"},
+        {"title": "new2", "author": "a", "location": "b9", "isbn": "902"},
+    ]
+    books = await crud.upsert_books(test_session, rows)
+    assert len(books) == 2
+
+    barcodes = await test_session.scalars(
+        select(Book.library_barcode).where(Book.isbn.in_(["901", "902"]))
+    )
+    assert sorted(barcodes) == ["BK-0000001", "BK-0000002"]
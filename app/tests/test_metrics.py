@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.metrics import Histogram, Metrics, instrument_engine
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    labels = (("route", "/books"),)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(labels, value)
+    samples = {
+        (name, dict(labels).get("le")): value
+        for name, labels, value in histogram.samples("latency")
+    }
+    assert samples[("latency_bucket", "0.1")] == 2
+    assert samples[("latency_bucket", "1.0")] == 3
+    assert samples[("latency_bucket", "+Inf")] == 4
+    assert samples[("latency_count", None)] == 4
+    assert samples[("latency_sum", None)] == pytest.approx(3.65)
+
+
+def test_render_prometheus_text():
+    registry = Metrics()
+    registry.observe_request("/books/{isbn}", "PUT", 204, 0.02)
+    registry.observe_query("primary", "  SELECT 1", 0.001)
+    extra = [("audit_queue_depth", "gauge", "Queued audit entries", (), 3)]
+    body = registry.render(extra)
+    assert "# TYPE http_requests_total counter" in body
+    assert (
+        'http_requests_total{route="/books/{isbn}",method="PUT",status="204"} 1' in body
+    )
+    assert (
+        'http_request_duration_seconds_bucket{route="/books/{isbn}",method="PUT",'
+        'le="0.025"} 1' in body
+    )
+    assert 'db_queries_total{db="primary",statement="select"} 1' in body
+    assert "# TYPE audit_queue_depth gauge\naudit_queue_depth 3\n" in body
+
+
+@pytest.mark.anyio
+async def test_instrumented_engine_times_queries(tmp_path):
+    registry = Metrics()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'metrics.db'}")
+    instrument_engine(engine.sync_engine, "primary", registry)
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        await conn.execute(text("SELECT 2"))
+    await engine.dispose()
+    assert registry.queries[(("db", "primary"), ("statement", "select"))] == 2
+    series = registry.query_latency.series[(("db", "primary"), ("statement", "select"))]
+    assert sum(series[:-1]) == 2
+
+
+@pytest.mark.anyio
+async def test_instrumented_engine_counts_failed_queries(tmp_path):
+    registry = Metrics()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'metrics.db'}")
+    instrument_engine(engine.sync_engine, "primary", registry)
+    async with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            await conn.execute(text("SELECT * FROM missing"))
+        raw = await conn.get_raw_connection()
+        # the failed statement left no start time on the pooled connection
+        assert raw.info["query_started"] == []
+    await engine.dispose()
+    labels = (("db", "primary"), ("statement", "select"))
+    assert registry.query_errors[labels] == 1
+    assert labels not in registry.queries
+    assert 'db_query_errors_total{db="primary",statement="select"} 1' in (
+        registry.render()
+    )
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint(auth_client, mock_book):
+    response = await auth_client.get(
+        f"{auth_client.base_url}/books/fetch", params={"isbn": mock_book.isbn}
+    )
+    assert response.status_code == 200
+
+    response = await auth_client.get(f"{auth_client.base_url}/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'http_requests_total{route="/books/fetch",method="GET",status="200"}' in body
+    assert (
+        'http_request_duration_seconds_count{route="/books/fetch",method="GET"}' in body
+    )
+    # the scrape itself is in flight
+    assert "http_requests_in_flight 1" in body
+    assert "audit_queue_depth " in body
+    assert 'audit_entries_total{outcome="dropped"}' in body
+    assert 'db_pool_size{db="primary"}' in body
+    assert "schedule_expiry_expired_total " in body
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core import auth
+from app.core.auth import hash_password_async, verify_password_async
+
+
+@pytest.mark.anyio
+async def test_hash_and_verify_roundtrip():
+    hashed = await hash_password_async("mockuser123")
+    assert await verify_password_async("mockuser123", hashed)
+    assert not await verify_password_async("wrong-password", hashed)
+
+
+@pytest.mark.anyio
+async def test_hashing_runs_off_the_event_loop(monkeypatch):
+    threads = []
+    hash_password = auth.hash_password
+
+    def recording_hash(password: str):
+        threads.append(threading.current_thread())
+        return hash_password(password)
+
+    monkeypatch.setattr(auth, "hash_password", recording_hash)
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.gather(*(hash_password_async(f"password{i}") for i in range(2)))
+    beat.cancel()
+    assert threading.main_thread() not in threads
+    assert ticks > 1
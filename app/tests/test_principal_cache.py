@@ -0,0 +1,84 @@
+import pytest
+
+from app import crud
+from app.core.principals import Principal, PrincipalCache, principal_cache
+
+
+def make_principal(email="mock@gmail.com", user_uid="USER-AA-00000000"):
+    return Principal(
+        email=email,
+        user_uid=user_uid,
+        is_active=True,
+        is_staff=False,
+        is_superuser=False,
+        fine_balance=0,
+    )
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    now = 1000.0
+    monkeypatch.setattr("app.core.principals.time.monotonic", lambda: now)
+    cache.put(make_principal())
+    assert cache.get("mock@gmail.com") is not None
+    now += 61
+    assert cache.get("mock@gmail.com") is None
+    assert cache.stats == {"hits": 1, "misses": 1, "invalidations": 0}
+
+
+def test_invalidate_by_user_uid():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.put(make_principal())
+    cache.invalidate(user_uid="USER-AA-00000000")
+    assert cache.get("mock@gmail.com") is None
+    assert cache.stats["invalidations"] == 1
+
+
+def test_cache_is_bounded():
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    for i in range(3):
+        cache.put(make_principal(f"user{i}@gmail.com", f"USER-AA-{i:08}"))
+    assert cache.get("user0@gmail.com") is None
+    assert cache.get("user2@gmail.com") is not None
+
+
+@pytest.mark.anyio
+async def test_authenticated_requests_reuse_principal(
+    auth_client, mock_book, monkeypatch
+):
+    lookup = crud.get_user_by_email
+    calls = []
+
+    async def counting_lookup(db, email):
+        calls.append(email)
+        return await lookup(db, email)
+
+    monkeypatch.setattr(crud, "get_user_by_email", counting_lookup)
+    for _ in range(3):
+        response = await auth_client.get(
+            f"{auth_client.base_url}/books/fetch?isbn={mock_book.isbn}"
+        )
+        assert response.status_code == 200
+    assert len(calls) == 1
+    assert principal_cache.stats["hits"] >= 2
+
+
+@pytest.mark.anyio
+async def test_update_user_invalidates_principal(
+    auth_client, mock_book, mock_user, test_session
+):
+    response = await auth_client.get(
+        f"{auth_client.base_url}/books/fetch?isbn={mock_book.isbn}"
+    )
+    assert response.status_code == 200
+    assert principal_cache.get(mock_user.email).is_active
+
+    await crud.update_user(test_session, mock_user, {"is_active": False})
+    # invalidated on commit, a request before it could cache the old row again
+    assert principal_cache.get(mock_user.email).is_active
+    await test_session.commit()
+    assert principal_cache.get(mock_user.email) is None
+    response = await auth_client.get(
+        f"{auth_client.base_url}/books/fetch?isbn={mock_book.isbn}"
+    )
+    assert response.status_code == 400
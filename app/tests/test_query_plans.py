@@ -0,0 +1,208 @@
+"""
+Every hot crud query must be served by an index. Each case runs a crud
+function against the test database, records the statements it sends and
+asks the database for their plans; a full scan of any table fails the test.
+"""
+
+import json
+import re
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+
+from app import crud
+from app.core.database import Base
+from app.models import BkCopyStatus, LoanStatus
+from app.tests.conftest import test_engine
+from app.utils import loan_return_time
+
+# SQLite reports a full scan as `SCAN <table>`, an index walk as
+# `SCAN <table> USING [COVERING] INDEX ...` and lookups as `SEARCH ...`;
+# scans of subquery results and temp b-trees are not table scans
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+async def full_scans(session, statement: str, parameters) -> set:
+    """Tables the database would read in full to run `statement`."""
+    if isinstance(parameters, list):  # executemany
+        parameters = parameters[0]
+    connection = await session.connection()
+    if connection.dialect.name == "postgresql":
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        )
+        plan = result.scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return set(_seq_scans(plan[0]["Plan"]))
+    result = await connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {statement}", parameters
+    )
+    scans = set()
+    for row in result.all():
+        match = SQLITE_FULL_SCAN.match(row[-1])
+        if match and match.group(1) in Base.metadata.tables:
+            scans.add(match.group(1))
+    return scans
+
+
+def _seq_scans(node):
+    if node.get("Node Type") == "Seq Scan":
+        yield node["Relation Name"]
+    for child in node.get("Plans", []):
+        yield from _seq_scans(child)
+
+
+@pytest.fixture(scope="function")
+def statements():
+    # (statement, parameters) sent while the crud function runs
+    sent = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            sent.append((statement, parameters))
+
+    event.listen(
+        test_engine.sync_engine, "before_cursor_execute", before_cursor_execute
+    )
+    yield sent
+    event.remove(
+        test_engine.sync_engine, "before_cursor_execute", before_cursor_execute
+    )
+
+
+@pytest.fixture(scope="function")
+async def plan_data(test_session, mock_book_copies, mock_user):
+    isbn, copies = mock_book_copies
+    loan = await crud.create_loan(
+        test_session,
+        {"user_uid": mock_user.user_uid, "bk_copy_barcode": copies[0].copy_barcode},
+    )
+    await test_session.commit()
+    return {
+        "isbn": isbn,
+        "barcodes": [copy.copy_barcode for copy in copies],
+        "user_uid": mock_user.user_uid,
+        "email": mock_user.email,
+        "loan": loan,
+    }
+
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+# crud calls on the paths that run per request or per batch item
+HOT_QUERIES = {
+    "get_book_by_isbn": lambda db, d: crud.get_book_by_isbn(db, d["isbn"]),
+    "get_bk_copy_by_barcode": lambda db, d: crud.get_bk_copy_by_barcode(
+        db, d["barcodes"][1]
+    ),
+    "get_book_copy_by_barcode": lambda db, d: crud.get_book_copy_by_barcode(
+        db, d["barcodes"][1]
+    ),
+    "get_loan_eligibility": lambda db, d: crud.get_loan_eligibility(db, d["user_uid"]),
+    "get_checkout_context": lambda db, d: crud.get_checkout_context(
+        db, d["isbn"], d["user_uid"]
+    ),
+    "get_user_active_loans": lambda db, d: crud.get_user_active_loans(
+        db, d["user_uid"]
+    ),
+    "get_active_schedules": lambda db, d: crud.get_active_schedules(
+        db, d["user_uid"], [d["isbn"]], d["barcodes"][:2]
+    ),
+    "consume_schedules": lambda db, d: crud.consume_schedules(db, [1, 2]),
+    "expire_schedules": lambda db, d: crud.expire_schedules(db, NOW, 100),
+    "release_reserved_copies": lambda db, d: crud.release_reserved_copies(
+        db, d["barcodes"][:2]
+    ),
+    "claim_book_copy_by_isbn": lambda db, d: crud.claim_book_copy(
+        db, BkCopyStatus.BORROWED, isbn=d["isbn"]
+    ),
+    "claim_book_copy_by_barcode": lambda db, d: crud.claim_book_copy(
+        db, BkCopyStatus.BORROWED, barcode=d["barcodes"][2]
+    ),
+    "claim_book_copies": lambda db, d: crud.claim_book_copies(
+        db, BkCopyStatus.BORROWED, {d["isbn"]: 2}
+    ),
+    "claim_book_copies_by_barcode": lambda db, d: crud.claim_book_copies_by_barcode(
+        db, BkCopyStatus.BORROWED, {BkCopyStatus.AVAILABLE: d["barcodes"][1:3]}
+    ),
+    "shift_copy_counters": lambda db, d: crud.shift_copy_counters(
+        db, d["isbn"], BkCopyStatus.AVAILABLE, BkCopyStatus.BORROWED
+    ),
+    "recount_copy_counters": lambda db, d: crud.recount_copy_counters(db, [d["isbn"]]),
+    "reserve_copy_serials": lambda db, d: crud.reserve_copy_serials(db, d["isbn"], 10),
+    "set_bk_copies_status": lambda db, d: crud.set_bk_copies_status(
+        db, BkCopyStatus.DAMAGED, d["barcodes"][3:]
+    ),
+    "get_loan_by_id": lambda db, d: crud.get_loan_by_id(db, d["loan"].loan_id),
+    "get_loans_for_return": lambda db, d: crud.get_loans_for_return(
+        db, [d["loan"].loan_id]
+    ),
+    "check_in_book_copies": lambda db, d: crud.check_in_book_copies(
+        db, d["barcodes"][:1]
+    ),
+    "close_loans": lambda db, d: crud.close_loans(
+        db, [d["loan"].loan_id], LoanStatus.RETURNED, NOW
+    ),
+    "get_overdue_loans": lambda db, d: crud.get_overdue_loans(
+        db, loan_return_time(), 100, (NOW, 0)
+    ),
+    "set_accrued_fines": lambda db, d: crud.set_accrued_fines(db, {d["loan"].id: 100}),
+    "add_user_fines": lambda db, d: crud.add_user_fines(db, {d["user_uid"]: 100}),
+    "get_user_by_email": lambda db, d: crud.get_user_by_email(db, d["email"]),
+    "get_user_by_uid": lambda db, d: crud.get_user_by_uid(db, d["user_uid"]),
+    "stream_export": lambda db, d: _drain(
+        crud.stream_export(db, "audit", 10, since=NOW)
+    ),
+}
+
+
+async def _drain(rows):
+    return [row async for row in rows]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+async def test_hot_query_uses_index(name, test_session, plan_data, statements):
+    statements.clear()
+    await HOT_QUERIES[name](test_session, plan_data)
+    assert statements, f"{name} sent no statements"
+
+    for statement, parameters in list(statements):
+        scans = await full_scans(test_session, statement, parameters)
+        assert not scans, f"{name} scans {sorted(scans)}:\n{statement}"
+
+
+# composite indexes the planner should pick over their single column prefixes
+EXPECTED_INDEXES = {
+    "get_checkout_context": [
+        "ix_loans_user_uid_status",
+        "ix_bk_copy_schedules_user_uid_status",
+    ],
+    "get_user_active_loans": ["ix_loans_user_uid_status"],
+    "claim_book_copy_by_isbn": ["ix_book_copies_isbn_status"],
+    "claim_book_copies": ["ix_book_copies_isbn_status"],
+    "get_overdue_loans": ["ix_loans_status_due_at"],
+    "expire_schedules": ["ix_bk_copy_schedules_status_created_at"],
+}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", list(EXPECTED_INDEXES))
+async def test_hot_query_uses_composite_index(
+    name, test_session, plan_data, statements
+):
+    connection = await test_session.connection()
+    if connection.dialect.name != "sqlite":
+        pytest.skip("index names are read from the SQLite plan")
+    statements.clear()
+    await HOT_QUERIES[name](test_session, plan_data)
+
+    plan = []
+    for statement, parameters in list(statements):
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plan += [row[-1] for row in result.all()]
+    for index in EXPECTED_INDEXES[name]:
+        assert any(index in step for step in plan), f"{name} skips {index}"
@@ -0,0 +1,121 @@
+import asyncio
+import inspect
+
+import pytest
+from sqlalchemy import text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import crud
+from app.core import database
+from app.core.auth import get_current_user
+from app.core.database import (
+    Base,
+    PrimarySession,
+    get_session,
+    read_sessionmaker,
+)
+from app.models import Book
+
+
+@pytest.fixture(scope="function")
+async def databases(tmp_path):
+    # two SQLite files stand in for the primary and a (lagging) replica
+    engines = {}
+    for name in ("primary", "replica"):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            session.add(
+                Book(title=f"{name} book", author="a", location="a1", isbn=name)
+            )
+            await session.commit()
+        engines[name] = engine
+    primary_sessions = async_sessionmaker(
+        engines["primary"], sync_session_class=PrimarySession, expire_on_commit=False
+    )
+    read_sessions = read_sessionmaker(engines["primary"], engines["replica"])
+    yield primary_sessions, read_sessions
+    for engine in engines.values():
+        await engine.dispose()
+
+
+async def in_request(fn):
+    # every request runs in a task of its own, with a fresh context
+    return await asyncio.create_task(fn())
+
+
+@pytest.mark.anyio
+async def test_reads_go_to_the_replica(databases):
+    _, read_sessions = databases
+
+    async def request():
+        async with read_sessions() as db:
+            return (
+                await crud.get_book_by_isbn(db, "replica"),
+                await crud.get_book_by_isbn(db, "primary"),
+            )
+
+    on_replica, on_primary = await in_request(request)
+    assert on_replica is not None and on_primary is None
+
+
+@pytest.mark.anyio
+async def test_reads_after_a_write_go_to_the_primary(databases):
+    primary_sessions, read_sessions = databases
+
+    async def request():
+        async with primary_sessions() as db:
+            await db.execute(
+                update(Book).where(Book.isbn == "primary").values(location="b2")
+            )
+            await db.commit()
+        async with read_sessions() as db:
+            return await crud.get_book_by_isbn(db, "primary")
+
+    book = await in_request(request)
+    assert book is not None and book.location == "b2"
+
+    # the next request reads from the replica again
+    async def next_request():
+        async with read_sessions() as db:
+            return await crud.get_book_by_isbn(db, "primary")
+
+    assert await in_request(next_request) is None
+
+
+@pytest.mark.anyio
+async def test_writes_through_a_read_session_go_to_the_primary(databases):
+    primary_sessions, read_sessions = databases
+
+    async def request():
+        async with read_sessions() as db:
+            db.add(Book(title="new", author="a", location="a1", isbn="new"))
+            await db.commit()
+
+    await in_request(request)
+    async with primary_sessions() as db:
+        assert await crud.get_book_by_isbn(db, "new") is not None
+
+
+def test_principals_are_read_from_the_primary():
+    # a principal cached from a lagging replica would outlive its invalidation
+    db = inspect.signature(get_current_user).parameters["db"].default
+    assert db.dependency is get_session
+
+
+@pytest.mark.anyio
+async def test_dispose_engines_closes_the_replica_pool(monkeypatch, tmp_path):
+    engines = {
+        name: create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        for name in ("primary", "replica")
+    }
+    monkeypatch.setattr(database, "engine", engines["primary"])
+    monkeypatch.setattr(database, "replica_engine", engines["replica"])
+    for engine in engines.values():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        assert engine.pool.checkedin() == 1
+
+    await database.dispose_engines()
+    assert [engine.pool.checkedin() for engine in engines.values()] == [0, 0]
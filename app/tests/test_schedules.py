@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import Request
+from sqlalchemy import select, update
+
+from app import crud, services
+from app.core.principals import Principal
+from app.models import BkCopySchedule, BkCopyStatus, BookCopy, ScheduleStatus
+from app.schedules import ScheduleExpirer
+
+
+async def make_schedules(session, isbn, user, count: int):
+    request = Request({"type": "http"})
+    schedules = []
+    for _ in range(count):
+        response = await services.schedule_book_copy_service(
+            request, session, isbn, Principal.from_user(user)
+        )
+        schedules.append(response["schedule_info"])
+    return schedules
+
+
+async def backdate(session, schedules, hours: float):
+    created_at = datetime.now(timezone.utc) - timedelta(hours=hours)
+    await session.execute(
+        update(BkCopySchedule)
+        .where(BkCopySchedule.id.in_([s.id for s in schedules]))
+        .values(created_at=created_at)
+    )
+    await session.commit()
+
+
+@pytest.mark.anyio
+async def test_expire_overdue_schedules(
+    test_session, session_factory, mock_book_copies, mock_user
+):
+    isbn, _ = mock_book_copies
+    schedules = await make_schedules(test_session, isbn, mock_user, 4)
+    overdue, recent = schedules[:3], schedules[3]
+    await backdate(test_session, overdue, 9)
+
+    expirer = ScheduleExpirer(session_factory, hold_hours=8, batch_size=2)
+    assert await expirer.run_once() == 3
+    assert expirer.stats == {"runs": 1, "expired": 3, "released": 3, "failed": 0}
+
+    result = await test_session.execute(
+        select(BkCopySchedule.id, BkCopySchedule.status).execution_options(
+            populate_existing=True
+        )
+    )
+    statuses = dict(result.all())
+    assert [statuses[s.id] for s in overdue] == [ScheduleStatus.EXPIRED] * 3
+    assert statuses[recent.id] == ScheduleStatus.ACTIVE
+
+    result = await test_session.execute(select(BookCopy.copy_barcode, BookCopy.status))
+    copies = dict(result.all())
+    assert copies[recent.bk_copy_barcode] == BkCopyStatus.RESERVED
+    assert [copies[s.bk_copy_barcode] for s in overdue] == [BkCopyStatus.AVAILABLE] * 3
+
+    book = await crud.get_book_by_isbn(test_session, isbn)
+    await test_session.refresh(book)
+    assert (book.copies_available, book.copies_reserved) == (4, 1)
+    # nothing left to expire
+    assert await expirer.run_once() == 0
+
+
+@pytest.mark.anyio
+async def test_expiry_skips_consumed_schedules(
+    test_session, session_factory, mock_book_copies, mock_user
+):
+    isbn, _ = mock_book_copies
+    (schedule,) = await make_schedules(test_session, isbn, mock_user, 1)
+    loan_info = await services.loan_book_service(
+        Request({"type": "http"}), test_session, isbn, mock_user.user_uid
+    )
+    assert loan_info["was_scheduled"]
+    await backdate(test_session, [schedule], 24)
+
+    expirer = ScheduleExpirer(session_factory, hold_hours=8)
+    assert await expirer.run_once() == 0
+    copy = await crud.get_book_copy_by_barcode(test_session, schedule.bk_copy_barcode)
+    await test_session.refresh(copy)
+    assert copy.status == BkCopyStatus.BORROWED
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+import pytest
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+from app.core import auth
+from app.core.auth import TokenCache, create_access_token, token_cache, verify_token
+from app.models import User
+
+
+def make_token(minutes: int = 15):
+    user = User(email="mock@gmail.com", user_uid="USER-AA-00000000")
+    data = {"sub": user.email, "user_uid": user.user_uid}
+    return create_access_token(data, user, timedelta(minutes=minutes))
+
+
+def test_verified_token_is_cached(monkeypatch):
+    token = make_token()
+    decode = auth.jwt.decode
+    calls = []
+
+    def counting_decode(*args, **kwargs):
+        calls.append(1)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", counting_decode)
+    assert verify_token(token)["sub"] == "mock@gmail.com"
+    assert verify_token(token)["sub"] == "mock@gmail.com"
+    assert len(calls) == 1
+
+
+def test_scope_shares_the_decode():
+    token = make_token()
+    scope = {}
+    payload = verify_token(token, False, scope)
+    assert scope["state"]["verified_token"] == (token, payload)
+    token_cache.clear()
+    assert verify_token(token, scope=scope) is payload
+
+
+def test_expired_token_is_rejected_even_when_cached():
+    token = make_token(minutes=-1)
+    # the middleware reads claims without checking expiry
+    assert verify_token(token, False)["sub"] == "mock@gmail.com"
+    with pytest.raises(ExpiredSignatureError):
+        verify_token(token)
+
+
+def test_tampered_token_is_not_cached():
+    token = make_token()
+    header, payload, signature = token.split(".")
+    with pytest.raises(JWTError):
+        verify_token(f"{header}.{payload}.{signature[::-1]}")
+    assert token_cache.get(TokenCache.key(token)) is None
+
+
+def test_cache_is_bounded():
+    cache = TokenCache(maxsize=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, {"sub": key})
+    assert cache.get("a") is None
+    assert cache.get("c") == {"sub": "c"}
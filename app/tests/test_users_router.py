@@ -1,5 +1,9 @@
+import json
+
 import pytest
 
+from app.models import User
+
 @pytest.mark.anyio
 async def test_signup(client):
     form_data = {
@@ -24,4 +28,61 @@ async def test_login(client, mock_user):
     assert response.status_code == 200
     data = response.json()
     token = data['access_token']
-    assert isinstance(token, str)
\ No newline at end of file
+    assert isinstance(token, str)
+
+@pytest.fixture(scope='function')
+async def mock_patrons(test_session):
+    patrons = [
+        User(
+            full_name=f'Patron {i}',
+            email=f'patron{i}@gmail.com',
+            password='patron123',
+            fine_balance=100 if i % 3 == 0 else 0,
+            is_active=i != 4
+        )
+        for i in range(6)
+    ]
+    test_session.add_all(patrons)
+    await test_session.flush()
+    return patrons
+
+@pytest.mark.anyio
+async def test_list_users_pagination(admin_auth_client, mock_patrons):
+    emails = []
+    cursor = 0
+    while cursor is not None:
+        response = await admin_auth_client.get(
+            f'{admin_auth_client.base_url}/users', params={'cursor': cursor, 'limit': 4}
+            )
+        assert response.status_code == 200
+        data = response.json()
+        emails.extend(user['email'] for user in data['users'])
+        cursor = data['next_cursor']
+    # staff users are never listed
+    assert emails == [patron.email for patron in mock_patrons]
+
+@pytest.mark.anyio
+async def test_list_users_filters(admin_auth_client, mock_patrons):
+    params = {'has_fines': True, 'is_active': True}
+    response = await admin_auth_client.get(
+        f'{admin_auth_client.base_url}/users', params=params
+        )
+    assert response.status_code == 200
+    emails = [user['email'] for user in response.json()['users']]
+    assert emails == ['patron0@gmail.com', 'patron3@gmail.com']
+
+@pytest.mark.anyio
+async def test_list_users_ndjson(admin_auth_client, mock_patrons):
+    response = await admin_auth_client.get(
+        f'{admin_auth_client.base_url}/users',
+        params={'format': 'ndjson', 'is_active': False}
+        )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row['email'] for row in rows] == ['patron4@gmail.com']
+    assert 'password' not in rows[0]
+
+@pytest.mark.anyio
+async def test_list_users_requires_staff(auth_client):
+    response = await auth_client.get(f'{auth_client.base_url}/users')
+    assert response.status_code == 403
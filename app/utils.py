@@ -1,6 +1,7 @@
-import string, enum, secrets
+import string, enum, secrets, json, re, csv, io, zlib
 from logging import Logger
 from datetime import datetime, timezone, timedelta
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Mapping
 from fastapi import Request
 
 logger = Logger(__name__)
@@ -27,6 +28,15 @@ def generate_book_copy_barcode(base_barcode, serial):
     except ValueError as e:
         logger.warning(f'ValueError: {e}')
 
+def generate_book_copy_barcodes(base_barcode: str, first_serial: int, count: int):
+    '''
+    Barcodes of `count` consecutive copies starting at `first_serial`,
+    see generate_book_copy_barcode
+    '''
+    prefix = f'COPY-{base_barcode}-'
+    serials = range(first_serial, first_serial + count)
+    return [f'{prefix}{serial:03}' for serial in serials]
+
 def generate_barcode(serial: str | None = None):
     digits = string.digits
     serial = ''.join([secrets.choice(digits) for _ in range(7)])
@@ -63,9 +73,31 @@ def generate_schedule_id():
     id = generate_random_id()
     return f'SC-{id}'
 
+def search_terms(query: str):
+    '''
+    Splits a free text query into lowercase word terms safe to put in a
+    full-text match
+    '''
+    return re.findall(r'\w+', query.lower())[:10]
+
 def default_loan_due_date():
     return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(days=7)
 
+FINE_PER_DAY = 100
+
+def loan_return_time():
+    return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+def compute_loan_fine(returned_at: datetime, due_at: datetime):
+    '''
+    Returns (is_late, days_late, fine) for a loan due at `due_at` returned
+    at `returned_at`
+    '''
+    if not safe_datetime_compare(returned_at, due_at):
+        return False, 0, 0
+    days_late = (returned_at.date() - due_at.date()).days
+    return True, days_late, FINE_PER_DAY * days_late
+
 def reraise_exceptions(request: Request):
     if hasattr(request.state, 'exceptions'):
         exc: list | None = getattr(request.state, 'exceptions')
@@ -85,4 +117,84 @@ def map_bk_copy_status(value: str):
     elif value == 'damaged':
         return BkCopyStatus.DAMAGED
     else:
-        return BkCopyStatus.BORROWED
\ No newline at end of file
+        return BkCopyStatus.BORROWED
+
+async def ndjson_lines(rows: AsyncIterator[Mapping], batch_size: int = 500):
+    '''
+    Encodes rows as newline delimited JSON, yielding one chunk per
+    `batch_size` rows so memory stays flat for any result size.
+    '''
+    lines = []
+    async for row in rows:
+        lines.append(json.dumps(dict(row), default=str))
+        if len(lines) >= batch_size:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+async def csv_lines(
+    rows: AsyncIterator[Mapping], fieldnames: List[str], batch_size: int = 500
+):
+    '''
+    Encodes rows as CSV under a `fieldnames` header, written even when there
+    are no rows, yielding one chunk per `batch_size` rows, see ndjson_lines.
+    '''
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    count = 0
+    async for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count >= batch_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6):
+    '''Gzip compresses a stream of chunks as it goes'''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+async def ndjson_records(chunks: AsyncIterable[bytes]):
+    '''
+    Parses a streamed newline delimited JSON body one line at a time,
+    yielding (line_number, record) without buffering more than one line.
+    '''
+    buffer = b''
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, json.loads(line)
+    if buffer.strip():
+        yield line_number + 1, json.loads(buffer)
+
+async def chunked(items: Iterable | AsyncIterable, size: int):
+    '''Groups a sync or async iterable into lists of at most `size` items'''
+    chunk = []
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,112 @@
+"""
+Time and peak memory of exporting the audit table: loading every row with
+execute() and encoding the list (previous) against the streamed export of
+services.stream_export_service, as NDJSON, CSV and gzipped NDJSON.
+
+    python -m benchmarks.bench_audit_export [--rows 1000000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from fastapi import Request
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import services
+from app.core.database import Base
+from app.models import Audit, Event
+
+SEED_CHUNK = 50000
+
+
+async def seed(session_factory, rows: int):
+    start = datetime(2026, 1, 1)
+    details = json.dumps({"request_url": "http://test/books/", "status_code": 200})
+    async with session_factory() as session:
+        for offset in range(0, rows, SEED_CHUNK):
+            await session.execute(
+                insert(Audit),
+                [
+                    {
+                        "actor_id": f"USR-{i % 500}",
+                        "success": True,
+                        "event": Event.FETCH_BOOKS,
+                        "details": details,
+                        "audited_at": start + timedelta(seconds=i),
+                    }
+                    for i in range(offset, min(offset + SEED_CHUNK, rows))
+                ],
+            )
+        await session.commit()
+
+
+async def buffered(session, fmt: str, compress: bool):
+    # ndjson only, the whole body is built before the first byte could be sent
+    result = await session.execute(select(Audit.__table__).order_by(Audit.id))
+    rows = [dict(row) for row in result.mappings().all()]
+    for row in rows:
+        row["event"] = row["event"].value
+    body = "\n".join(json.dumps(row, default=str) for row in rows) + "\n"
+    return len(body.encode())
+
+
+async def streamed(session, fmt: str, compress: bool):
+    chunks = services.stream_export_service(
+        Request({"type": "http"}), session, "audit", fmt, compress, 0, None, None
+    )
+    # chunks are dropped once counted, as a response would send them
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+async def measure(session_factory, fn, fmt: str, compress: bool):
+    async with session_factory() as session:
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = await fn(session, fmt, compress)
+        elapsed = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024), size / (1024 * 1024)
+
+
+async def main(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_async_engine(url)
+        session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await seed(session_factory, rows)
+
+        print(f"{rows} audit rows")
+        print(f"{'path':<26}{'ms':>10}{'rows/s':>12}{'peak MB':>10}{'out MB':>10}")
+        paths = [
+            ("buffered ndjson (previous)", buffered, "ndjson", False),
+            ("streamed ndjson", streamed, "ndjson", False),
+            ("streamed csv", streamed, "csv", False),
+            ("streamed ndjson gzip", streamed, "ndjson", True),
+        ]
+        for name, fn, fmt, compress in paths:
+            elapsed, peak, size = await measure(session_factory, fn, fmt, compress)
+            rate = rows / (elapsed / 1000)
+            print(f"{name:<26}{elapsed:>10.1f}{rate:>12.0f}{peak:>10.1f}{size:>10.1f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows))
@@ -0,0 +1,97 @@
+"""
+Per-request overhead and peak memory of the audit middleware for large
+multipart uploads, against the previous BaseHTTPMiddleware implementation
+(reproduced below as LegacyAuditMiddleware).
+
+    python -m benchmarks.bench_audit_middleware [--size-mb 20] [--requests 10]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+
+from fastapi import FastAPI, UploadFile
+from httpx import ASGITransport, AsyncClient
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request as StarletteRequest
+
+from app.core import middleware
+from app.core.middleware import AuditMiddleware
+
+
+class LegacyAuditMiddleware(BaseHTTPMiddleware):
+    """The body handling of the old middleware: buffer, restore, re-parse."""
+
+    async def dispatch(self, request, call_next):
+        body = await request.body()
+
+        async def _receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request._receive = _receive
+        content_type = (request.headers.get("content-type") or "").lower()
+        if "multipart/form-data" in content_type:
+            temp_req = StarletteRequest(dict(request.scope), _receive)
+            form = await temp_req.form()
+            _ = dict(form.multi_items())
+        return await call_next(request)
+
+
+def build_app(middleware_class=None) -> FastAPI:
+    app = FastAPI()
+    if middleware_class:
+        app.add_middleware(middleware_class)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile):
+        size = 0
+        while chunk := await file.read(1024 * 1024):
+            size += len(chunk)
+        return {"size": size}
+
+    return app
+
+
+async def run(app: FastAPI, payload: bytes, requests: int):
+    files = {"file": ("payload.bin", payload)}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as ac:
+        await ac.post("/upload", files=files)  # warm up
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = await ac.post("/upload", files=files)
+            assert response.json()["size"] == len(payload)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed / requests * 1000, (peak - baseline) / (1024 * 1024)
+
+
+async def main(size_mb: int, requests: int):
+    async def discard(entry: dict):
+        return True
+
+    middleware.audit_writer.submit = discard
+    logging.getLogger(middleware.__name__).setLevel(logging.ERROR)
+    payload = b"0" * (size_mb * 1024 * 1024)
+    print(f"{requests} multipart uploads of {size_mb} MB")
+    print(f"{'middleware':<22}{'ms/request':>12}{'peak MB':>10}")
+    for name, middleware_class in [
+        ("none", None),
+        ("legacy (buffering)", LegacyAuditMiddleware),
+        ("AuditMiddleware", AuditMiddleware),
+    ]:
+        latency, peak = await run(build_app(middleware_class), payload, requests)
+        print(f"{name:<22}{latency:>12.2f}{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.size_mb, args.requests))
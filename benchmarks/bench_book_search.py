@@ -0,0 +1,93 @@
+"""
+Title/author search over a large catalogue: the full-text index behind
+/books/search against the LIKE '%x%' scan it replaces.
+
+    python -m benchmarks.bench_book_search [--books 1000000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import crud
+from app.core.database import Base
+from app.models import Book
+from app.utils import search_terms
+
+_rng = random.Random(3)
+WORDS = [
+    "".join(_rng.choices("abcdefghijklmnopqrstuvwxyz", k=_rng.randint(4, 9)))
+    for _ in range(20000)
+]
+QUERIES = [WORDS[1], f"{WORDS[2]} {WORDS[3][:3]}", WORDS[4][:4], "tolkien", "zzzz"]
+
+
+async def seed(session_factory, books: int):
+    rng = random.Random(7)
+    async with session_factory() as session:
+        for start in range(0, books, 20000):
+            rows = [
+                {
+                    "title": " ".join(rng.choices(WORDS, k=4)) + f" {i}",
+                    "author": f"author{i % 5000}" if i % 1000 else "tolkien",
+                    "isbn": f"978{i:010}",
+                    "library_barcode": f"BK-{i:09}",
+                    "location": "a1",
+                }
+                for i in range(start, min(start + 20000, books))
+            ]
+            await session.execute(insert(Book), rows)
+        await crud.rebuild_book_search_index(session)
+        await session.commit()
+
+
+async def like_scan(session, query: str):
+    conditions = [
+        or_(Book.title.like(f"%{term}%"), Book.author.like(f"%{term}%"))
+        for term in search_terms(query)
+    ]
+    stmt = select(*crud.BOOK_LIST_COLUMNS).where(*conditions).limit(20)
+    return (await session.execute(stmt)).all()
+
+
+async def fts(session, query: str):
+    return await crud.search_books(session, search_terms(query), 20, 0)
+
+
+async def main(books: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_async_engine(url)
+        session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        start = time.perf_counter()
+        await seed(session_factory, books)
+        elapsed = time.perf_counter() - start
+        print(f"seeded and indexed {books} titles in {elapsed:.1f}s")
+
+        print(f"{'query':<20}{'LIKE ms':>10}{'FTS ms':>10}")
+        async with session_factory() as session:
+            for query in QUERIES:
+                timings = []
+                for fn in (like_scan, fts):
+                    start = time.perf_counter()
+                    await fn(session, query)
+                    timings.append((time.perf_counter() - start) * 1000)
+                print(f"{query:<20}{timings[0]:>10.1f}{timings[1]:>10.1f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=1000000)
+    args = parser.parse_args()
+    asyncio.run(main(args.books))
@@ -0,0 +1,87 @@
+"""
+Time and peak memory of generating book copies: one BookCopy ORM object per
+copy with add_all + flush (previous) against the chunked Core insert of
+crud.insert_book_copies.
+
+    python -m benchmarks.bench_copy_generation [--sizes 10 1000 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import crud
+from app.core.database import Base
+from app.models import Book, BookCopy
+from app.utils import generate_book_copy_barcode
+
+
+async def orm_objects(session, book: Book, quantity: int):
+    copies = [
+        BookCopy(
+            book_isbn=book.isbn,
+            serial=serial,
+            copy_barcode=generate_book_copy_barcode(book.library_barcode, serial),
+        )
+        for serial in range(1, quantity + 1)
+    ]
+    session.add_all(copies)
+    await session.flush()
+
+
+async def core_insert(session, book: Book, quantity: int):
+    await crud.insert_book_copies(session, book.isbn, book.library_barcode, 1, quantity)
+
+
+async def measure(session_factory, fn, isbn: str, quantity: int):
+    async with session_factory() as session:
+        book = Book(title=f"title {isbn}", author="someone", location="a1", isbn=isbn)
+        session.add(book)
+        await session.flush()
+        tracemalloc.start()
+        start = time.perf_counter()
+        await fn(session, book, quantity)
+        await session.commit()
+        elapsed = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024)
+
+
+async def main(sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_async_engine(url)
+        session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        print(f"{'copies':>8}  {'path':<22}{'ms':>10}{'copies/s':>12}{'peak MB':>10}")
+        for quantity in sizes:
+            paths = [
+                ("orm objects (previous)", orm_objects),
+                ("core insert", core_insert),
+            ]
+            for name, fn in paths:
+                isbn = f"{name[:4]}-{quantity}"
+                elapsed, peak = await measure(session_factory, fn, isbn, quantity)
+                rate = quantity / (elapsed / 1000)
+                print(
+                    f"{quantity:>8}  {name:<22}"
+                    f"{elapsed:>10.1f}{rate:>12.0f}{peak:>10.1f}"
+                )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes))
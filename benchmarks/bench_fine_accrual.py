@@ -0,0 +1,100 @@
+"""
+Time of the nightly fine accrual (services.accrue_loan_fines_service) over a
+loans table where a share of the active loans is overdue: the first run, a
+rerun on the same day (nothing to charge) and a run one day later.
+
+    python -m benchmarks.bench_fine_accrual [--loans 1000000] [--users 10000]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import services
+from app.core.database import Base
+from app.models import Loan, LoanStatus, User
+from app.utils import loan_return_time
+
+SEED_CHUNK = 50000
+
+
+async def seed(session_factory, loans: int, users: int):
+    now = loan_return_time()
+    async with session_factory() as session:
+        await session.execute(
+            insert(User),
+            [
+                {
+                    "user_uid": f"USR-{i}",
+                    "full_name": f"user {i}",
+                    "email": f"user{i}@example.com",
+                    "password": "x",
+                }
+                for i in range(users)
+            ],
+        )
+        for offset in range(0, loans, SEED_CHUNK):
+            rows = []
+            for i in range(offset, min(offset + SEED_CHUNK, loans)):
+                # a tenth of the loans is still out, half of those overdue
+                active = i % 10 == 0
+                rows.append(
+                    {
+                        "loan_id": f"LN-{i}",
+                        "user_uid": f"USR-{i % users}",
+                        "bk_copy_barcode": f"COPY-{i}",
+                        "status": LoanStatus.ACTIVE if active else LoanStatus.RETURNED,
+                        "due_at": now + timedelta(days=(i // 10) % 20 - 10),
+                    }
+                )
+            await session.execute(insert(Loan), rows)
+        await session.commit()
+
+
+async def measure(session_factory, now):
+    async with session_factory() as session:
+        start = time.perf_counter()
+        totals = await services.accrue_loan_fines_service(session, now=now)
+        elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, totals
+
+
+async def main(loans: int, users: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_async_engine(url)
+        session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await seed(session_factory, loans, users)
+
+        now = loan_return_time()
+        print(f"{loans} loans, {users} users")
+        print(f"{'run':<22}{'ms':>10}{'loans':>10}{'users':>8}{'fines':>12}")
+        for name, at in [
+            ("first run", now),
+            ("rerun, same day", now),
+            ("next day", now + timedelta(days=1)),
+        ]:
+            elapsed, totals = await measure(session_factory, at)
+            print(
+                f"{name:<22}{elapsed:>10.1f}{totals['loans']:>10}"
+                f"{totals['users']:>8}{totals['fines']:>12}"
+            )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loans", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main(args.loans, args.users))
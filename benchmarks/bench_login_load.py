@@ -0,0 +1,111 @@
+"""
+Load test: latency of GET /books/fetch while POST /users/login is hammered.
+Runs once with hashing on the event loop (the previous behaviour) and once
+offloaded to the hash executor, against a temporary SQLite database.
+
+    python -m benchmarks.bench_login_load [--seconds 5] [--logins 8]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core import auth
+from app.core.database import Base, get_session
+from app.main import app
+from app.models import Book, User
+
+
+async def seed(session_factory):
+    async with session_factory() as session:
+        session.add(
+            User(
+                full_name="Bench User",
+                email="bench@gmail.com",
+                password=auth.hash_password("benchuser123"),
+            )
+        )
+        session.add(Book(title="bench", author="bench", location="a1", isbn="1000"))
+        await session.commit()
+
+
+async def run(session_factory, seconds: float, logins: int):
+    async def override_get_session():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = override_get_session
+    credentials = {"email": "bench@gmail.com", "password": "benchuser123"}
+    latencies = []
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as ac:
+        response = await ac.post("/users/login", data=credentials)
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        deadline = time.perf_counter() + seconds
+
+        async def hammer():
+            while time.perf_counter() < deadline:
+                await ac.post("/users/login", data=credentials)
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await ac.get("/books/fetch?isbn=1000", headers=headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(probe(), *(hammer() for _ in range(logins)))
+    app.dependency_overrides.clear()
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(latencies), statistics.median(latencies), p99
+
+
+async def main(seconds: float, logins: int):
+    offloaded = (auth.hash_password_async, auth.verify_password_async)
+
+    async def inline_hash(password):
+        return auth.hash_password(password)
+
+    async def inline_verify(plain_password, hashed_password):
+        return auth.verify_password(plain_password, hashed_password)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}",
+            pool_size=logins + 4,
+        )
+        session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await seed(session_factory)
+
+        print(
+            f"/books/fetch latency with {logins} concurrent login loops "
+            f"for {seconds}s"
+        )
+        print(f"{'hashing':<12}{'samples':>9}{'p50 ms':>10}{'p99 ms':>10}")
+        paths = [("inline", (inline_hash, inline_verify)), ("offloaded", offloaded)]
+        for name, hashers in paths:
+            auth.hash_password_async, auth.verify_password_async = hashers
+            samples, p50, p99 = await run(session_factory, seconds, logins)
+            print(f"{name:<12}{samples:>9}{p50:>10.1f}{p99:>10.1f}")
+        auth.hash_password_async, auth.verify_password_async = offloaded
+        auth.shutdown_hash_executor()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--logins", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds, args.logins))
@@ -0,0 +1,73 @@
+"""
+Token decode cost per authenticated request: the previous path (two full
+python-jose decodes, one in the audit middleware and one in get_current_user)
+against verify_token, which shares one decode through the request scope and
+token_cache.
+
+    python -m benchmarks.bench_token_decode [--requests 20000] [--users 100]
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+from jose import jwt
+
+from app.core.auth import (
+    JWT_ALGORITHM,
+    SECRET_KEY,
+    create_access_token,
+    token_cache,
+    verify_token,
+)
+from app.models import User
+
+
+def make_tokens(users: int):
+    tokens = []
+    for i in range(users):
+        user = User(email=f"user{i}@gmail.com", user_uid=f"USER-AA-{i:08}")
+        data = {"sub": user.email, "user_uid": user.user_uid, "is_staff": False}
+        tokens.append(create_access_token(data, user, timedelta(minutes=15)))
+    return tokens
+
+
+def before(token: str):
+    jwt.decode(
+        token, SECRET_KEY, algorithms=[JWT_ALGORITHM], options={"verify_exp": False}
+    )
+    jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
+
+
+def after(token: str):
+    scope = {}
+    verify_token(token, False, scope)
+    verify_token(token, scope=scope)
+
+
+def bench(fn, tokens, requests: int):
+    start = time.perf_counter()
+    for i in range(requests):
+        fn(tokens[i % len(tokens)])
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+def main(requests: int, users: int):
+    tokens = make_tokens(users)
+    token_cache.clear()
+    print(f"{requests} requests spread over {users} tokens")
+    for name, decode in [
+        ("before (2 decodes/request)", before),
+        ("after  (shared + cached)", after),
+    ]:
+        label = f"{name}:"
+        print(f"{label:<27}{bench(decode, tokens, requests):8.1f} us/request")
+    print(f"token_cache: {token_cache.stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+    main(args.requests, args.users)
@@ -0,0 +1,97 @@
+"""
+Memory and latency of listing patrons: the previous full load of every
+non-staff User entity against one keyset page and the NDJSON export.
+
+    python -m benchmarks.bench_users_listing [--users 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import crud
+from app.core.database import Base
+from app.models import User
+from app.schemas.user import UserResponse
+from app.utils import ndjson_lines
+
+
+async def seed(session_factory, users: int):
+    async with session_factory() as session:
+        rows = [
+            {
+                "full_name": f"Patron {i}",
+                "email": f"patron{i}@gmail.com",
+                "password": "x",
+                "user_uid": f"USER-AA-{i:08}",
+                "card_number": f"LB-AA-{i:08}",
+            }
+            for i in range(users)
+        ]
+        for i in range(0, users, 10000):
+            await session.execute(insert(User), rows[i : i + 10000])
+        await session.commit()
+
+
+async def full_load(session):
+    stmt = select(User).where(~User.is_staff, ~User.is_superuser)
+    users = (await session.execute(stmt)).scalars().all()
+    return len([UserResponse.model_validate(user) for user in users])
+
+
+async def one_page(session):
+    return len(await crud.get_non_staff_users_page(session, 0, 50))
+
+
+async def ndjson_export(session):
+    size = 0
+    async for chunk in ndjson_lines(crud.stream_non_staff_users(session)):
+        size += len(chunk)
+    return size
+
+
+async def measure(session_factory, fn):
+    async with session_factory() as session:
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = await fn(session)
+        elapsed = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+async def main(users: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_async_engine(url)
+        session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await seed(session_factory, users)
+
+        print(f"{users} patrons")
+        print(f"{'listing':<28}{'ms':>10}{'peak MB':>10}")
+        for name, fn in [
+            ("full load (previous)", full_load),
+            ("keyset page of 50", one_page),
+            ("ndjson export (all rows)", ndjson_export),
+        ]:
+            _, elapsed, peak = await measure(session_factory, fn)
+            print(f"{name:<28}{elapsed:>10.1f}{peak:>10.1f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(main(args.users))